@@ -18,7 +18,8 @@ import json
 from src.config import Config
 from src.Scanner import fetch_arbitrage_candidates, parse_market_metadata
 from src.Monitor import OrderBookMonitor
-from src.Executor import execute_arbitrage
+from src.MarketIndex import MarketIndex
+from src.Executor import execute_arbitrage, get_execution_loop, shutdown_execution_loop
 
 
 class ArbitrageSystem:
@@ -26,8 +27,9 @@ class ArbitrageSystem:
 
     def __init__(self):
         """初始化系统"""
-        self.market_tokens: Dict[str, Dict] = {}
+        self.market_index = MarketIndex()  # 市场<->代币双向索引，监控器和执行器共用
         self.monitor: OrderBookMonitor = None
+        self.executing = set()  # 下单尚未完成的market_id，避免同一机会重复下单
         self.running = False
 
         print("=" * 60)
@@ -49,7 +51,7 @@ class ArbitrageSystem:
                 print("⚠️  未发现任何活跃市场")
                 return False
 
-            # 解析市场元数据并构建token映射
+            # 解析市场元数据并构建市场<->代币索引
             print("\n🔍 正在解析市场数据...")
             for market in markets:
                 try:
@@ -61,17 +63,15 @@ class ArbitrageSystem:
                         market_id = metadata.get("condition_id", "unknown")
                         question = metadata.get("question", "Unknown")
 
-                        # 构建映射：token_id -> (market_id, side)
-                        self.market_tokens[token_ids[0]] = {
-                            "market_id": market_id,
-                            "side": "Yes",
-                            "question": question
-                        }
-                        self.market_tokens[token_ids[1]] = {
-                            "market_id": market_id,
-                            "side": "No",
-                            "question": question
-                        }
+                        # market_id -> (Yes, No, tick_size, neg_risk)，token_id -> (market_id, side)
+                        self.market_index.add(
+                            market_id,
+                            token_ids[0],
+                            token_ids[1],
+                            tick_size=metadata.get("tick_size"),
+                            neg_risk=metadata.get("neg_risk", False),
+                            question=question
+                        )
 
                         print(f"  • 市场: {question[:50]}...")
                         print(f"    Token IDs: {token_ids[0]}, {token_ids[1]}")
@@ -80,8 +80,8 @@ class ArbitrageSystem:
                     print(f"⚠️  解析市场时出错: {e}")
                     continue
 
-            print(f"\n✅ 成功准备 {len(self.market_tokens)} 个代币进行监控")
-            return len(self.market_tokens) > 0
+            print(f"\n✅ 成功准备 {len(self.market_index)} 个代币进行监控")
+            return len(self.market_index) > 0
 
         except Exception as e:
             print(f"❌ 扫描市场失败: {e}")
@@ -89,21 +89,24 @@ class ArbitrageSystem:
 
     def start_monitoring(self):
         """启动订单簿监控"""
-        if not self.market_tokens:
+        if not self.market_index:
             print("⚠️  没有可监控的市场")
             return False
 
         try:
             print(f"\n📡 启动WebSocket监控...")
-            print(f"   监控 {len(self.market_tokens)} 个代币")
+            print(f"   监控 {len(self.market_index)} 个代币")
 
             # 传递执行器函数到监控器
             self.monitor = OrderBookMonitor(
-                market_tokens=self.market_tokens,
+                market_index=self.market_index,
                 threshold=Config.ARBITRAGE_THRESHOLD,
                 executor_func=self.execute_arbitrage_opportunity
             )
 
+            # 在发现第一个机会之前建好下单客户端和事件循环
+            get_execution_loop()
+
             # 在独立线程中运行WebSocket
             self.running = True
             ws_thread = threading.Thread(target=self.monitor.start, daemon=True)
@@ -116,14 +119,17 @@ class ArbitrageSystem:
             print(f"❌ 启动监控失败: {e}")
             return False
 
-    def execute_arbitrage_opportunity(self, market_id: str, yes_price: float, no_price: float):
+    def execute_arbitrage_opportunity(self, market_id: str, yes_price: float, no_price: float, size: float = None):
         """
         执行套利交易
         参数:
             market_id: 市场ID
-            yes_price: Yes代币价格
-            no_price: No代币价格
+            yes_price: Yes代币限价
+            no_price: No代币限价
+            size: 按订单簿深度计算的可执行数量 (默认使用DEFAULT_ORDER_SIZE)
         """
+        if size is None:
+            size = Config.DEFAULT_ORDER_SIZE
         try:
             print(f"\n" + "!" * 60)
             print(f"🎯 检测到套利机会!")
@@ -131,39 +137,45 @@ class ArbitrageSystem:
             print(f"   Yes价格: {yes_price:.4f}")
             print(f"   No价格: {no_price:.4f}")
             print(f"   总成本: {yes_price + no_price:.4f}")
+            print(f"   可执行数量: {size:.2f}")
             print(f"   预期利润: {(1 - (yes_price + no_price)) * 100:.2f}%")
             print(f"!" * 60 + "\n")
 
-            # 获取对应的token IDs
-            token_yes = None
-            token_no = None
-            for token_id, info in self.market_tokens.items():
-                if info["market_id"] == market_id:
-                    if info["side"] == "Yes":
-                        token_yes = token_id
-                    elif info["side"] == "No":
-                        token_no = token_id
-
-            if token_yes and token_no:
-                # 执行并发下单
-                import asyncio
-                asyncio.run(execute_arbitrage(
-                    token_yes=token_yes,
-                    token_no=token_no,
+            # 从索引中直接取出对应的token IDs和下单参数
+            market = self.market_index.market(market_id)
+
+            if market is None:
+                print(f"⚠️  未找到对应的Token ID")
+            elif market_id in self.executing:
+                print(f"⏳ 该市场的上一笔套利仍在下单，跳过")
+            else:
+                # 投递到常驻下单事件循环后立即返回，监控线程继续处理行情
+                self.executing.add(market_id)
+                future = get_execution_loop().submit(execute_arbitrage(
+                    token_yes=market.yes_token,
+                    token_no=market.no_token,
                     price_yes=yes_price,
                     price_no=no_price,
-                    size=Config.DEFAULT_ORDER_SIZE
+                    size=size,
+                    tick_size=market.tick_size,
+                    neg_risk=market.neg_risk
                 ))
-            else:
-                print(f"⚠️  未找到对应的Token ID")
+                future.add_done_callback(lambda f: self._on_execution_done(market_id, f))
 
         except Exception as e:
             print(f"❌ 执行套利交易失败: {e}")
 
+    def _on_execution_done(self, market_id: str, future):
+        """一笔套利下单结束(成功或失败)后允许该市场再次下单"""
+        self.executing.discard(market_id)
+        if future.exception() is not None:
+            print(f"❌ 执行套利交易失败: {future.exception()}")
+
     def stop(self):
         """停止系统"""
         print("\n🛑 正在停止系统...")
         self.running = False
+        shutdown_execution_loop()
 
     def run(self):
         """运行系统主循环"""
@@ -188,26 +200,30 @@ class ArbitrageSystem:
             print("=" * 60 + "\n")
 
             # 保持主线程运行
-            try:
-                while self.running:
-                    import time
-                    time.sleep(1)
-            except KeyboardInterrupt:
-                self.stop()
-                print("\n👋 系统已安全退出")
-                return 0
+            while self.running:
+                import time
+                time.sleep(1)
+
+        except KeyboardInterrupt:
+            self.stop()
+            print("\n👋 系统已安全退出")
+            return 0
 
         except Exception as e:
             print(f"\n❌ 系统运行错误: {e}")
             return 1
 
+        finally:
+            # 任何退出路径都关闭下单事件循环和线程池(已关闭时为空操作)
+            shutdown_execution_loop()
+
         return 0
 
 
 def signal_handler(signum, frame):
-    """信号处理器 - 优雅退出"""
+    """信号处理器 - 优雅退出：SIGINT/SIGTERM都走与Ctrl+C相同的退出流程"""
     print("\n\n🛑 接收到退出信号...")
-    sys.exit(0)
+    raise KeyboardInterrupt
 
 
 def main():
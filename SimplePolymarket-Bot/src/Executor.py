@@ -1,41 +1,188 @@
 import os
+import time
 import asyncio # 引入异步库，更适合IO密集型的任务
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from py_clob_client import ClobClient
-from py_clob_client.clob_types import OrderArgs
+from py_clob_client.clob_types import OrderArgs, PartialCreateOrderOptions
+from .config import Config
 
 # 客户端初始化 - 延迟加载以避免在模块导入时执行
 _client = None
+_client_lock = threading.Lock()  # 两条腿同时签名时，避免重复创建客户端和API凭证
+_execution_loop = None
 
 def get_client():
     """获取或创建CLOB客户端实例"""
     global _client
     if _client is None:
-        key = os.getenv("PRIVATE_KEY")
-        chain_id = 137
-        host = "https://clob.polymarket.com"
+        with _client_lock:
+            if _client is None:
+                key = os.getenv("PRIVATE_KEY")
+                chain_id = 137
+                host = "https://clob.polymarket.com"
 
-        if not key:
-            raise ValueError("未设置PRIVATE_KEY环境变量")
+                if not key:
+                    raise ValueError("未设置PRIVATE_KEY环境变量")
 
-        _client = ClobClient(host, key=key, chain_id=chain_id, signature_type=1)
-        _client.set_api_creds(_client.create_or_derive_api_creds())
+                client = ClobClient(host, key=key, chain_id=chain_id, signature_type=1)
+                client.set_api_creds(client.create_or_derive_api_creds())
+                _client = client
 
     return _client
 
-async def place_order_safe(order_args):
+
+class SkewStats:
+    """
+    两条腿之间的时间差：
+    - send: 两个订单开始发送(post)的时间差
+    - ack: 两个订单收到回报的时间差
+    只保留最近window次，线程安全
+    """
+
+    STAGES = ("send", "ack")
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.samples = {stage: deque(maxlen=window) for stage in self.STAGES}
+
+    def record(self, res_yes, res_no):
+        """两边都拿到发送/回报时间时记录，返回 (发送偏差, 回报偏差) 纳秒"""
+        if "sent_ns" not in res_yes or "sent_ns" not in res_no:
+            return None
+        send = abs(res_yes["sent_ns"] - res_no["sent_ns"])
+        ack = abs(res_yes["done_ns"] - res_no["done_ns"])
+        with self.lock:
+            self.samples["send"].append(send)
+            self.samples["ack"].append(ack)
+        return send, ack
+
+    def snapshot(self):
+        """各项的 p50 / p99 / max (微秒)"""
+        with self.lock:
+            result = {"count": len(self.samples["send"])}
+            for stage, values in self.samples.items():
+                ordered = sorted(values)
+                if not ordered:
+                    continue
+                result[stage] = {
+                    "p50": ordered[len(ordered) // 2] / 1000,
+                    "p99": ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] / 1000,
+                    "max": ordered[-1] / 1000,
+                }
+            return result
+
+    def report(self):
+        stats = self.snapshot()
+        print(f"⏱️ 腿间偏差统计: {stats['count']} 次套利")
+        names = {"send": "发送偏差", "ack": "回报偏差"}
+        for stage in self.STAGES:
+            if stage in stats:
+                s = stats[stage]
+                print(f"   {names[stage]}: p50 {s['p50']:.0f}us, p99 {s['p99']:.0f}us, max {s['max']:.0f}us")
+
+
+leg_skew = SkewStats()  # 所有套利的腿间偏差
+
+
+class ExecutionLoop:
+    """
+    常驻的下单事件循环：在独立线程中一直运行，套利机会通过submit()投递进来
+    阻塞的签名/HTTP调用放到线程池中执行，两条腿各占一个线程，真正同时发出
+    """
+
+    def __init__(self, workers=None):
+        self.pool = ThreadPoolExecutor(max_workers=workers or Config.ORDER_WORKERS, thread_name_prefix="order")
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.pool)  # run_in_executor(None, ...) 使用该线程池
+        self.thread = threading.Thread(target=self._run, name="order-loop", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """从任意线程投递协程，立即返回concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        """停止事件循环并等待线程池中的下单请求完成"""
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.pool.shutdown(wait=True)
+
+
+def get_execution_loop():
+    """获取或创建常驻下单事件循环，创建前先建好CLOB客户端，下单时不再初始化"""
+    global _execution_loop
+    if _execution_loop is None:
+        get_client()
+        _execution_loop = ExecutionLoop()
+    return _execution_loop
+
+
+def shutdown_execution_loop():
+    """停止常驻下单事件循环并输出腿间偏差统计"""
+    global _execution_loop
+    if _execution_loop is not None:
+        _execution_loop.stop()
+        _execution_loop = None
+        leg_skew.report()
+
+
+def _sign_order(order_args, options):
+    return get_client().create_order(order_args, options)
+
+
+def _post_order(signed_order):
+    """在线程池中发送已签名的订单，记录开始发送和收到回报的时间"""
+    sent_ns = time.perf_counter_ns()
+    try:
+        resp = get_client().post_order(signed_order)
+        return {"status":"success", "resp":resp, "sent_ns":sent_ns, "done_ns":time.perf_counter_ns()}
+    except Exception as e:
+        return {"status":"failed", "error":str(e), "sent_ns":sent_ns, "done_ns":time.perf_counter_ns()}
+
+
+async def sign_order_safe(order_args, options=None):
     """
-    封装单个下单动作，增加异常捕获
+    在线程池中签名订单，返回 {"status", "order"} 或 {"status", "error"}
+    options: PartialCreateOrderOptions，提供tick_size/neg_risk时客户端不再逐单查询
     """
+    loop = asyncio.get_running_loop()
     try:
-        client = get_client()
-        resp = client.create_and_post_order(order_args)
-        return {"status":"success", "resp":resp}
+        signed = await loop.run_in_executor(None, _sign_order, order_args, options)
+        return {"status":"success", "order":signed}
     except Exception as e:
         return {"status":"failed", "error":str(e)}
-    
-async def execute_arbitrage(token_yes, token_no, price_yes, price_no, size):
+
+
+async def post_order_safe(signed_order):
+    """在线程池中发送已签名的订单，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _post_order, signed_order)
+
+
+async def place_order_safe(order_args, options=None):
+    """
+    封装单个下单动作(签名+发送)，增加异常捕获
+    options: PartialCreateOrderOptions，提供tick_size/neg_risk时客户端不再逐单查询
+    """
+    signed = await sign_order_safe(order_args, options)
+    if signed["status"] != "success":
+        return signed
+    return await post_order_safe(signed["order"])
+
+
+async def execute_arbitrage(token_yes, token_no, price_yes, price_no, size, tick_size=None, neg_risk=None):
     """
     并发下单+风险对冲检查
+    tick_size / neg_risk 来自扫描市场时建立的索引，同一市场的两个订单共用
     """
 
     print("发起并发套利: Yes@(price_yes), No@(price_no), Size:(size)")
@@ -55,16 +202,30 @@ async def execute_arbitrage(token_yes, token_no, price_yes, price_no, size):
         token_id=token_no
     )
 
-    # 使用asyncio.gather同时发出两个请求
-    # 这可以显著降低因为先后顺序导致的风险敞口
+    options = None
+    if tick_size is not None or neg_risk is not None:
+        options = PartialCreateOrderOptions(tick_size=tick_size, neg_risk=neg_risk)
+
+    # 第一步：先把两个订单都签好名；任何一边签名失败都不发送，不会产生单边敞口
+    signed_yes, signed_no = await asyncio.gather(
+        sign_order_safe(order_yes, options),
+        sign_order_safe(order_no, options),
+    )
+    if signed_yes["status"] != "success" or signed_no["status"] != "success":
+        error = signed_yes.get("error") or signed_no.get("error")
+        print(f"❌ 订单签名失败，未发送任何订单: {error}")
+        return False
 
-    results = await asyncio.gather(
-        place_order_safe(order_yes),
-        place_order_safe(order_no),
-        return_exceptions=True # 保证并发任务之间互不干扰 
+    # 第二步：两个已签名订单在线程池中同时发送
+    # 签名(CPU)不再夹在两次发送之间，这可以显著降低因为先后顺序导致的风险敞口
+    res_yes, res_no = await asyncio.gather(
+        post_order_safe(signed_yes["order"]),
+        post_order_safe(signed_no["order"]),
     )
 
-    res_yes, res_no = results
+    skew = leg_skew.record(res_yes, res_no)
+    if skew is not None:
+        print(f"⏱️ 腿间偏差: 发送 {skew[0] / 1000:.0f}us, 回报 {skew[1] / 1000:.0f}us")
 
     # --- 逻辑判定与风险处理 ---
     
@@ -93,8 +254,9 @@ async def execute_arbitrage(token_yes, token_no, price_yes, price_no, size):
 # 运行入口
 if __name__ == "__main__":
     # 模拟数据
-    asyncio.run(execute_arbitrage(
+    get_execution_loop().submit(execute_arbitrage(
         "TOKEN_YES_ID",
         "TOKEN_NO_ID",
         0.45, 0.53, 100
-    ))
\ No newline at end of file
+    )).result()
+    shutdown_execution_loop()
\ No newline at end of file
@@ -0,0 +1,72 @@
+from typing import NamedTuple, Optional
+
+
+class MarketEntry(NamedTuple):
+    """一个二元市场: Yes/No代币、最小价格单位、是否为负风险市场"""
+    yes_token: str
+    no_token: str
+    tick_size: Optional[str] = None
+    neg_risk: bool = False
+    question: Optional[str] = None
+
+
+class TokenEntry(NamedTuple):
+    """代币所属的市场及方向 ('Yes' / 'No')"""
+    market_id: str
+    side: str
+
+
+class MarketIndex:
+    """
+    市场 <-> 代币的双向索引，扫描市场时构建一次
+    监控器按代币查市场、执行器按市场查代币都是一次字典查找
+    """
+
+    def __init__(self):
+        self.markets = {}  # market_id -> MarketEntry
+        self.tokens = {}   # token_id -> TokenEntry
+
+    def __len__(self):
+        """代币数"""
+        return len(self.tokens)
+
+    def __contains__(self, token_id):
+        return token_id in self.tokens
+
+    def add(self, market_id, yes_token, no_token, tick_size=None, neg_risk=False, question=None):
+        old = self.markets.get(market_id)
+        if old is not None:
+            self.tokens.pop(old.yes_token, None)
+            self.tokens.pop(old.no_token, None)
+        self.markets[market_id] = MarketEntry(yes_token, no_token, tick_size, neg_risk, question)
+        self.tokens[yes_token] = TokenEntry(market_id, "Yes")
+        self.tokens[no_token] = TokenEntry(market_id, "No")
+
+    def market(self, market_id):
+        """market_id -> MarketEntry，不存在时返回None"""
+        return self.markets.get(market_id)
+
+    def token(self, token_id):
+        """token_id -> TokenEntry，不存在时返回None"""
+        return self.tokens.get(token_id)
+
+    def token_ids(self):
+        return list(self.tokens)
+
+    @classmethod
+    def from_token_map(cls, market_tokens):
+        """
+        从 {token_id: {"market_id": ..., "side": "Yes"/"No"}} 映射构建(示例和测试中使用)
+        缺少另一边代币的市场被忽略
+        """
+        sides = {}
+        for token_id, info in market_tokens.items():
+            sides.setdefault(info["market_id"], {})[info["side"]] = (token_id, info)
+        index = cls()
+        for market_id, pair in sides.items():
+            if "Yes" in pair and "No" in pair:
+                info = pair["Yes"][1]
+                index.add(market_id, pair["Yes"][0], pair["No"][0],
+                          tick_size=info.get("tick_size"), neg_risk=info.get("neg_risk", False),
+                          question=info.get("question"))
+        return index
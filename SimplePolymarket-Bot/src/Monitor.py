@@ -1,107 +1,292 @@
 import json
-import threading 
-from websocket import WebSocketApp
+import time
+import queue
+import threading
+from collections import deque
+from .OrderBook import OrderBook, executable_size
+from .MarketIndex import MarketIndex
+from .Subscriptions import SubscriptionManager
+from .config import Config
+
+try:
+    import orjson  # 比标准库json快数倍，直接解析bytes
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+_STOP = object()  # 通知解码/策略线程退出
+MAX_BATCH = 256   # 策略线程一次最多合并处理的帧数
+
+
+class LatencyStats:
+    """
+    每帧的延迟：接收 -> 解码完成 -> 套利判定完成
+    只保留最近window帧用于计算分位数，线程安全
+    """
+
+    STAGES = ("decode", "decide", "total")
+
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.samples = {stage: deque(maxlen=window) for stage in self.STAGES}
+        self.frames = 0
+        self.queue_peak = 0
+
+    def record(self, received_ns, decoded_ns, decided_ns):
+        with self.lock:
+            self.frames += 1
+            self.samples["decode"].append(decoded_ns - received_ns)
+            self.samples["decide"].append(decided_ns - decoded_ns)
+            self.samples["total"].append(decided_ns - received_ns)
+
+    def observe_queue(self, depth):
+        if depth > self.queue_peak:
+            self.queue_peak = depth
+
+    def snapshot(self):
+        """各阶段的 p50 / p99 / max (微秒)"""
+        with self.lock:
+            result = {"frames": self.frames, "queue_peak": self.queue_peak}
+            for stage, values in self.samples.items():
+                ordered = sorted(values)
+                if not ordered:
+                    continue
+                result[stage] = {
+                    "p50": ordered[len(ordered) // 2] / 1000,
+                    "p99": ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] / 1000,
+                    "max": ordered[-1] / 1000,
+                }
+            return result
+
+    def report(self):
+        stats = self.snapshot()
+        print(f"⏱️ 延迟统计: {stats['frames']} 帧, 队列峰值 {stats['queue_peak']}")
+        names = {"decode": "接收->解码", "decide": "解码->判定", "total": "接收->判定"}
+        for stage in self.STAGES:
+            if stage in stats:
+                s = stats[stage]
+                print(f"   {names[stage]}: p50 {s['p50']:.0f}us, p99 {s['p99']:.0f}us, max {s['max']:.0f}us")
+
 
 class OrderBookMonitor:
-    def __init__(self, market_tokens, threshold=0.005, executor_func=None):
+    def __init__(self, market_index, threshold=0.005, executor_func=None, max_size=None):
         self.ws_url = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
-        self.market_tokens = market_tokens
-        self.order_books = {}
+        # 与执行器共享的市场<->代币索引；也接受 {token_id: {"market_id", "side"}} 映射
+        if not isinstance(market_index, MarketIndex):
+            market_index = MarketIndex.from_token_map(market_index)
+        self.index = market_index
+        self.books = {}  # token_id -> OrderBook (完整L2订单簿)
         self.threshold = threshold
+        self.max_size = max_size if max_size is not None else Config.DEFAULT_ORDER_SIZE  # 单次套利的最大数量
         self.executor_func = executor_func  # 套利执行器函数
 
-    def on_open(self, ws):
-        """连接建立时，发送订阅请求"""
-        print("WebSocket Connected. Sending Subscriptions...")
-        # 提取所有需要监控的 token_id
-        all_token_ids = list(self.market_tokens.keys())
-        
-        # 构造订阅消息
-        subscribe_msg = {
-            "type": "subscribe",
-            "assets_ids": all_token_ids,
-            "channels": ["book"]  # 订阅订单簿频道
-        }
-        ws.send(json.dumps(subscribe_msg))
+        # WebSocket线程只负责收包入队，解码和策略各在独立线程中运行
+        self.raw_queue = queue.SimpleQueue()     # (接收时间, 原始帧)
+        self.event_queue = queue.SimpleQueue()   # (接收时间, 解码完成时间, 事件列表)
+        self.latency = LatencyStats()
+        self.workers = []
+        self.stopped = threading.Event()
+        self.manager = None  # SubscriptionManager，start()时创建
+        self.message_counts = {}  # token_id -> 累计更新次数，用于按消息速率分配连接
+
+        for token_id in self.index.token_ids():
+            self.books[token_id] = OrderBook(token_id)
+            self.message_counts[token_id] = 0
+
     # 处理推送消息
     def on_message(self, ws, message):
         """
-        处理推送的价格信息
+        WebSocket回调：只记录接收时间并入队，不在回调线程中解析，避免突发消息堆积在socket缓冲区
         """
         # ws: WebSocketApp实例
-        data = json.loads(message) 
-        # Polymarket会推送快照(Snapshot,全部订单)或更新(Update,价格变动)。代码要根据这些信息更新本地的order_books
-        # 只要某个代币价格一变，立即触发check_arbitrage
-        # Polymarket WS 返回的数据通常包含 'asset_id', 'asks', 'bids'
-        # 我们只关注最优卖价 (Best Ask)
-        asset_id = data.get('asset_id')
-        asks = data.get('asks', [])
-
-        if asset_id in self.market_tokens:
-             # 获取当前最新的best Tokens
-             best_ask = float(asks[0].get("price"))
-
-             # 找到该token属于哪个市场及其类型(Yes/No)
-             info = self.market_tokens[asset_id]
-             m_id = info["market_id"]
-             side = info["side"] # 'yes' 或 'no'
-
-             # 更新本地账本
-             if m_id not in self.order_books:
-                 self.order_books[m_id] = {"Yes":None, "No":None}
-             
-             self.order_books[m_id][side] = best_ask
-
-             # 尝试触发套利检查
-             self.check_arbitrage(m_id)
-    
+        self.raw_queue.put((time.perf_counter_ns(), message))
+
+    def reset_books(self, token_ids):
+        """
+        连接断开后清空这些代币的订单簿(重连订阅后由快照重建)
+        通过与消息相同的队列传递，保证排在断线前已收到的帧之后执行
+        """
+        self.raw_queue.put((time.perf_counter_ns(), [{"event_type": "reset", "asset_ids": list(token_ids)}]))
+
+    @staticmethod
+    def decode_frame(message):
+        """解析一帧：可能是单个事件，也可能是事件列表(订阅后的初始快照)；内部事件已是列表"""
+        if isinstance(message, list):
+            return message
+        data = _loads(message)
+        return data if isinstance(data, list) else [data]
+
+    def process_events(self, events):
+        """把事件应用到订单簿，再对有变化的市场做套利判定"""
+        changed = set()
+        for event in events:
+            changed.update(self.apply_event(event))
+
+        # 只要某个市场的订单簿有变化，立即触发check_arbitrage
+        for m_id in changed:
+            self.check_arbitrage(m_id)
+
+    def process_message(self, message):
+        """在当前线程中同步处理一帧(测试或回放时使用)"""
+        self.process_events(self.decode_frame(message))
+
+    def _decode_loop(self):
+        """解码线程：原始帧 -> 事件列表"""
+        while True:
+            item = self.raw_queue.get()
+            if item is _STOP:
+                self.event_queue.put(_STOP)
+                return
+            received_ns, message = item
+            try:
+                events = self.decode_frame(message)
+            except Exception as e:
+                print(f"⚠️  无法解析消息: {e}")
+                continue
+            self.event_queue.put((received_ns, time.perf_counter_ns(), events))
+
+    def _strategy_loop(self):
+        """
+        策略线程：一次取出队列中已到达的所有帧(最多MAX_BATCH)，合并应用后每个市场只判定一次
+        """
+        while True:
+            batch = [self.event_queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.event_queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.latency.observe_queue(len(batch))
+
+            stop = batch[-1] is _STOP
+            frames = [item for item in batch if item is not _STOP]
+            try:
+                self.process_events([event for _, _, events in frames for event in events])
+            except Exception as e:
+                print(f"❌ 处理订单簿更新出错: {e}")
+            decided_ns = time.perf_counter_ns()
+            for received_ns, decoded_ns, _ in frames:
+                self.latency.record(received_ns, decoded_ns, decided_ns)
+            if stop:
+                return
+
+    def _report_loop(self, interval):
+        while not self.stopped.wait(interval):
+            self.latency.report()
+
+    def start_workers(self):
+        """启动解码和策略线程(start()会自动调用)"""
+        if self.workers:
+            return
+        self.stopped.clear()
+        self.workers = [
+            threading.Thread(target=self._decode_loop, name="ws-decode", daemon=True),
+            threading.Thread(target=self._strategy_loop, name="ws-strategy", daemon=True),
+        ]
+        if Config.LATENCY_REPORT_INTERVAL > 0:
+            self.workers.append(threading.Thread(
+                target=self._report_loop, args=(Config.LATENCY_REPORT_INTERVAL,), name="ws-latency", daemon=True
+            ))
+        for worker in self.workers:
+            worker.start()
+
+    def stop_workers(self):
+        """处理完已入队的帧后停止解码和策略线程"""
+        self.raw_queue.put(_STOP)
+        self.stopped.set()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def apply_event(self, event):
+        """
+        把一个事件应用到本地订单簿，返回受影响的market_id
+        - book: 快照(全部买卖价位)，整体替换该代币的订单簿
+        - price_change: 增量，逐个价位更新(数量为0表示删除该价位)
+        - reset: 内部事件，连接断开时清空订单簿，直到收到新的快照
+        """
+        event_type = event.get("event_type")
+        timestamp = event.get("timestamp")
+        touched = []
+
+        if event_type == "book":
+            book = self.books.get(event.get("asset_id"))
+            if book is not None:
+                book.apply_snapshot(event.get("bids", []), event.get("asks", []), timestamp)
+                touched.append(event["asset_id"])
+
+        elif event_type == "price_change":
+            # 新格式: price_changes列表中每项带asset_id；旧格式: 顶层asset_id + changes列表
+            changes = event.get("price_changes") or event.get("changes", [])
+            for change in changes:
+                asset_id = change.get("asset_id", event.get("asset_id"))
+                book = self.books.get(asset_id)
+                if book is None or not book.ready:
+                    continue
+                book.apply_change(change["side"], change["price"], change["size"], timestamp)
+                touched.append(asset_id)
+
+        elif event_type == "reset":
+            for asset_id in event["asset_ids"]:
+                if asset_id in self.books:
+                    self.books[asset_id].reset()
+            return set()
+
+        for asset_id in touched:
+            self.message_counts[asset_id] += 1
+        return {self.index.token(asset_id).market_id for asset_id in touched}
+
     def check_arbitrage(self, market_id):
-        """核心套利判定算法"""
+        """核心套利判定算法：按两边卖盘的深度计算可执行数量"""
+
+        market = self.index.market(market_id)
+        if market is None:
+            return
+        yes_book = self.books.get(market.yes_token)
+        no_book = self.books.get(market.no_token)
+        if yes_book is None or no_book is None or not (yes_book.ready and no_book.ready):
+            return
 
-        book = self.order_books.get(market_id)
-        if not book or book["Yes"] is None or book["No"] is None:
+        best_yes, best_no = yes_book.best_ask(), no_book.best_ask()
+        if best_yes is None or best_no is None:
             return
 
-        total_cost = book["Yes"] + book["No"]
+        total_cost = best_yes + best_no
 
         if total_cost < 1 - self.threshold:
+            # 两边限价之和保持在阈值以内时最多能买多少
+            size, yes_limit, no_limit = executable_size(
+                yes_book.asks, no_book.asks, 1 - self.threshold, self.max_size
+            )
             print(f"🎯 ARBITRAGE DETECTED in Market {market_id}")
-            print(f"   Yes: {book['Yes']:.4f}, No: {book['No']:.4f}, Total: {total_cost:.4f}")
+            print(f"   Yes: {yes_limit:.4f}, No: {no_limit:.4f}, Total: {yes_limit + no_limit:.4f}, Size: {size:.2f}")
 
             # 调用执行器函数
             if self.executor_func:
-                self.executor_func(market_id, book["Yes"], book["No"])
+                self.executor_func(market_id, yes_limit, no_limit, size)
             else:
                 print("   ⚠️  未配置执行器函数")
         else:
-            if Config.VERBOSE if 'Config' in globals() else False:
+            if Config.VERBOSE:
                 print(f"Market {market_id} cost: {total_cost:.4f}")
-    def on_error(self, ws, error):
-        print(f"WS Error: {error}")
-
-    def on_close(self, ws, close_status_code, close_msg):
-        print("WS Closed")
 
     def start(self):
-        """在独立线程中启动WebSocket"""
-        self.ws = WebSocketApp(
-            self.ws_url,
-            on_open=self.on_open,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=self.on_close
-        )
-
-        # 运行连接
-        self.ws.run_forever()
+        """启动WebSocket连接(按代币数分成多个连接)，阻塞直到stop()"""
+        self.start_workers()
+        self.manager = SubscriptionManager(self)
+        self.manager.run()
+
+    def stop(self):
+        """关闭所有连接，处理完已收到的帧后停止"""
+        if self.manager is not None:
+            self.manager.stop()
+        self.stop_workers()
 
 # --- 使用示例 ---
 if __name__ == "__main__":
-    # 映射表由gamma API代码生成
-    mock_tokens = {
-        "TOKEN_ID_FOR_YES":{"market_id": "M1", "side":"Yes"},
-        "TOKEN_ID_FOR_NO":{"market_id": "M1", "side":"No"},
-    }
-
-    monitor = OrderBookMonitor(mock_tokens)
-    monitor.start()
\ No newline at end of file
+    # 索引由gamma API代码生成
+    mock_index = MarketIndex()
+    mock_index.add("M1", "TOKEN_ID_FOR_YES", "TOKEN_ID_FOR_NO", tick_size="0.01")
+
+    monitor = OrderBookMonitor(mock_index)
+    monitor.start()
@@ -0,0 +1,149 @@
+from bisect import bisect_left
+
+
+class BookSide:
+    """
+    订单簿的一侧(买盘或卖盘)，按价格排序的价位 -> 数量
+    价格列表保持升序，用二分查找定位价位：更新已有价位O(1)，新增/删除价位O(log n)查找
+    """
+
+    def __init__(self, descending=False):
+        self.descending = descending  # 买盘: 价格越高越优先
+        self.prices = []  # 升序价格
+        self.sizes = {}   # 价格 -> 数量
+
+    def __len__(self):
+        return len(self.prices)
+
+    def clear(self):
+        self.prices = []
+        self.sizes = {}
+
+    def load(self, levels):
+        """用快照整体替换本侧，levels: [{"price": "0.45", "size": "100"}, ...]"""
+        self.sizes = {}
+        for level in levels:
+            size = float(level["size"])
+            if size > 0:
+                self.sizes[float(level["price"])] = size
+        self.prices = sorted(self.sizes)
+
+    def update(self, price, size):
+        """增量更新单个价位，size为0表示该价位被清空"""
+        if size > 0:
+            if price not in self.sizes:
+                self.prices.insert(bisect_left(self.prices, price), price)
+            self.sizes[price] = size
+        elif price in self.sizes:
+            del self.sizes[price]
+            del self.prices[bisect_left(self.prices, price)]
+
+    def best(self):
+        """最优价位 (价格, 数量)，本侧为空时返回None"""
+        if not self.prices:
+            return None
+        price = self.prices[-1] if self.descending else self.prices[0]
+        return price, self.sizes[price]
+
+    def levels(self):
+        """从最优价开始依次返回 (价格, 数量)"""
+        prices = reversed(self.prices) if self.descending else self.prices
+        for price in prices:
+            yield price, self.sizes[price]
+
+    def depth(self, size):
+        """
+        吃掉size数量需要的价格
+        返回 (成交均价, 最差价格, 可成交数量)；深度不足时可成交数量小于size
+        """
+        filled = notional = 0.0
+        worst = None
+        for price, level_size in self.levels():
+            if filled >= size:
+                break
+            take = min(level_size, size - filled)
+            filled += take
+            notional += take * price
+            worst = price
+        if filled == 0:
+            return None, None, 0.0
+        return notional / filled, worst, filled
+
+
+class OrderBook:
+    """单个代币的L2订单簿，应用快照(book)和增量(price_change)消息"""
+
+    def __init__(self, asset_id=None):
+        self.asset_id = asset_id
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide()
+        self.timestamp = None
+        self.ready = False  # 收到第一个快照前增量无法使用
+
+    def reset(self):
+        """清空订单簿，等待下一个快照"""
+        self.bids.clear()
+        self.asks.clear()
+        self.timestamp = None
+        self.ready = False
+
+    def apply_snapshot(self, bids, asks, timestamp=None):
+        self.bids.load(bids)
+        self.asks.load(asks)
+        self.timestamp = timestamp
+        self.ready = True
+
+    def apply_change(self, side, price, size, timestamp=None):
+        """side: "BUY"更新买盘，"SELL"更新卖盘"""
+        book_side = self.bids if side.upper() == "BUY" else self.asks
+        book_side.update(float(price), float(size))
+        if timestamp is not None:
+            self.timestamp = timestamp
+
+    def best_bid(self):
+        best = self.bids.best()
+        return best[0] if best else None
+
+    def best_ask(self):
+        best = self.asks.best()
+        return best[0] if best else None
+
+    def top(self):
+        """(最优买价, 最优卖价)"""
+        return self.best_bid(), self.best_ask()
+
+
+def executable_size(yes_asks, no_asks, max_cost, max_size):
+    """
+    同时买入Yes和No时，在两边限价之和不超过max_cost的前提下最多能成交多少
+
+    沿两侧卖盘从最优价向外逐档推进，每一段数量的成本取两边当前档位价格；
+    返回 (数量, Yes限价, No限价)，没有可执行数量时返回 (0, None, None)
+    """
+    yes_levels = yes_asks.levels()
+    no_levels = no_asks.levels()
+    yes_level = next(yes_levels, None)
+    no_level = next(no_levels, None)
+    yes_left = yes_level[1] if yes_level else 0.0
+    no_left = no_level[1] if no_level else 0.0
+
+    size = 0.0
+    yes_limit = no_limit = None
+    while yes_level and no_level and size < max_size:
+        if yes_level[0] + no_level[0] > max_cost:
+            break
+        yes_limit, no_limit = yes_level[0], no_level[0]
+        take = min(yes_left, no_left, max_size - size)
+        size += take
+        yes_left -= take
+        no_left -= take
+        if yes_left <= 0:
+            yes_level = next(yes_levels, None)
+            yes_left = yes_level[1] if yes_level else 0.0
+        if no_left <= 0:
+            no_level = next(no_levels, None)
+            no_left = no_level[1] if no_level else 0.0
+
+    if size <= 0:
+        return 0.0, None, None
+    return size, yes_limit, no_limit
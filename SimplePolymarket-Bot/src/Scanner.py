@@ -53,10 +53,14 @@ def parse_market_metadata(market):
     # 它将几个不同的 TokenID 绑定在一起。比如它告诉合约：这两个 Token 是属于“特朗普是否获胜”这个同一个事件的。
     question = market.get('question') # 给人类看的描述语言，该预测市场的具体内容
     # 例如："Will Bitcoin reach $100,000 by the end of 2025?"（比特币在2025年底前会达到10万美元吗？）
+    tick_size = market.get('orderPriceMinTickSize') # 最小价格单位，下单时直接传给CLOB客户端，避免逐单查询
+    neg_risk = bool(market.get('negRisk', False)) # 负风险市场的订单需要用不同的交易合约签名
 
     return{
         "question": question,
         "condition_id": condition_id,
+        "tick_size": str(tick_size) if tick_size is not None else None,
+        "neg_risk": neg_risk,
         "token_ids": json.loads(tokens) if isinstance(tokens, str) else tokens
         # Web API交互中，数据通常以字符串的形式在网络上传输，Python无法直接操作字符串内部的逻辑，所以在遇见字符串时要将其转化为列表
     }
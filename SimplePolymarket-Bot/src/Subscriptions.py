@@ -0,0 +1,221 @@
+import json
+import math
+import time
+import random
+import threading
+from websocket import WebSocketApp
+from .config import Config
+
+MIN_IMPROVEMENT = 0.1  # 新分配的最高负载至少降低10%才重启连接
+
+
+def assign_shards(markets, rates, shard_count, max_tokens):
+    """
+    把市场分配到shard_count个连接上
+    markets: {market_id: [token_id, ...]}，同一市场的代币放在同一个连接，断线只影响该连接上的市场
+    rates: {market_id: 每秒消息数}
+    按消息速率从高到低依次放入当前负载最低且未满的连接(负载相同时比较代币数)
+    返回 [[token_id, ...], ...]
+    """
+    shards = [[] for _ in range(shard_count)]
+    loads = [(0.0, 0)] * shard_count
+    order = sorted(markets, key=lambda m: (-rates.get(m, 0.0), str(m)))
+    for market_id in order:
+        tokens = markets[market_id]
+        candidates = [i for i in range(shard_count) if loads[i][1] + len(tokens) <= max_tokens]
+        if not candidates:
+            raise ValueError(f"{shard_count}个连接无法容纳所有代币 (每个连接最多{max_tokens}个)")
+        target = min(candidates, key=lambda i: loads[i])
+        shards[target].extend(tokens)
+        loads[target] = (loads[target][0] + rates.get(market_id, 0.0), loads[target][1] + len(tokens))
+    return shards
+
+
+class Shard:
+    """一个WebSocket连接及其订阅的代币，断线后按指数退避重连并重新订阅"""
+
+    def __init__(self, shard_id, token_ids, manager):
+        self.shard_id = shard_id
+        self.token_ids = list(token_ids)
+        self.manager = manager
+        self.monitor = manager.monitor
+        self.ws = None
+        self.thread = None
+        self.attempts = 0        # 连续失败次数，决定下次重连的等待时间
+        self.restart = False     # 主动重启(重新分配代币)时立即重连
+        self.connected = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"ws-shard-{self.shard_id}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.manager.stopped.is_set():
+            self.ws = WebSocketApp(
+                self.manager.ws_url,
+                on_open=self.on_open,
+                on_message=self.monitor.on_message,
+                on_error=self.on_error,
+                on_close=self.on_close
+            )
+            self.ws.run_forever(ping_interval=Config.WS_PING_INTERVAL, ping_timeout=Config.WS_PING_INTERVAL / 2)
+            self.connected.clear()
+
+            # 连接上的数据已不可信：清空这些代币的订单簿，重连后由订阅返回的快照重建
+            self.monitor.reset_books(self.token_ids)
+            if self.manager.stopped.is_set():
+                break
+            if self.restart:
+                self.restart = False
+                continue
+
+            delay = min(Config.WS_RECONNECT_MAX_DELAY, Config.WS_RECONNECT_BASE_DELAY * 2 ** self.attempts)
+            delay *= random.uniform(0.5, 1.0)  # 抖动，避免所有连接同时重连
+            self.attempts += 1
+            print(f"🔌 连接{self.shard_id}断开，{delay:.1f}秒后重连 (第{self.attempts}次)")
+            self.manager.stopped.wait(delay)
+
+    def on_open(self, ws):
+        """连接建立时，订阅本连接负责的代币"""
+        if self.manager.stopped.is_set():
+            # stop()与重连同时发生时，关闭刚建立的连接
+            ws.close()
+            return
+        print(f"WebSocket Connected (连接{self.shard_id}, {len(self.token_ids)}个代币). Sending Subscriptions...")
+        self.attempts = 0
+        self.connected.set()
+        ws.send(json.dumps({
+            "type": "subscribe",
+            "assets_ids": self.token_ids,
+            "channels": ["book"]  # 订阅订单簿频道
+        }))
+
+    def on_error(self, ws, error):
+        print(f"WS Error (连接{self.shard_id}): {error}")
+
+    def on_close(self, ws, close_status_code, close_msg):
+        print(f"WS Closed (连接{self.shard_id})")
+
+    def reassign(self, token_ids):
+        """
+        换成新的代币集合：关闭当前连接，run()中立即重连并订阅新集合
+        断开后run()只清空新集合的订单簿，移出的代币由SubscriptionManager.rebalance()事先清空
+        """
+        self.token_ids = list(token_ids)
+        self.restart = True
+        if self.ws is not None:
+            self.ws.close()
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+
+class SubscriptionManager:
+    """
+    把所有代币分散到多个WebSocket连接上
+    - 每个连接最多WS_MAX_TOKENS_PER_SHARD个代币，连接数不少于WS_SHARDS
+    - 单个连接断线只清空并重建它自己的订单簿，不影响其他连接
+    - 每隔WS_REBALANCE_INTERVAL秒按各市场的消息速率重新分配，只重启分配发生变化的连接
+    """
+
+    def __init__(self, monitor, ws_url=None, shard_count=None, max_tokens=None):
+        self.monitor = monitor
+        self.ws_url = ws_url or monitor.ws_url
+        self.max_tokens = max_tokens or Config.WS_MAX_TOKENS_PER_SHARD
+        self.stopped = threading.Event()
+
+        # market_id -> [token_id, ...]
+        self.markets = {m_id: [m.yes_token, m.no_token] for m_id, m in monitor.index.markets.items()}
+        token_count = len(monitor.index)
+        self.shard_count = max(shard_count or Config.WS_SHARDS, math.ceil(token_count / self.max_tokens), 1)
+
+        assignment = assign_shards(self.markets, {}, self.shard_count, self.max_tokens)
+        self.shards = [Shard(i, tokens, self) for i, tokens in enumerate(assignment)]
+        self.last_counts = dict(monitor.message_counts)
+        self.last_rebalance = time.time()
+
+    def market_rates(self):
+        """上次重新分配以来各市场每秒的消息数"""
+        counts = dict(self.monitor.message_counts)
+        elapsed = max(time.time() - self.last_rebalance, 1e-9)
+        rates = {}
+        for market_id, tokens in self.markets.items():
+            rates[market_id] = sum(counts.get(t, 0) - self.last_counts.get(t, 0) for t in tokens) / elapsed
+        return rates, counts
+
+    def rebalance(self):
+        """
+        负载最高的连接超过平均值的WS_REBALANCE_RATIO倍、且重新分配能明显降低最高负载时才执行，
+        返回重启的连接数
+        """
+        rates, counts = self.market_rates()
+        token_shard = {t: shard.shard_id for shard in self.shards for t in shard.token_ids}
+        loads = [0.0] * self.shard_count
+        for market_id, tokens in self.markets.items():
+            loads[token_shard[tokens[0]]] += rates[market_id]
+        self.last_counts = counts
+        self.last_rebalance = time.time()
+
+        mean = sum(loads) / self.shard_count
+        if self.shard_count < 2 or mean <= 0 or max(loads) <= mean * Config.WS_REBALANCE_RATIO:
+            return 0
+
+        assignment = assign_shards(self.markets, rates, self.shard_count, self.max_tokens)
+        market_of = {t: m for m, tokens in self.markets.items() for t in tokens}
+        new_max = max(sum(rates[m] for m in {market_of[t] for t in tokens}) for tokens in assignment)
+        if new_max > max(loads) * (1 - MIN_IMPROVEMENT):
+            return 0
+
+        # 新的分组与现有连接按重合的代币数配对，尽量少重启连接
+        remaining = list(range(self.shard_count))
+        changes = []
+        for shard in sorted(self.shards, key=lambda s: -len(s.token_ids)):
+            current = set(shard.token_ids)
+            best = max(remaining, key=lambda i: len(current & set(assignment[i])))
+            remaining.remove(best)
+            if set(assignment[best]) != current:
+                changes.append((shard, assignment[best]))
+
+        # 换到其他连接的代币：旧连接关闭前还可能更新它们的订单簿，
+        # 在任何连接重启之前先清空，保证排在新连接的快照之前
+        moved = set()
+        for shard, tokens in changes:
+            moved.update(set(shard.token_ids) - set(tokens))
+        self.monitor.reset_books(moved)
+        for shard, tokens in changes:
+            shard.reassign(tokens)
+        restarted = len(changes)
+        print(f"⚖️ 按消息速率重新分配: 连接负载 {[round(x, 1) for x in loads]} 条/秒，重启 {restarted} 个连接")
+        return restarted
+
+    def _rebalance_loop(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.rebalance()
+            except Exception as e:
+                print(f"⚠️  重新分配失败: {e}")
+
+    def run(self):
+        """启动所有连接并阻塞直到stop()"""
+        print(f"📡 {len(self.monitor.index)} 个代币分布在 {self.shard_count} 个连接上")
+        for shard in self.shards:
+            shard.start()
+        if Config.WS_REBALANCE_INTERVAL > 0 and self.shard_count > 1:
+            threading.Thread(
+                target=self._rebalance_loop, args=(Config.WS_REBALANCE_INTERVAL,), name="ws-rebalance", daemon=True
+            ).start()
+        for shard in self.shards:
+            shard.thread.join()
+
+    def stop(self):
+        self.stopped.set()
+        for shard in self.shards:
+            shard.close()
+
+    def status(self):
+        """每个连接的状态: 是否已连接、代币数、连续失败次数"""
+        return [
+            {"shard": s.shard_id, "connected": s.connected.is_set(), "tokens": len(s.token_ids), "attempts": s.attempts}
+            for s in self.shards
+        ]
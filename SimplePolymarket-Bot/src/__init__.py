@@ -10,16 +10,29 @@ __author__ = "Polymarket Trader"
 # 导出主要类
 from .config import Config
 from .Scanner import fetch_arbitrage_candidates, parse_market_metadata
+from .MarketIndex import MarketIndex, MarketEntry, TokenEntry
+from .OrderBook import OrderBook, executable_size
+from .Subscriptions import SubscriptionManager, assign_shards
 from .Monitor import OrderBookMonitor
-from .Executor import place_order_safe, execute_arbitrage
+from .Executor import place_order_safe, execute_arbitrage, ExecutionLoop, get_execution_loop, SkewStats
 from .Settler import merge_position_on_chain
 
 __all__ = [
     "Config",
     "fetch_arbitrage_candidates",
     "parse_market_metadata",
+    "MarketIndex",
+    "MarketEntry",
+    "TokenEntry",
+    "OrderBook",
+    "executable_size",
+    "SubscriptionManager",
+    "assign_shards",
     "OrderBookMonitor",
     "place_order_safe",
     "execute_arbitrage",
+    "ExecutionLoop",
+    "get_execution_loop",
+    "SkewStats",
     "merge_position_on_chain",
 ]
@@ -18,6 +18,23 @@ class Config:
     # WebSocket配置
     WS_URL = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
 
+    # 每个WebSocket连接最多订阅的代币数，超过时自动增加连接
+    WS_MAX_TOKENS_PER_SHARD = int(os.getenv("WS_MAX_TOKENS_PER_SHARD", "500"))
+
+    # 最少使用的连接数
+    WS_SHARDS = int(os.getenv("WS_SHARDS", "1"))
+
+    # 断线重连的指数退避 (秒): 第n次等待 min(最大值, 基数 * 2^n)
+    WS_RECONNECT_BASE_DELAY = float(os.getenv("WS_RECONNECT_BASE_DELAY", "1"))
+    WS_RECONNECT_MAX_DELAY = float(os.getenv("WS_RECONNECT_MAX_DELAY", "30"))
+
+    # 心跳间隔 (秒)，超时未响应视为断线
+    WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "10"))
+
+    # 每隔多少秒按消息速率重新分配连接 (0表示不重新分配)，负载最高的连接超过平均值的多少倍时才重新分配
+    WS_REBALANCE_INTERVAL = float(os.getenv("WS_REBALANCE_INTERVAL", "300"))
+    WS_REBALANCE_RATIO = float(os.getenv("WS_REBALANCE_RATIO", "1.5"))
+
     # CLOB API配置
     CLOB_HOST = "https://clob.polymarket.com"
     CLOB_CHAIN_ID = 137  # Polygon主网
@@ -39,6 +56,9 @@ class Config:
     # 默认订单大小
     DEFAULT_ORDER_SIZE = float(os.getenv("DEFAULT_ORDER_SIZE", "100"))
 
+    # 下单线程池大小 (每次套利的两条腿各占一个线程)
+    ORDER_WORKERS = int(os.getenv("ORDER_WORKERS", "4"))
+
     # ==================== 安全配置 ====================
     # 私钥 (必须通过环境变量设置)
     PRIVATE_KEY = os.getenv("PRIVATE_KEY")
@@ -47,6 +67,9 @@ class Config:
     # 是否启用详细日志
     VERBOSE = os.getenv("VERBOSE", "false").lower() == "true"
 
+    # 每隔多少秒输出一次WebSocket消息延迟统计 (0表示不输出)
+    LATENCY_REPORT_INTERVAL = float(os.getenv("LATENCY_REPORT_INTERVAL", "60"))
+
     # ==================== 合约ABI ====================
     # CTF合约ABI (简化版，实际使用时应使用完整ABI)
     CTF_ABI = [
@@ -6,6 +6,7 @@
 
 import sys
 import os
+import json
 
 # 确保使用本地src模块
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -120,25 +121,122 @@ def test_monitor():
     print("测试4: 订单簿监控器测试")
     print("=" * 60)
 
+    try:
+        from src.Monitor import OrderBookMonitor
+        from src.MarketIndex import MarketIndex
+
+        # 创建测试索引
+        index = MarketIndex()
+        index.add("TEST_1", "TOKEN_YES", "TOKEN_NO", tick_size="0.01", neg_risk=False, question="测试市场")
+        assert index.market("TEST_1").no_token == "TOKEN_NO"
+        assert index.token("TOKEN_YES") == ("TEST_1", "Yes")
+        print(f"✅ 市场索引: {index.market('TEST_1')}")
+
+        # 创建监控器实例（不启动WebSocket），与执行器共用同一个索引
+        monitor = OrderBookMonitor(index, threshold=0.005)
+        assert monitor.index is index and set(monitor.books) == {"TOKEN_YES", "TOKEN_NO"}
+        print(f"✅ 监控器创建成功")
+        print(f"   监控的代币数量: {len(index)}")
+        print(f"   套利阈值: {monitor.threshold}")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ 监控器测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def test_order_book():
+    """测试L2订单簿(快照 + 增量)"""
+    print("\n" + "=" * 60)
+    print("测试5: L2订单簿测试")
+    print("=" * 60)
+
     try:
         from src.Monitor import OrderBookMonitor
 
-        # 创建测试映射
         mock_tokens = {
             "TOKEN_YES": {"market_id": "TEST_1", "side": "Yes", "question": "测试市场"},
             "TOKEN_NO": {"market_id": "TEST_1", "side": "No", "question": "测试市场"}
         }
+        opportunities = []
+        monitor = OrderBookMonitor(
+            mock_tokens, threshold=0.005, max_size=100,
+            executor_func=lambda *args: opportunities.append(args)
+        )
 
-        # 创建监控器实例（不启动WebSocket）
-        monitor = OrderBookMonitor(mock_tokens, threshold=0.005)
-        print(f"✅ 监控器创建成功")
-        print(f"   监控的代币数量: {len(mock_tokens)}")
-        print(f"   套利阈值: {monitor.threshold}")
+        # 快照：Yes卖盘 0.45x30 / 0.47x50，No卖盘 0.50x40 / 0.53x100
+        monitor.process_message(json.dumps([
+            {"event_type": "book", "asset_id": "TOKEN_YES", "bids": [{"price": "0.44", "size": "10"}],
+             "asks": [{"price": "0.47", "size": "50"}, {"price": "0.45", "size": "30"}]},
+            {"event_type": "book", "asset_id": "TOKEN_NO", "bids": [],
+             "asks": [{"price": "0.50", "size": "40"}, {"price": "0.53", "size": "100"}]},
+        ]))
+        yes_book = monitor.books["TOKEN_YES"]
+        assert yes_book.top() == (0.44, 0.45)
+        # 0.45+0.50 可成交30，0.47+0.50 可再成交10，0.47+0.53 超过阈值
+        assert opportunities[-1] == ("TEST_1", 0.47, 0.50, 40.0), opportunities
+        print(f"✅ 快照后可执行: {opportunities[-1]}")
+
+        # 增量：Yes最优卖价被吃光，新增更优买价
+        monitor.process_message(json.dumps({
+            "event_type": "price_change", "market": "TEST_1",
+            "price_changes": [
+                {"asset_id": "TOKEN_YES", "price": "0.45", "size": "0", "side": "SELL"},
+                {"asset_id": "TOKEN_YES", "price": "0.46", "size": "5", "side": "BUY"},
+            ]
+        }))
+        assert yes_book.top() == (0.46, 0.47)
+        assert yes_book.asks.depth(60) == (0.47, 0.47, 50.0)
+        assert opportunities[-1] == ("TEST_1", 0.47, 0.50, 40.0), opportunities
+        print(f"✅ 增量后最优价: {yes_book.top()}，深度: {yes_book.asks.depth(60)}")
+
+        # WebSocket回调只入队，由解码/策略线程处理
+        monitor.start_workers()
+        monitor.on_message(None, json.dumps({
+            "event_type": "price_change", "market": "TEST_1",
+            "price_changes": [{"asset_id": "TOKEN_NO", "price": "0.50", "size": "0", "side": "SELL"}]
+        }))
+        monitor.stop_workers()
+        assert monitor.books["TOKEN_NO"].best_ask() == 0.53
+        assert monitor.latency.snapshot()["frames"] == 1
+        print(f"✅ 异步处理完成，延迟: {monitor.latency.snapshot()['total']}")
 
         return True
 
     except Exception as e:
-        print(f"❌ 监控器测试失败: {e}")
+        print(f"❌ 订单簿测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def test_subscriptions():
+    """测试多连接分配 (不建立实际连接)"""
+    print("\n" + "=" * 60)
+    print("测试6: 多连接订阅分配测试")
+    print("=" * 60)
+
+    try:
+        from src.Subscriptions import assign_shards
+
+        markets = {f"M{i}": [f"Y{i}", f"N{i}"] for i in range(6)}
+
+        # 没有速率数据时按代币数平均分配，同一市场的代币在同一连接
+        shards = assign_shards(markets, {}, shard_count=3, max_tokens=4)
+        assert [len(s) for s in shards] == [4, 4, 4]
+        assert all(s.index(f"N{s[0][1:]}") == 1 for s in shards)
+        print(f"✅ 初始分配: {shards}")
+
+        # 消息最多的两个市场分到不同连接
+        shards = assign_shards(markets, {"M0": 100, "M3": 90}, shard_count=3, max_tokens=4)
+        assert not any("Y0" in s and "Y3" in s for s in shards)
+        print(f"✅ 按速率分配: {shards}")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ 多连接订阅测试失败: {e}")
         import traceback
         traceback.print_exc()
         return False
@@ -146,7 +244,7 @@ def test_monitor():
 def test_executor():
     """测试执行器模块（不执行实际交易）"""
     print("\n" + "=" * 60)
-    print("测试5: 交易执行器测试")
+    print("测试7: 交易执行器测试")
     print("=" * 60)
 
     try:
@@ -170,6 +268,14 @@ def test_executor():
         # 注意：我们不实际调用place_order_safe，因为这需要真实的私钥和网络连接
         print("ℹ️  跳过实际交易执行测试（需要私钥和网络）")
 
+        # 常驻下单事件循环：从其他线程投递协程
+        from src.Executor import ExecutionLoop
+        import asyncio
+        loop = ExecutionLoop(workers=2)
+        assert loop.submit(asyncio.sleep(0, result=42)).result(timeout=5) == 42
+        loop.stop()
+        print("✅ 常驻下单事件循环可用")
+
         return True
 
     except Exception as e:
@@ -181,7 +287,7 @@ def test_executor():
 def test_settler():
     """测试结算模块"""
     print("\n" + "=" * 60)
-    print("测试6: 链上结算测试")
+    print("测试8: 链上结算测试")
     print("=" * 60)
 
     try:
@@ -218,6 +324,8 @@ def main():
         ("配置验证", test_config),
         ("市场扫描器", test_scanner),
         ("订单簿监控器", test_monitor),
+        ("L2订单簿", test_order_book),
+        ("多连接订阅", test_subscriptions),
         ("交易执行器", test_executor),
         ("链上结算", test_settler),
     ]
@@ -0,0 +1 @@
+"""离线抓取性能基准：本地模拟服务器和基准测试脚本"""
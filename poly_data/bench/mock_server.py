@@ -0,0 +1,465 @@
+"""
+本地模拟服务器：Goldsky orderbook 子图 + Gamma /markets 接口
+
+回放录制好的（或合成的）orderFilledEvents 和市场数据，用于离线测量抓取性能：
+- POST /goldsky           GraphQL 查询 orderFilledEvents（orderBy / orderDirection / first / skip / where）
+- GET  /markets           Gamma 市场列表（order=createdAt、ascending、limit、offset，或按 clob_token_ids 查询）
+- 可配置延迟（固定 + 随机抖动）、令牌桶限速（超出时返回 429 + Retry-After）、按概率注入 5xx 错误
+- 按接口和状态码统计请求数
+
+用法：
+    server = MockServer.from_fixtures("bench/fixtures", latency=0.02, error_rate=0.01)
+    server.start()
+    os.environ["POLY_GOLDSKY_URL"] = server.goldsky_url
+    os.environ["POLY_GAMMA_URL"] = server.gamma_url
+"""
+import os
+import json
+import time
+import random
+import bisect
+import threading
+from datetime import datetime, timezone
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from graphql import parse
+from graphql.language import ast
+
+EVENTS_FILE = "events.jsonl"
+MARKETS_FILE = "markets.json"
+
+# where 条件中支持的比较后缀
+_OPERATORS = {
+    "": lambda a, b: a == b,
+    "_not": lambda a, b: a != b,
+    "_lt": lambda a, b: a < b,
+    "_lte": lambda a, b: a <= b,
+    "_gt": lambda a, b: a > b,
+    "_gte": lambda a, b: a >= b,
+    "_in": lambda a, b: a in b,
+}
+
+
+def _ast_value(node):
+    """把 GraphQL 字面量节点转换为 Python 值（查询中不使用变量）"""
+    if isinstance(node, ast.ObjectValueNode):
+        return {field.name.value: _ast_value(field.value) for field in node.fields}
+    if isinstance(node, ast.ListValueNode):
+        return [_ast_value(value) for value in node.values]
+    if isinstance(node, ast.IntValueNode):
+        return int(node.value)
+    if isinstance(node, ast.NullValueNode):
+        return None
+    return node.value
+
+
+def _created_timestamp(created_at: str) -> float:
+    return datetime.fromisoformat(created_at.replace("Z", "+00:00")).timestamp()
+
+
+def _format_created(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")[:-4] + "Z"
+
+
+class EventStore:
+    """按 (timestamp, id) 升序保存的事件，时间范围用二分查找定位"""
+
+    def __init__(self, events):
+        self.events = sorted(events, key=lambda e: (int(e["timestamp"]), e["id"]))
+        self.timestamps = [int(e["timestamp"]) for e in self.events]
+        # 预先序列化，响应时直接拼接
+        self.encoded = [json.dumps(e, separators=(",", ":")) for e in self.events]
+
+    def __len__(self):
+        return len(self.events)
+
+    def _bounds(self, where: dict):
+        """根据 timestamp 条件确定候选区间 [lo, hi)"""
+        lo, hi = 0, len(self.events)
+        for key, value in where.items():
+            if not key.startswith("timestamp"):
+                continue
+            op, value = key[len("timestamp"):], int(value)
+            if op == "":
+                lo = max(lo, bisect.bisect_left(self.timestamps, value))
+                hi = min(hi, bisect.bisect_right(self.timestamps, value))
+            elif op == "_gt":
+                lo = max(lo, bisect.bisect_right(self.timestamps, value))
+            elif op == "_gte":
+                lo = max(lo, bisect.bisect_left(self.timestamps, value))
+            elif op == "_lt":
+                hi = min(hi, bisect.bisect_left(self.timestamps, value))
+            elif op == "_lte":
+                hi = min(hi, bisect.bisect_right(self.timestamps, value))
+        return lo, hi
+
+    @staticmethod
+    def _matches(event, where: dict) -> bool:
+        for key, value in where.items():
+            if key in ("and", "or"):
+                results = (EventStore._matches(event, sub) for sub in value)
+                if not (all(results) if key == "and" else any(results)):
+                    return False
+                continue
+            field, op = key, ""
+            for suffix in ("_not", "_lte", "_gte", "_lt", "_gt", "_in"):
+                if key.endswith(suffix):
+                    field, op = key[:-len(suffix)], suffix
+                    break
+            actual = event[field]
+            if field == "timestamp":
+                actual = int(actual)
+                value = [int(v) for v in value] if op == "_in" else int(value)
+            if not _OPERATORS[op](actual, value):
+                return False
+        return True
+
+    def query(self, where: dict, first: int = 100, skip: int = 0,
+              order_by: str = "timestamp", descending: bool = False):
+        """返回满足条件的事件（已序列化的 JSON 字符串列表）
+
+        与子图一致：orderBy 相同的记录再按 id 排序（方向与 orderDirection 相同）
+        """
+        where = where or {}
+        branches = where.get("or")
+        if branches:
+            # or 的每个分支单独定位区间，再合并
+            rest = {k: v for k, v in where.items() if k != "or"}
+            indices = set()
+            for branch in branches:
+                indices.update(self._candidates({**rest, **branch}))
+            indices = sorted(indices)
+        else:
+            indices = self._candidates(where)
+
+        if order_by not in ("timestamp", "id"):
+            raise ValueError(f"unsupported orderBy: {order_by}")
+        if order_by == "id":
+            indices = sorted(indices, key=lambda i: self.events[i]["id"])
+        if descending:
+            indices = indices[::-1]
+        return [self.encoded[i] for i in indices[skip:skip + first]]
+
+    def _candidates(self, where: dict):
+        lo, hi = self._bounds(where)
+        rest = {k: v for k, v in where.items() if not k.startswith("timestamp")}
+        if not rest:
+            return list(range(lo, hi))
+        return [i for i in range(lo, hi) if self._matches(self.events[i], rest)]
+
+
+class MockServer:
+    """Goldsky + Gamma 模拟服务器（线程化 HTTP，绑定 127.0.0.1）"""
+
+    def __init__(self, events=None, markets=None, latency: float = 0.0, jitter: float = 0.0,
+                 rate_limit: float = None, burst: int = 10, retry_after: float = 1.0,
+                 error_rate: float = 0.0, max_page_size: int = None, seed: int = 0):
+        """
+        Args:
+            events: orderFilledEvents 列表（字段与子图一致，数值为字符串）
+            markets: Gamma 市场 JSON 列表
+            latency / jitter: 每个请求的固定延迟和额外随机延迟（秒）
+            rate_limit: 每秒允许的请求数（所有接口共享的令牌桶），None 表示不限速
+            burst: 令牌桶容量
+            retry_after: 429 响应中的 Retry-After 秒数
+            error_rate: 随机返回 500 / 502 / 503 的概率
+            max_page_size: /markets 单页最多返回的条数（模拟 API 对 limit 的上限）
+        """
+        self.store = EventStore(events or [])
+        self.markets = sorted(markets or [], key=lambda m: m.get("createdAt", ""), reverse=True)
+        self.tokens = {}
+        for market in self.markets:
+            token_ids = market.get("clobTokenIds", "[]")
+            for token_id in json.loads(token_ids) if isinstance(token_ids, str) else token_ids:
+                self.tokens.setdefault(str(token_id), market)
+
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.max_page_size = max_page_size
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.bucket_tokens = burst
+        self.bucket_updated = time.monotonic()
+        self.counts = Counter()
+        self.httpd = None
+
+    @classmethod
+    def from_fixtures(cls, fixtures_dir: str, shift_to_now: bool = True, **kwargs):
+        """从 fixtures 目录加载录制数据（events.jsonl + markets.json）
+
+        shift_to_now=True 时把所有时间整体平移，使最新的事件 / 市场对齐到当前时间，
+        这样按“最近 N 天”抓取的代码能够命中录制数据
+        """
+        events, markets = load_fixtures(fixtures_dir)
+        if shift_to_now:
+            events, markets = shift_fixtures(events, markets, time.time())
+        return cls(events, markets, **kwargs)
+
+    # ---- 生命周期 ----
+
+    def start(self, port: int = 0):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self, "GET")
+
+            def do_POST(self):
+                server._handle(self, "POST")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def goldsky_url(self) -> str:
+        return self.base_url + "/goldsky"
+
+    @property
+    def gamma_url(self) -> str:
+        return self.base_url + "/markets"
+
+    def add_events(self, events):
+        """追加新事件（模拟链上持续产生的数据，用于测试 tail 模式）"""
+        store = EventStore(self.store.events + list(events))
+        self.store = store
+
+    def reset_stats(self):
+        with self.lock:
+            self.counts.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+    # ---- 请求处理 ----
+
+    def _take_token(self) -> bool:
+        if self.rate_limit is None:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.bucket_tokens = min(self.burst, self.bucket_tokens + (now - self.bucket_updated) * self.rate_limit)
+            self.bucket_updated = now
+            if self.bucket_tokens >= 1:
+                self.bucket_tokens -= 1
+                return True
+            return False
+
+    def _handle(self, handler, method: str):
+        url = urlparse(handler.path)
+        endpoint = "goldsky" if url.path.startswith("/goldsky") else "gamma"
+        body = handler.rfile.read(int(handler.headers.get("Content-Length") or 0))
+
+        with self.lock:
+            self.counts[f"{endpoint}_requests"] += 1
+            delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0.0)
+            inject_error = self.error_rate > 0 and self.random.random() < self.error_rate
+            error_status = self.random.choice([500, 502, 503])
+        if delay > 0:
+            time.sleep(delay)
+
+        if not self._take_token():
+            self._count(endpoint, 429)
+            return self._send(handler, 429, b'{"error":"rate limited"}', {"Retry-After": f"{self.retry_after:g}"})
+        if inject_error:
+            self._count(endpoint, error_status)
+            return self._send(handler, error_status, b'{"error":"injected"}')
+
+        try:
+            if endpoint == "goldsky" and method == "POST":
+                payload = self._graphql(json.loads(body))
+            elif endpoint == "gamma" and method == "GET":
+                payload = self._markets(parse_qs(url.query))
+            else:
+                self._count(endpoint, 404)
+                return self._send(handler, 404, b'{"error":"not found"}')
+        except Exception as e:
+            self._count(endpoint, 400)
+            return self._send(handler, 400, json.dumps({"errors": [{"message": str(e)}]}).encode())
+
+        self._count(endpoint, 200)
+        self._send(handler, 200, payload)
+
+    def _count(self, endpoint: str, status: int):
+        with self.lock:
+            self.counts[f"{endpoint}_{status}"] += 1
+
+    @staticmethod
+    def _send(handler, status: int, body: bytes, headers: dict = None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        try:
+            handler.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已断开（例如被测进程被中断）
+            pass
+
+    def _graphql(self, request: dict) -> bytes:
+        document = parse(request["query"])
+        results = []
+        for definition in document.definitions:
+            for selection in definition.selection_set.selections:
+                if selection.name.value != "orderFilledEvents":
+                    raise ValueError(f"unsupported field: {selection.name.value}")
+                args = {arg.name.value: _ast_value(arg.value) for arg in selection.arguments}
+                key = selection.alias.value if selection.alias else selection.name.value
+                rows = self.store.query(
+                    args.get("where"),
+                    first=args.get("first", 100),
+                    skip=args.get("skip", 0),
+                    order_by=args.get("orderBy", "id"),
+                    descending=args.get("orderDirection", "asc") == "desc",
+                )
+                results.append(f'"{key}":[{",".join(rows)}]')
+        return ('{"data":{' + ",".join(results) + "}}").encode()
+
+    def _markets(self, params: dict) -> bytes:
+        token_ids = params.get("clob_token_ids")
+        if token_ids:
+            found = {}
+            for token_id in token_ids:
+                market = self.tokens.get(token_id)
+                if market is not None:
+                    found[market["id"]] = market
+            return json.dumps(list(found.values())).encode()
+
+        limit = int(params.get("limit", ["100"])[0])
+        if self.max_page_size:
+            limit = min(limit, self.max_page_size)
+        offset = int(params.get("offset", ["0"])[0])
+        markets = self.markets
+        if params.get("ascending", ["false"])[0] == "true":
+            markets = markets[::-1]
+        return json.dumps(markets[offset:offset + limit]).encode()
+
+
+# ---- fixtures ----
+
+def load_fixtures(fixtures_dir: str):
+    """读取 events.jsonl（每行一个事件）和 markets.json（市场列表）"""
+    events = []
+    events_path = os.path.join(fixtures_dir, EVENTS_FILE)
+    if os.path.isfile(events_path):
+        with open(events_path, "r") as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    markets = []
+    markets_path = os.path.join(fixtures_dir, MARKETS_FILE)
+    if os.path.isfile(markets_path):
+        with open(markets_path, "r") as f:
+            markets = json.load(f)
+    return events, markets
+
+
+def save_fixtures(fixtures_dir: str, events, markets):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    with open(os.path.join(fixtures_dir, EVENTS_FILE), "w") as f:
+        for event in events:
+            f.write(json.dumps(event, separators=(",", ":")) + "\n")
+    with open(os.path.join(fixtures_dir, MARKETS_FILE), "w") as f:
+        json.dump(markets, f)
+
+
+def shift_fixtures(events, markets, now: float):
+    """把事件 timestamp 和市场 createdAt 整体平移，使最新的记录对齐到 now"""
+    latest = max((int(e["timestamp"]) for e in events), default=None)
+    latest_market = max((_created_timestamp(m["createdAt"]) for m in markets if m.get("createdAt")), default=None)
+    candidates = [t for t in (latest, latest_market) if t is not None]
+    if not candidates:
+        return events, markets
+    offset = int(now - max(candidates))
+
+    events = [{**e, "timestamp": str(int(e["timestamp"]) + offset)} for e in events]
+    markets = [
+        {**m, "createdAt": _format_created(_created_timestamp(m["createdAt"]) + offset)} if m.get("createdAt") else m
+        for m in markets
+    ]
+    return events, markets
+
+
+def generate_fixtures(n_events: int = 200_000, n_markets: int = 5_000, days: int = 30,
+                      burst_share: float = 0.05, seed: int = 42):
+    """生成合成数据：市场的创建时间均匀分布在最近 days 天内，事件引用这些市场的 token
+
+    burst_share 比例的事件集中在少数几个时间戳上，用于覆盖同一时间戳超过一页的分页路径
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    start = now - days * 86400
+
+    markets = []
+    for i in range(n_markets):
+        created = start + (now - start) * i // max(n_markets, 1)
+        market_id = str(500_000 + i)
+        tokens = [str(rng.getrandbits(255)) for _ in range(2)]
+        markets.append({
+            "id": market_id,
+            "question": f"Synthetic market {market_id}?",
+            "conditionId": f"0x{rng.getrandbits(256):064x}",
+            "slug": f"synthetic-market-{market_id}",
+            "outcomes": json.dumps(["Yes", "No"]),
+            "clobTokenIds": json.dumps(tokens),
+            "volume": f"{rng.uniform(0, 1e6):.4f}",
+            "createdAt": _format_created(created),
+            "closedTime": None,
+            "negRiskAugmented": False,
+            "events": [{"ticker": f"synthetic-event-{i // 10}"}],
+        })
+
+    token_ids = [token for m in markets for token in json.loads(m["clobTokenIds"])]
+    wallets = [f"0x{rng.getrandbits(160):040x}" for _ in range(max(n_events // 50, 10))]
+    burst_timestamps = [rng.randint(start, now) for _ in range(5)]
+
+    events = []
+    for i in range(n_events):
+        if rng.random() < burst_share:
+            timestamp = rng.choice(burst_timestamps)
+        else:
+            timestamp = rng.randint(start, now)
+        token_id = rng.choice(token_ids)
+        usdc = str(rng.randint(1, 5_000) * 10_000)
+        shares = str(rng.randint(1, 10_000) * 10_000)
+        # 一半是买单（maker 付 USDC），一半是卖单
+        maker_asset, taker_asset = ("0", token_id) if i % 2 == 0 else (token_id, "0")
+        maker_amount, taker_amount = (usdc, shares) if i % 2 == 0 else (shares, usdc)
+        events.append({
+            "fee": "0",
+            "id": f"0x{rng.getrandbits(256):064x}_0x{rng.getrandbits(256):064x}",
+            "maker": rng.choice(wallets),
+            "makerAmountFilled": maker_amount,
+            "makerAssetId": maker_asset,
+            "orderHash": f"0x{rng.getrandbits(256):064x}",
+            "taker": rng.choice(wallets),
+            "takerAmountFilled": taker_amount,
+            "takerAssetId": taker_asset,
+            "timestamp": str(timestamp),
+            "transactionHash": f"0x{rng.getrandbits(256):064x}",
+        })
+    return events, markets
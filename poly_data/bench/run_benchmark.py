@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+抓取性能基准测试（离线，使用 bench/mock_server.py 模拟 Goldsky / Gamma）
+
+每个场景在独立子进程、独立的临时数据目录中运行，通过环境变量把端点指向本地模拟服务器：
+- scrape:          update_goldsky.scrape() 抓取全部 orderFilledEvents
+- update_markets:  update_markets() 抓取市场列表
+- missing_tokens:  update_missing_tokens() 解析一批缺失 token（含一部分不存在的 token）
+
+报告每个场景的记录数、耗时、rows/s、requests/s、429 / 5xx 次数和子进程峰值 RSS。
+
+用法：
+    uv run python -m bench.run_benchmark                               # 合成数据
+    uv run python -m bench.run_benchmark --latency 0.02 --error-rate 0.02 --workers 4
+    uv run python -m bench.run_benchmark --fixtures bench/fixtures     # 回放录制数据
+    uv run python -m bench.run_benchmark --json result.json --baseline baseline.json
+    uv run python -m bench.run_benchmark record bench/fixtures --hours 2   # 从线上接口录制 fixtures
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.mock_server import MockServer, generate_fixtures, load_fixtures, save_fixtures, shift_fixtures
+
+SCENARIOS = ["scrape", "update_markets", "missing_tokens"]
+
+# 与基线相比吞吐下降超过该比例视为性能回退
+REGRESSION_THRESHOLD = 0.2
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值 RSS（MB），Linux 上 ru_maxrss 单位为 KB，macOS 上为字节"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(scenario: str, args) -> dict:
+    """子进程入口：运行单个场景并返回结果（端点和数据目录已由环境变量设置）"""
+    from poly_utils.storage import get_storage
+
+    storage = get_storage()
+    start = time.perf_counter()
+    if scenario == "scrape":
+        from update_utils.update_goldsky import scrape
+        scrape(at_once=args.at_once, days_limit=args.days, workers=args.workers)
+        dataset = "orderFilled"
+    elif scenario == "update_markets":
+        from update_utils.update_markets import update_markets
+        update_markets(days_limit=args.days, workers=args.workers)
+        dataset = "markets"
+    elif scenario == "missing_tokens":
+        from poly_utils.utils import update_missing_tokens
+        with open(args.tokens_file, "r") as f:
+            token_ids = json.load(f)
+        update_missing_tokens(token_ids)
+        dataset = "missing_markets"
+    else:
+        raise ValueError(f"未知场景: {scenario}")
+    elapsed = time.perf_counter() - start
+
+    return {
+        "scenario": scenario,
+        "rows": storage.count_rows(dataset) if storage.exists(dataset) else 0,
+        "seconds": elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def pick_tokens(markets, n_tokens: int, unknown_share: float = 0.2, seed: int = 7):
+    """从 fixtures 市场中抽取 token，并混入一部分不存在的 token（覆盖负缓存路径）"""
+    rng = random.Random(seed)
+    known = [token for m in markets for token in json.loads(m.get("clobTokenIds") or "[]")]
+    n_unknown = int(n_tokens * unknown_share)
+    tokens = rng.sample(known, min(n_tokens - n_unknown, len(known)))
+    tokens += [str(rng.getrandbits(255)) for _ in range(n_unknown)]
+    rng.shuffle(tokens)
+    return tokens
+
+
+def benchmark(args):
+    if args.fixtures:
+        events, markets = load_fixtures(args.fixtures)
+        events, markets = shift_fixtures(events, markets, time.time())
+        print(f"📂 回放 fixtures: {args.fixtures}（{len(events):,} 个事件，{len(markets):,} 个市场）")
+    else:
+        events, markets = generate_fixtures(args.events, args.markets, days=args.days)
+        print(f"🧪 合成数据：{len(events):,} 个事件，{len(markets):,} 个市场，跨度 {args.days} 天")
+
+    server = MockServer(
+        events, markets, latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+        retry_after=args.retry_after, error_rate=args.error_rate, max_page_size=args.max_page_size,
+    ).start()
+    print(f"🌐 模拟服务器: {server.base_url}（延迟 {args.latency * 1000:.0f} ms + 抖动 {args.jitter * 1000:.0f} ms，"
+          f"限速 {args.rate_limit or '无'} req/s，错误率 {args.error_rate:.1%}）")
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="poly_bench_") as work_dir:
+            tokens_file = os.path.join(work_dir, "tokens.json")
+            with open(tokens_file, "w") as f:
+                json.dump(pick_tokens(markets, args.tokens), f)
+
+            for scenario in args.scenarios:
+                data_dir = os.path.join(work_dir, scenario)
+                os.makedirs(data_dir)
+                env = dict(
+                    os.environ,
+                    POLY_DATA_DIR=data_dir,
+                    POLY_STORAGE=args.storage,
+                    POLY_GOLDSKY_URL=server.goldsky_url,
+                    POLY_GAMMA_URL=server.gamma_url,
+                )
+                result_file = os.path.join(work_dir, f"{scenario}.result.json")
+                command = [
+                    sys.executable, "-m", "bench.run_benchmark", "_run", scenario, result_file,
+                    "--days", str(args.days), "--workers", str(args.workers),
+                    "--at-once", str(args.at_once), "--tokens-file", tokens_file,
+                ]
+
+                print(f"\n▶️ {scenario} ...")
+                server.reset_stats()
+                log_path = os.path.join(work_dir, f"{scenario}.log")
+                with open(log_path, "w") as log:
+                    output = None if args.verbose else log
+                    returncode = subprocess.call(command, cwd=ROOT, env=env, stdout=output, stderr=subprocess.STDOUT)
+                if returncode != 0 or not os.path.isfile(result_file):
+                    if not args.verbose:
+                        with open(log_path, "r") as log:
+                            print(log.read()[-3000:])
+                    print(f"❌ {scenario} 失败（退出码 {returncode}）")
+                    continue
+
+                with open(result_file, "r") as f:
+                    result = json.load(f)
+                stats = server.stats()
+                requests = sum(v for k, v in stats.items() if k.endswith("_requests"))
+                result.update({
+                    "requests": requests,
+                    "rate_limited": sum(v for k, v in stats.items() if k.endswith("_429")),
+                    "server_errors": sum(v for k, v in stats.items() if k.endswith(("_500", "_502", "_503"))),
+                    "rows_per_second": result["rows"] / max(result["seconds"], 1e-9),
+                    "requests_per_second": requests / max(result["seconds"], 1e-9),
+                })
+                results.append(result)
+                print(f"✅ {result['rows']:,} 行，{result['seconds']:.2f} 秒，{requests} 个请求")
+    finally:
+        server.stop()
+
+    print_report(results)
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("func", "baseline", "json")},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 结果已保存：{args.json}")
+    if args.baseline:
+        return compare_baseline(results, args.baseline)
+    return 0
+
+
+def print_report(results):
+    print(f"\n{'=' * 92}")
+    print(f"{'场景':<16}{'行数':>10}{'秒':>9}{'rows/s':>12}{'请求':>8}{'req/s':>9}{'429':>6}{'5xx':>6}{'峰值RSS(MB)':>14}")
+    print("-" * 92)
+    for r in results:
+        print(f"{r['scenario']:<16}{r['rows']:>10,}{r['seconds']:>9.2f}{r['rows_per_second']:>12,.0f}"
+              f"{r['requests']:>8}{r['requests_per_second']:>9.1f}{r['rate_limited']:>6}{r['server_errors']:>6}"
+              f"{r['peak_rss_mb']:>14.1f}")
+    print("=" * 92)
+
+
+def compare_baseline(results, baseline_path: str) -> int:
+    """与基线结果比较 rows/s，下降超过 REGRESSION_THRESHOLD 时返回非零退出码"""
+    with open(baseline_path, "r") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"\n📊 与基线比较：{baseline_path}")
+    for r in results:
+        base = baseline.get(r["scenario"])
+        if base is None or base["rows_per_second"] <= 0:
+            continue
+        change = r["rows_per_second"] / base["rows_per_second"] - 1
+        rss_change = r["peak_rss_mb"] / max(base["peak_rss_mb"], 1e-9) - 1
+        flag = "⚠️ 回退" if change < -REGRESSION_THRESHOLD else "✅"
+        regressions += change < -REGRESSION_THRESHOLD
+        print(f"{flag} {r['scenario']}: rows/s {change:+.1%}，峰值 RSS {rss_change:+.1%}")
+    return 1 if regressions else 0
+
+
+def record(args):
+    """从线上 Goldsky / Gamma 录制最近一段时间的数据作为 fixtures"""
+    from update_utils.goldsky_client import GoldskyClient
+    from update_utils.update_goldsky import QUERY_URL, scrape_shard
+    from update_utils.update_markets import make_session, fetch_page
+    from poly_utils.token_resolver import GAMMA_MARKETS_URL
+
+    end = int(time.time())
+    start = end - int(args.hours * 3600)
+    events = []
+
+    def on_page(df):
+        events.extend(df.to_dict('records'))
+
+    client = GoldskyClient(QUERY_URL)
+    try:
+        scrape_shard(client, start, end, on_page)
+    finally:
+        client.close()
+    events = [{key: str(value) for key, value in event.items()} for event in events]
+
+    markets = []
+    session = make_session(1)
+    for offset in range(0, args.market_count, 500):
+        page = fetch_page(session, GAMMA_MARKETS_URL, offset, min(500, args.market_count - offset))
+        if not page:
+            break
+        markets.extend(page)
+    session.close()
+
+    save_fixtures(args.output, events, markets)
+    print(f"✅ 已录制 {len(events):,} 个事件、{len(markets):,} 个市场 → {args.output}")
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv[:1] == ["_run"]:
+        # 子进程：运行单个场景，把结果写入文件
+        parser = argparse.ArgumentParser()
+        parser.add_argument("scenario")
+        parser.add_argument("result_file")
+        parser.add_argument("--days", type=int)
+        parser.add_argument("--workers", type=int)
+        parser.add_argument("--at-once", type=int)
+        parser.add_argument("--tokens-file")
+        args = parser.parse_args(argv[1:])
+        result = run_scenario(args.scenario, args)
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    if argv[:1] == ["record"]:
+        parser = argparse.ArgumentParser(description="从线上接口录制 fixtures")
+        parser.add_argument("output", help="fixtures 输出目录")
+        parser.add_argument("--hours", type=float, default=1.0, help="录制最近多少小时的 orderFilledEvents")
+        parser.add_argument("--market-count", type=int, default=2000, help="录制的市场数量")
+        return record(parser.parse_args(argv[1:]))
+
+    parser = argparse.ArgumentParser(description="离线抓取性能基准测试")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--fixtures", help="录制的 fixtures 目录（events.jsonl + markets.json），默认使用合成数据")
+    parser.add_argument("--events", type=int, default=100_000, help="合成事件数")
+    parser.add_argument("--markets", type=int, default=5_000, help="合成市场数")
+    parser.add_argument("--tokens", type=int, default=400, help="missing_tokens 场景查询的 token 数")
+    parser.add_argument("--days", type=int, default=30, help="数据时间跨度 / 抓取回溯天数")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--at-once", type=int, default=1000, help="Goldsky 每页记录数")
+    parser.add_argument("--storage", choices=["csv", "parquet"], default=os.getenv("POLY_STORAGE", "csv"))
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="每个请求额外的随机延迟上限（秒）")
+    parser.add_argument("--rate-limit", type=float, default=None, help="每秒允许的请求数，超出返回 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After 秒数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 5xx 的概率")
+    parser.add_argument("--max-page-size", type=int, default=None, help="/markets 单页最大条数")
+    parser.add_argument("--json", help="把结果保存为 JSON（可作为之后的 --baseline）")
+    parser.add_argument("--baseline", help="基线结果 JSON，吞吐下降超过 20%% 时以非零状态退出")
+    parser.add_argument("--verbose", action="store_true", help="显示被测代码的输出")
+    return benchmark(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from update_utils.update_markets import update_markets
+from poly_utils.storage import get_storage
 
 def main():
     print("=" * 70)
@@ -16,13 +17,12 @@ def main():
     print("📊 获取最近 180 天的市场数据")
     print("=" * 70 + "\n")
 
-    # 生成 markets.csv 文件
-    # 输出到 /Users/yangsmac/Desktop/poly_data 目录
-    update_markets(csv_filename="/Users/yangsmac/Desktop/poly_data/markets.csv", batch_size=500, days_limit=180)
+    # 输出位置由存储层决定（POLY_DATA_DIR / POLY_STORAGE）
+    update_markets(batch_size=500, days_limit=180)
 
     print("\n" + "=" * 70)
     print("✅ Markets 数据生成完成！")
-    print("📁 输出文件: /Users/yangsmac/Desktop/poly_data/markets.csv")
+    print(f"📁 输出位置: {get_storage().path('markets')}")
     print("=" * 70)
 
 if __name__ == "__main__":
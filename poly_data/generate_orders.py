@@ -9,6 +9,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from update_utils.update_goldsky import update_goldsky
+from poly_utils.storage import get_storage
 
 def main():
     print("=" * 70)
@@ -16,13 +17,12 @@ def main():
     print("📊 获取最近 180 天的订单成交数据")
     print("=" * 70 + "\n")
 
-    # 生成 orderFilled.csv 文件
-    # 输出到 /Users/yangsmac/Desktop/poly_data 目录
+    # 输出位置由存储层决定（POLY_DATA_DIR / POLY_STORAGE）
     update_goldsky(days_limit=180)
 
     print("\n" + "=" * 70)
     print("✅ OrderFilled 数据生成完成！")
-    print("📁 输出文件: /Users/yangsmac/Desktop/poly_data/orderFilled.csv")
+    print(f"📁 输出位置: {get_storage().path('orderFilled')}")
     print("=" * 70)
 
 if __name__ == "__main__":
@@ -9,6 +9,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from update_utils.process_live import process_live
+from poly_utils.storage import get_storage
 
 def main():
     print("=" * 70)
@@ -16,23 +17,23 @@ def main():
     print("📊 基于 orderFilled.csv 生成处理后的交易数据")
     print("=" * 70 + "\n")
 
-    # 检查 orderFilled.csv 是否存在
-    if not os.path.exists("/Users/yangsmac/Desktop/poly_data/orderFilled.csv"):
-        print("❌ 错误：找不到 /Users/yangsmac/Desktop/poly_data/orderFilled.csv 文件")
+    storage = get_storage()
+
+    # 检查 orderFilled 数据是否存在
+    if not storage.exists('orderFilled'):
+        print(f"❌ 错误：找不到 {storage.path('orderFilled')}")
         print("请先运行 generate_orders.py 生成订单数据")
         sys.exit(1)
 
-    print("✓ 找到 /Users/yangsmac/Desktop/poly_data/orderFilled.csv 文件")
+    print(f"✓ 找到 {storage.path('orderFilled')}")
     print()
 
-    # 生成 trades.csv 文件
-    # 输入: /Users/yangsmac/Desktop/poly_data/orderFilled.csv
-    # 输出: /Users/yangsmac/Desktop/poly_data/trades.csv
+    # 生成 trades 数据（输入输出位置由存储层决定）
     process_live()
 
     print("\n" + "=" * 70)
     print("✅ Trades 数据生成完成！")
-    print("📁 输出文件: /Users/yangsmac/Desktop/poly_data/trades.csv")
+    print(f"📁 输出位置: {storage.path('trades')}")
     print("=" * 70)
 
 if __name__ == "__main__":
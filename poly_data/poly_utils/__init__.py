@@ -1,2 +1,6 @@
 """Utility helpers shared across update scripts."""
-from .utils import *
\ No newline at end of file
+from .utils import *
+from .storage import get_storage, scan_dataset, scan_trades, decode_trades, wallet_code, DATA_DIR
+from .token_index import load_token_index
+from .wallet_index import load_wallet_index, wallet_fills
+from .pnl import position_pnl, pnl_leaderboard
@@ -0,0 +1,109 @@
+"""
+钱包地址、交易哈希等长字符串列的持久化整数编码字典
+
+trades 的 maker / taker（共用 wallet 字典）和 transactionHash（transaction 字典）以 UInt32 编码存储，
+字典保存在 {data_dir}/dictionaries.sqlite，每个字典一张表：
+- 只追加：编码一经分配永不改变，已写入的数据随时可以解码
+- 0x 开头的小写十六进制值按字节（BLOB）存储，体积约为字符串的一半
+- 编码 / 解码都按批次处理：一批中的不同值放入临时表，与字典表 join 一次完成
+
+写入 trades 时由存储层自动编码（见 Storage.sink / append），读取得到的是编码；
+显示时用 decode_trades() 解码，按地址过滤时用 wallet_code() 取编码。
+"""
+import os
+import sqlite3
+import threading
+import polars as pl
+
+DICTIONARY_FILE = "dictionaries.sqlite"
+CODE_DTYPE = pl.UInt32
+
+_stores = {}
+_lock = threading.Lock()
+
+
+def _to_key(value: str):
+    """0x 开头的小写十六进制字符串转为字节，其他值原样保存"""
+    if value.startswith("0x") and len(value) % 2 == 0 and value == value.lower():
+        try:
+            return bytes.fromhex(value[2:])
+        except ValueError:
+            pass
+    return value
+
+
+def _from_key(key) -> str:
+    return "0x" + key.hex() if isinstance(key, bytes) else key
+
+
+class DictionaryStore:
+    """一个 SQLite 文件中的所有字典，所有方法线程安全"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TEMP TABLE batch_keys (value PRIMARY KEY)")
+        self.conn.execute("CREATE TEMP TABLE batch_codes (code INTEGER PRIMARY KEY)")
+        self.tables = set()
+
+    def _table(self, name: str) -> str:
+        if name not in self.tables:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "dict_{name}" (code INTEGER PRIMARY KEY, value NOT NULL UNIQUE)')
+            self.tables.add(name)
+        return f'"dict_{name}"'
+
+    def _codes(self, name: str, keys, insert: bool) -> dict:
+        """keys → 编码；insert=True 时为新值分配编码（追加到字典末尾）"""
+        table = self._table(name)
+        self.conn.execute("DELETE FROM batch_keys")
+        self.conn.executemany("INSERT OR IGNORE INTO batch_keys (value) VALUES (?)", ((key,) for key in keys))
+        if insert:
+            self.conn.execute(f"INSERT OR IGNORE INTO {table} (value) SELECT value FROM batch_keys")
+        rows = self.conn.execute(f"SELECT b.value, d.code FROM batch_keys b JOIN {table} d ON d.value = b.value")
+        return dict(rows.fetchall())
+
+    def encode(self, name: str, values: pl.Series) -> pl.Series:
+        """字符串列 → 编码列，新值追加到字典"""
+        uniques = values.drop_nulls().unique().to_list()
+        keys = [_to_key(value) for value in uniques]
+        with self.lock:
+            try:
+                codes = self._codes(name, keys, insert=True)
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        return values.replace_strict(uniques, [codes[key] for key in keys], default=None, return_dtype=CODE_DTYPE)
+
+    def lookup(self, name: str, values) -> list:
+        """查询一组值的编码（不存在的值为 None），不修改字典"""
+        keys = [_to_key(value) for value in values]
+        with self.lock:
+            codes = self._codes(name, keys, insert=False)
+            self.conn.rollback()
+        return [codes.get(key) for key in keys]
+
+    def decode(self, name: str, codes: pl.Series) -> pl.Series:
+        """编码列 → 字符串列"""
+        uniques = codes.drop_nulls().unique().to_list()
+        table = self._table(name)
+        with self.lock:
+            self.conn.execute("DELETE FROM batch_codes")
+            self.conn.executemany("INSERT INTO batch_codes (code) VALUES (?)", ((code,) for code in uniques))
+            rows = self.conn.execute(f"SELECT d.code, d.value FROM batch_codes b JOIN {table} d ON d.code = b.code").fetchall()
+            self.conn.rollback()
+        return codes.replace_strict(
+            [code for code, _ in rows], [_from_key(value) for _, value in rows], default=None, return_dtype=pl.Utf8
+        )
+
+
+def open_dictionaries(data_dir: str) -> DictionaryStore:
+    """获取数据目录下的字典（同一进程内共享一个连接）"""
+    path = os.path.join(data_dir, DICTIONARY_FILE)
+    with _lock:
+        if path not in _stores:
+            _stores[path] = DictionaryStore(path)
+        return _stores[path]
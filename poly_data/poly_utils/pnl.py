@@ -0,0 +1,147 @@
+"""
+所有钱包的 PnL：一次流式聚合 trades，得到每个钱包的持仓、VWAP、已实现 / 未实现盈亏和排行榜
+
+与 Example 1 Trader Analysis.ipynb 中的单钱包计算口径一致：
+- last_price：每个 (market_id, nonusdc_side) 最后一笔成交的价格，> 0.98 视为已赎回（1.0），< 0.02 视为归零（0.0）；
+  最后时刻有多笔成交时取价格最高的一笔，保证结果与存储顺序无关
+- 按钱包方向（maker_direction / taker_direction）累计买入 / 卖出的 USD、token 数量和名义金额
+- cash_pnl_usd = 卖出 USD - 买入 USD（已实现的现金流）
+- unrealized_usd = 持仓 token × last_price，total_pnl_usd 为两者之和
+
+trades 只扫描一次：按 (钱包, market_id, nonusdc_side) 分组聚合时顺带记录每组最后一笔的时间和价格，
+每笔 trade 恰好属于一个 maker（或 taker），last_price 由这些分组结果推出，后续计算都在聚合结果上进行。
+
+用法：
+    board = pnl_leaderboard()                      # 所有 maker 的排行榜，按 total_pnl_usd 降序
+    positions = position_pnl().collect()           # (wallet, market_id, side) 粒度
+    pnl_leaderboard(scan_trades(start="2025-01-01"))  # 只统计一段时间（last_price 也取自该窗口）
+"""
+import polars as pl
+from .storage import get_storage, DATASETS
+
+REDEEMED_ABOVE = 0.98   # last_price 高于此值视为已赎回，按 1.0 计价
+WORTHLESS_BELOW = 0.02  # last_price 低于此值视为归零，按 0.0 计价
+ROLES = ("maker", "taker")
+
+
+def _trades(lf, storage):
+    return lf if lf is not None else (storage or get_storage()).scan("trades")
+
+
+def clamp_last_price(expr: pl.Expr) -> pl.Expr:
+    """赎回近似：接近 1 / 0 的最后成交价按 1.0 / 0.0 计"""
+    return (
+        pl.when(expr > REDEEMED_ABOVE).then(pl.lit(1.0))
+        .when(expr < WORTHLESS_BELOW).then(pl.lit(0.0))
+        .otherwise(expr)
+    )
+
+
+def position_pnl(lf: pl.LazyFrame = None, role: str = "maker", storage=None) -> pl.LazyFrame:
+    """
+    每个 (wallet, market_id, side) 的持仓和盈亏（LazyFrame，wallet 为 trades 中的钱包编码）
+
+    lf 默认为整个 trades 数据集，也可以传入 scan_trades(...) 等过滤后的 LazyFrame
+    """
+    if role not in ROLES:
+        raise ValueError(f"role 必须是 {ROLES} 之一: {role}")
+    buy = pl.col(f"{role}_direction") == "BUY"
+    sell = pl.col(f"{role}_direction") == "SELL"
+    notional = pl.col("price") * pl.col("token_amount")
+
+    positions = (
+        _trades(lf, storage)
+        .select(pl.col(role).alias("wallet"), "market_id", pl.col("nonusdc_side").alias("side"),
+                "timestamp", "price", "token_amount", "usd_amount", buy.alias("_buy"), sell.alias("_sell"))
+        .group_by(["wallet", "market_id", "side"])
+        .agg(
+            pl.when(pl.col("_buy")).then(pl.col("usd_amount")).otherwise(0.0).sum().alias("buy_usd"),
+            pl.when(pl.col("_sell")).then(pl.col("usd_amount")).otherwise(0.0).sum().alias("sell_usd"),
+            pl.when(pl.col("_buy")).then(pl.col("token_amount")).otherwise(0.0).sum().alias("buy_tokens"),
+            pl.when(pl.col("_sell")).then(pl.col("token_amount")).otherwise(0.0).sum().alias("sell_tokens"),
+            pl.when(pl.col("_buy")).then(notional).otherwise(0.0).sum().alias("buy_notional"),
+            pl.when(pl.col("_sell")).then(notional).otherwise(0.0).sum().alias("sell_notional"),
+            pl.len().alias("trades"),
+            pl.col("timestamp").max().alias("last_trade_ts"),
+            pl.col("price").sort_by(["timestamp", "price"]).last().alias("_last_fill_price"),
+        )
+    )
+
+    # 市场最后成交价 = 最后一笔成交所在分组的最后价格
+    last_prices = (
+        positions
+        .group_by(["market_id", "side"])
+        .agg(pl.col("_last_fill_price").sort_by(["last_trade_ts", "_last_fill_price"]).last().alias("last_price"))
+        .with_columns(clamp_last_price(pl.col("last_price")).alias("last_price"))
+    )
+
+    return (
+        positions
+        .drop("_last_fill_price")
+        .join(last_prices, on=["market_id", "side"], how="left")
+        .with_columns(
+            (pl.col("sell_usd") - pl.col("buy_usd")).alias("cash_pnl_usd"),
+            (pl.col("buy_tokens") - pl.col("sell_tokens")).alias("inventory_tokens"),
+        )
+        .with_columns(
+            (pl.col("inventory_tokens") * pl.col("last_price")).alias("unrealized_usd"),
+        )
+        .with_columns(
+            (pl.col("cash_pnl_usd") + pl.col("unrealized_usd")).alias("total_pnl_usd"),
+            # VWAP
+            pl.when(pl.col("buy_tokens") > 0).then(pl.col("buy_notional") / pl.col("buy_tokens")).alias("avg_buy_price"),
+            pl.when(pl.col("sell_tokens") > 0).then(pl.col("sell_notional") / pl.col("sell_tokens")).alias("avg_sold_price_only"),
+            # 剩余持仓按 last_price 平仓时的综合卖出均价
+            pl.when(pl.col("buy_tokens") > 0)
+            .then((pl.col("sell_notional") + pl.col("inventory_tokens") * pl.col("last_price")) / pl.col("buy_tokens"))
+            .alias("avg_sell_price"),
+        )
+    )
+
+
+def pnl_leaderboard(lf: pl.LazyFrame = None, role: str = "maker", storage=None, decode: bool = True) -> pl.DataFrame:
+    """
+    所有钱包的 PnL 排行榜（按 total_pnl_usd 降序），每个钱包一行
+
+    markets_won / win_rate 按市场（合并两个 side）的 total_pnl_usd > 0 统计；
+    open_positions 为仍有持仓且未归零的 (market_id, side) 数。decode 为 True 时 wallet 列还原为地址
+    """
+    storage = storage or get_storage()
+    markets = (
+        position_pnl(lf, role, storage)
+        .group_by(["wallet", "market_id"])
+        .agg(
+            pl.col("trades").sum(),
+            pl.col("buy_usd").sum(),
+            pl.col("sell_usd").sum(),
+            pl.col("cash_pnl_usd").sum(),
+            pl.col("unrealized_usd").sum(),
+            pl.col("total_pnl_usd").sum(),
+            ((pl.col("inventory_tokens") > 0) & (pl.col("last_price") > 0)).sum().alias("open_positions"),
+            pl.col("last_trade_ts").max(),
+        )
+    )
+    board = (
+        markets
+        .group_by("wallet")
+        .agg(
+            pl.len().alias("markets_traded"),
+            (pl.col("total_pnl_usd") > 0).sum().alias("markets_won"),
+            pl.col("trades").sum(),
+            pl.col("buy_usd").sum(),
+            pl.col("sell_usd").sum(),
+            (pl.col("buy_usd") + pl.col("sell_usd")).sum().alias("volume_usd"),
+            pl.col("cash_pnl_usd").sum(),
+            pl.col("unrealized_usd").sum(),
+            pl.col("total_pnl_usd").sum(),
+            pl.col("open_positions").sum(),
+            pl.col("last_trade_ts").max(),
+        )
+        .with_columns((pl.col("markets_won") / pl.col("markets_traded")).alias("win_rate"))
+        .sort(["total_pnl_usd", "wallet"], descending=[True, False])
+        .collect(streaming=True)
+    )
+    if decode and board.schema["wallet"].is_integer():
+        name = DATASETS["trades"]["dictionaries"][role]
+        board = board.with_columns(storage.dictionaries.decode(name, board["wallet"]).alias("wallet"))
+    return board
@@ -0,0 +1,1170 @@
+"""
+可插拔的数据存储层
+
+orderFilled、trades、markets、missing_markets 四个数据集的读写都经过这里：
+- csv: 与原来一致的单个 CSV 文件（默认）
+- parquet: 按时间分区的 Parquet 数据集，列类型固定；资产 ID、钱包地址等字符串列
+  以字典编码存储，并写入 min/max 统计信息，扫描时可以做谓词下推和投影下推。
+  trades 按天分区、分区内按 market_id 排序，每个文件的 min/max 记录在目录下的 _parts.json，
+  scan_filtered() / scan_trades() 按市场和时间范围跳过无关文件
+
+trades 的钱包地址和交易哈希以整数编码存储（见 poly_utils.dictionary），写入时自动编码，
+decode_trades() 解码用于显示，wallet_code() 把地址转换为编码用于过滤。
+
+通过环境变量 POLY_STORAGE=csv|parquet 选择后端，POLY_DATA_DIR 指定数据目录。
+"""
+import io
+import os
+import csv
+import json
+import glob
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import polars as pl
+from .dictionary import open_dictionaries, CODE_DTYPE
+
+DATA_DIR = os.getenv("POLY_DATA_DIR", "/Users/yangsmac/Desktop/poly_data")
+STORAGE_BACKEND = os.getenv("POLY_STORAGE", "csv")
+
+# manifest 格式版本，数据集 schema 变化时递增，旧 manifest 会被自动重建
+SCHEMA_VERSION = 1
+
+# 分区粒度 → 分区目录名中的日期格式
+PARTITION_FORMATS = {"month": "%Y-%m", "day": "%Y-%m-%d"}
+
+# 排序后写入的数据集使用较小的 row group，文件内也能按 min/max 跳过无关的 row group
+SORTED_ROW_GROUP_SIZE = 16 * 1024
+
+# Parquet 数据集目录下记录每个 part 文件行数和 min/max 的文件
+PARTS_FILE = "_parts.json"
+
+# 写入时分批编码字典列，每批的行数
+ENCODE_BATCH_ROWS = 1_000_000
+
+MARKET_SCHEMA = {
+    "createdAt": pl.Utf8,
+    "id": pl.Int64,
+    "question": pl.Utf8,
+    "answer1": pl.Utf8,
+    "answer2": pl.Utf8,
+    "neg_risk": pl.Boolean,
+    "market_slug": pl.Utf8,
+    "token1": pl.Utf8,      # 76 位数字 ID → 字符串（字典编码）
+    "token2": pl.Utf8,
+    "condition_id": pl.Utf8,
+    "volume": pl.Float64,
+    "ticker": pl.Utf8,
+    "closedTime": pl.Utf8,
+}
+
+# 每个数据集的列类型、时间列以及 Parquet 分区粒度
+DATASETS = {
+    "orderFilled": {
+        "file": "orderFilled.csv",
+        "schema": {
+            "fee": pl.Int64,
+            "id": pl.Utf8,
+            "maker": pl.Utf8,
+            "makerAmountFilled": pl.Int64,
+            "makerAssetId": pl.Utf8,
+            "orderHash": pl.Utf8,
+            "taker": pl.Utf8,
+            "takerAmountFilled": pl.Int64,
+            "takerAssetId": pl.Utf8,
+            "timestamp": pl.Int64,  # Unix 秒
+            "transactionHash": pl.Utf8,
+        },
+        "time_column": "timestamp",
+        "partition": "month",
+    },
+    "trades": {
+        "file": "trades.csv",
+        "schema": {
+            "timestamp": pl.Datetime("us"),
+            "market_id": pl.Int64,
+            "maker": CODE_DTYPE,    # wallet 字典编码
+            "taker": CODE_DTYPE,
+            "nonusdc_side": pl.Utf8,
+            "maker_direction": pl.Utf8,
+            "taker_direction": pl.Utf8,
+            "price": pl.Float64,
+            "usd_amount": pl.Float64,
+            "token_amount": pl.Float64,
+            "transactionHash": CODE_DTYPE,  # transaction 字典编码
+        },
+        "time_column": "timestamp",
+        "partition": "day",
+        # 分区内按市场排序，单个市场的数据集中在少数 row group 中
+        "sort_by": ["market_id", "timestamp"],
+        # 除时间列外，额外在 _parts.json 中记录 min/max 的列
+        "stats_columns": ["market_id"],
+        # 以整数编码存储的列 → 字典名（maker / taker 共用一个字典，编码可以直接比较）
+        "dictionaries": {"maker": "wallet", "taker": "wallet", "transactionHash": "transaction"},
+    },
+    "markets": {
+        "file": "markets.csv",
+        "schema": MARKET_SCHEMA,
+        "time_column": "createdAt",
+        "partition": None,
+    },
+    "missing_markets": {
+        "file": "missing_markets.csv",
+        "schema": MARKET_SCHEMA,
+        "time_column": "createdAt",
+        "partition": None,
+    },
+}
+
+
+def _parse_overrides(schema, header):
+    """CSV 解析时直接指定类型的列：字符串列（避免长数字 ID 被推断成数字）和布尔列"""
+    return {col: dtype for col, dtype in schema.items() if col in header and dtype in (pl.Utf8, pl.Boolean)}
+
+
+def _apply_schema(frame, schema):
+    """把 DataFrame / LazyFrame 中已有的列转换为数据集定义的类型"""
+    current = frame.collect_schema()
+    # 只转换类型不同的列：类型相同的 cast 也会挡住 Parquet 扫描的谓词下推
+    return frame.with_columns([
+        pl.col(col).cast(dtype, strict=False) for col, dtype in schema.items() if col in current and current[col] != dtype
+    ])
+
+
+def rows_to_frame(dataset: str, rows) -> pl.DataFrame:
+    """把按数据集列顺序排列的行（list）转换为带类型的 DataFrame"""
+    return pl.DataFrame(rows, schema=DATASETS[dataset]["schema"], orient="row", strict=False)
+
+
+def conform_frame(dataset: str, frame):
+    """把 DataFrame / LazyFrame 转换为数据集定义的列（按 schema 顺序）和类型"""
+    schema = DATASETS[dataset]["schema"]
+    columns = frame.collect_schema().names() if isinstance(frame, pl.LazyFrame) else frame.columns
+    return _apply_schema(frame, schema).select([col for col in schema if col in columns])
+
+
+def _json_value(value):
+    """manifest 中的值需要可以写入 JSON：时间类型转为 ISO 字符串"""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _empty_stats():
+    return {"rows": 0, "min_time": None, "max_time": None, "last_id": None}
+
+
+def _merge_stats(stats, new):
+    """把新追加数据的统计信息合并进已有统计（last_id 取最后追加的数据）"""
+    if not new["rows"]:
+        return stats
+    stats["rows"] += new["rows"]
+    if new["min_time"] is not None:
+        stats["min_time"] = new["min_time"] if stats["min_time"] is None else min(stats["min_time"], new["min_time"])
+    if new["max_time"] is not None:
+        stats["max_time"] = new["max_time"] if stats["max_time"] is None else max(stats["max_time"], new["max_time"])
+    if new["last_id"] is not None:
+        stats["last_id"] = new["last_id"]
+    return stats
+
+
+def _frame_stats(dataset: str, frame) -> dict:
+    """计算 DataFrame / LazyFrame 的行数、时间列 min/max 和最后一个 id"""
+    time_column = DATASETS[dataset]["time_column"]
+    columns = frame.collect_schema().names()
+    exprs = [pl.len().alias("rows")]
+    if time_column in columns:
+        exprs += [pl.col(time_column).min().alias("min_time"), pl.col(time_column).max().alias("max_time")]
+    if "id" in columns:
+        exprs.append(pl.col("id").last().alias("last_id"))
+    row = frame.lazy().select(exprs).collect().row(0, named=True)
+    stats = _empty_stats()
+    stats.update({key: _json_value(value) for key, value in row.items()})
+    return stats
+
+
+def _time_bound(dataset: str, value):
+    """把时间范围的端点（datetime、ISO 字符串或 Unix 秒）转换为时间列的类型"""
+    dtype = DATASETS[dataset]["schema"][DATASETS[dataset]["time_column"]]
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if dtype == pl.Int64:
+        return int(value.timestamp()) if isinstance(value, datetime) else int(value)
+    if isinstance(dtype, pl.Datetime):
+        if not isinstance(value, datetime):
+            value = datetime.fromtimestamp(value, tz=timezone.utc)
+        # 时间列不带时区，按 UTC 存储
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+    raise ValueError(f"{dataset} 的时间列类型为 {dtype}，不支持按时间范围过滤")
+
+
+def _filter_expr(dataset: str, start=None, end=None, filters: dict = None):
+    """时间范围 [start, end) 和列过滤（单个值或值列表）组成的过滤条件，没有条件时返回 None"""
+    time_column = DATASETS[dataset]["time_column"]
+    conditions = []
+    if start is not None:
+        conditions.append(pl.col(time_column) >= _time_bound(dataset, start))
+    if end is not None:
+        conditions.append(pl.col(time_column) < _time_bound(dataset, end))
+    for col, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(pl.col(col).is_in(list(value)))
+        else:
+            conditions.append(pl.col(col) == value)
+    return pl.all_horizontal(conditions) if conditions else None
+
+
+class Storage:
+    """存储后端的公共接口"""
+
+    backend = None
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+
+    def schema(self, dataset: str):
+        return DATASETS[dataset]["schema"]
+
+    def path(self, dataset: str) -> str:
+        raise NotImplementedError
+
+    def exists(self, dataset: str) -> bool:
+        raise NotImplementedError
+
+    def header(self, dataset: str):
+        """已存储数据的列顺序，数据集为空时返回 None"""
+        return list(self.schema(dataset)) if self.exists(dataset) else None
+
+    def scan(self, dataset: str) -> pl.LazyFrame:
+        """返回带类型的 LazyFrame，过滤和列选择会尽量下推到存储层"""
+        raise NotImplementedError
+
+    def scan_filtered(self, dataset: str, start=None, end=None, **filters) -> pl.LazyFrame:
+        """
+        按时间范围 [start, end) 和列的取值过滤，例如 scan_filtered("trades", "2025-01-01", market_id=12345)
+
+        默认实现是带过滤条件的 scan()；分区存储会先根据每个文件的 min/max 跳过无关文件
+        """
+        lf = self.scan(dataset)
+        condition = _filter_expr(dataset, start, end, filters)
+        return lf if condition is None else lf.filter(condition)
+
+    def manifest_path(self, dataset: str) -> str:
+        raise NotImplementedError
+
+    def data_bytes(self, dataset: str) -> int:
+        """数据文件的总字节数，用于校验 manifest 是否与数据一致"""
+        raise NotImplementedError
+
+    def manifest(self, dataset: str) -> dict:
+        """
+        数据集的 manifest：行数、时间列 min/max、最后一个 id、schema 版本和字节数
+
+        由写入方法原子地更新，读取为 O(1)；manifest 缺失或与数据字节数不一致时（例如被外部程序修改）
+        全量扫描一次重建
+        """
+        if not self.exists(dataset):
+            return dict(_empty_stats(), schema_version=SCHEMA_VERSION, bytes=0)
+
+        path = self.manifest_path(dataset)
+        if os.path.isfile(path):
+            try:
+                with open(path, "r") as f:
+                    manifest = json.load(f)
+                if manifest.get("schema_version") == SCHEMA_VERSION and manifest.get("bytes") == self.data_bytes(dataset):
+                    return manifest
+            except (OSError, ValueError):
+                pass
+
+        print(f"🔨 重建 manifest：{self.path(dataset)}")
+        manifest = _frame_stats(dataset, self.scan(dataset))
+        self._save_manifest(dataset, manifest)
+        return manifest
+
+    def _save_manifest(self, dataset: str, manifest: dict):
+        manifest["schema_version"] = SCHEMA_VERSION
+        manifest["bytes"] = self.data_bytes(dataset)
+        path = self.manifest_path(dataset)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def _record_append(self, dataset: str, before: dict, stats: dict):
+        # 数据写完之后再更新 manifest；中途崩溃时字节数对不上，下次读取会自动重建
+        if stats["rows"]:
+            self._save_manifest(dataset, _merge_stats(dict(before), stats))
+
+    def append(self, dataset: str, df: pl.DataFrame):
+        if len(df) == 0:
+            return
+        df = self.encode(dataset, df)
+        before = self.manifest(dataset)
+        self._append(dataset, df)
+        self._record_append(dataset, before, _frame_stats(dataset, df))
+
+    def _append(self, dataset: str, df: pl.DataFrame):
+        raise NotImplementedError
+
+    def clear(self, dataset: str):
+        self._clear(dataset)
+        path = self.manifest_path(dataset)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def _clear(self, dataset: str):
+        raise NotImplementedError
+
+    def rollback(self, dataset: str, position, manifest: dict):
+        """
+        撤销 position 之后追加的数据（例如追加过程中崩溃），position / manifest 为追加前记录的值；
+        position 为 None 表示追加前数据集不存在
+        """
+        if position is None:
+            self.clear(dataset)
+            return
+        self._truncate(dataset, position)
+        self._save_manifest(dataset, dict(manifest))
+
+    def _truncate(self, dataset: str, position: int):
+        raise NotImplementedError
+
+    def last_row(self, dataset: str):
+        """返回最后追加的一行（dict），数据集为空时返回 None"""
+        raise NotImplementedError
+
+    def iter_batches(self, dataset: str, columns, batch_size: int = 1_000_000):
+        """按批次流式读取指定列，每批为一个 DataFrame"""
+        raise NotImplementedError
+
+    def position(self, dataset: str) -> int:
+        """当前写入位置（只增不减），可作为增量读取的检查点"""
+        raise NotImplementedError
+
+    def scan_since(self, dataset: str, position: int = 0):
+        """
+        读取检查点 position 之后追加的数据，返回 (LazyFrame, 新的检查点)
+
+        position 为 0 表示从头读取；检查点与当前数据不匹配（例如文件被重写）时抛出 ValueError
+        """
+        raise NotImplementedError
+
+    def iter_located(self, dataset: str, columns, position: int = 0):
+        """
+        按批次读取检查点 position 之后的数据（指定列），每批额外带有行位置列 location / row
+
+        (location, row) 可以交给 take() 取回对应的整行，用于构建二级索引
+        """
+        raise NotImplementedError
+
+    def take(self, dataset: str, locations: pl.DataFrame) -> pl.DataFrame:
+        """按 iter_located() 给出的 (location, row) 取回整行，读取量与行数成正比而不是与数据集大小成正比"""
+        raise NotImplementedError
+
+    def count_rows(self, dataset: str) -> int:
+        """数据行数（不含表头），来自 manifest"""
+        return self.manifest(dataset)["rows"]
+
+    def sink(self, dataset: str, lf: pl.LazyFrame) -> int:
+        """用流式引擎执行 LazyFrame 并追加到数据集，返回写入的行数"""
+        before = self.manifest(dataset)
+        if self._needs_encoding(dataset, lf):
+            with self._encoded(dataset, lf) as encoded:
+                stats = self._sink(dataset, encoded)
+        else:
+            stats = self._sink(dataset, lf)
+        self._record_append(dataset, before, stats)
+        return stats["rows"]
+
+    @property
+    def dictionaries(self):
+        return open_dictionaries(self.data_dir)
+
+    def _needs_encoding(self, dataset: str, frame) -> bool:
+        schema = frame.collect_schema()
+        return any(schema.get(col) == pl.Utf8 for col in DATASETS[dataset].get("dictionaries", {}))
+
+    def encode(self, dataset: str, df: pl.DataFrame) -> pl.DataFrame:
+        """把字典列（字符串）转换为编码，新值追加到字典"""
+        if not self._needs_encoding(dataset, df):
+            return df
+        return df.with_columns([
+            self.dictionaries.encode(name, df[col]).alias(col)
+            for col, name in DATASETS[dataset]["dictionaries"].items()
+            if df.schema.get(col) == pl.Utf8
+        ])
+
+    def decode(self, dataset: str, df: pl.DataFrame) -> pl.DataFrame:
+        """把字典列的编码还原为字符串（用于显示，只适合结果集而不是整个数据集）"""
+        return df.with_columns([
+            self.dictionaries.decode(name, df[col]).alias(col)
+            for col, name in DATASETS[dataset].get("dictionaries", {}).items()
+            if col in df.columns and df.schema[col].is_integer()
+        ])
+
+    @contextmanager
+    def _encoded(self, dataset: str, lf: pl.LazyFrame, batch_rows: int = ENCODE_BATCH_ROWS):
+        """
+        流式执行 lf 并分批编码字典列，产出编码后数据的 LazyFrame
+
+        先写到临时 Parquet 文件，再逐批读取、编码、写出，内存占用只与批大小有关；临时文件在退出时删除
+        """
+        tmp_dir = os.path.join(self.data_dir, f"{dataset}.encode.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            raw_path = os.path.join(tmp_dir, "raw.parquet")
+            lf.sink_parquet(raw_path)
+            raw = pl.scan_parquet(raw_path)
+            rows = raw.select(pl.len()).collect().item()
+            paths = []
+            for offset in range(0, rows, batch_rows):
+                path = os.path.join(tmp_dir, f"encoded-{len(paths):06d}.parquet")
+                self.encode(dataset, raw.slice(offset, batch_rows).collect()).write_parquet(path)
+                paths.append(path)
+            yield pl.scan_parquet(paths) if paths else self.encode(dataset, raw.collect()).lazy()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def is_encoded(self, dataset: str) -> bool:
+        """已存储的数据中字典列是否为编码（旧版本写入的 trades 为字符串，需要重新生成）"""
+        columns = DATASETS[dataset].get("dictionaries", {})
+        if not columns or not self.exists(dataset):
+            return True
+        schema = self._stored_schema(dataset)
+        return all(schema[col].is_integer() for col in columns if col in schema)
+
+    def _stored_schema(self, dataset: str) -> pl.Schema:
+        """数据文件中实际的列类型"""
+        raise NotImplementedError
+
+    def _sink(self, dataset: str, lf: pl.LazyFrame) -> dict:
+        """写入数据并返回新数据的统计信息"""
+        df = lf.collect(streaming=True)
+        if len(df):
+            self._append(dataset, df)
+        return _frame_stats(dataset, df)
+
+    def write(self, dataset: str, df: pl.DataFrame):
+        """原子地覆盖写入整个数据集"""
+        if len(df) == 0:
+            self.clear(dataset)
+            return
+        self._replace(dataset, df)
+        self._save_manifest(dataset, _frame_stats(dataset, df))
+
+    def _replace(self, dataset: str, df: pl.DataFrame):
+        raise NotImplementedError
+
+    def upsert(self, dataset: str, df: pl.DataFrame, key: str = "id"):
+        """
+        按 key 插入或更新，返回 (新增行数, 更新行数)
+
+        只有新增行时直接追加；已有行的字段有变化时更新到原来的位置，并原子地重写整个数据集
+        （仅适合 markets 这类小数据集）
+        """
+        df = df.unique(subset=key, keep="first", maintain_order=True)
+        if len(df) == 0:
+            return 0, 0
+        if not self.exists(dataset):
+            self.append(dataset, df)
+            return len(df), 0
+
+        existing = self.scan(dataset).collect()
+        columns = [col for col in existing.columns if col in df.columns]
+        df = _apply_schema(df, self.schema(dataset)).select(columns)
+
+        is_existing = df[key].is_in(existing[key].implode())
+        new_rows = df.filter(~is_existing)
+        candidates = df.filter(is_existing)
+
+        # 与已存储的行逐行比较（行哈希），只保留真正有变化的行
+        old_rows = existing.filter(pl.col(key).is_in(candidates[key].implode())).select(columns)
+        changed = candidates.with_columns(candidates.hash_rows().alias("__hash")).join(
+            old_rows.with_columns(old_rows.hash_rows().alias("__hash")).select([key, "__hash"]),
+            on=[key, "__hash"],
+            how="anti",
+        ).drop("__hash")
+
+        if len(changed) == 0:
+            self.append(dataset, new_rows)
+            return len(new_rows), 0
+
+        merged = existing.update(changed, on=key, include_nulls=True)
+        self.write(dataset, pl.concat([merged, new_rows.select(merged.columns)]) if len(new_rows) else merged)
+        return len(new_rows), len(changed)
+
+    def append_csv_bytes(self, dataset: str, header, chunks):
+        """追加一系列无表头的 CSV 字节块（列顺序为 header）"""
+        before = self.manifest(dataset)
+        stats = _empty_stats()
+
+        def tracked_chunks():
+            for chunk in chunks:
+                _merge_stats(stats, _frame_stats(dataset, self._parse_csv_bytes(dataset, header, chunk)))
+                yield chunk
+
+        self._append_csv_bytes(dataset, header, tracked_chunks())
+        self._record_append(dataset, before, stats)
+
+    def _append_csv_bytes(self, dataset: str, header, chunks, flush_bytes: int = 64 * 1024 * 1024):
+        # 默认实现：每累积 flush_bytes 解析并写入一次
+        buffer = []
+        size = 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= flush_bytes:
+                self._append(dataset, self._parse_csv_bytes(dataset, header, b"".join(buffer)))
+                buffer = []
+                size = 0
+        if buffer:
+            self._append(dataset, self._parse_csv_bytes(dataset, header, b"".join(buffer)))
+
+    def _parse_csv_bytes(self, dataset, header, data: bytes) -> pl.DataFrame:
+        schema = self.schema(dataset)
+        df = pl.read_csv(
+            io.BytesIO(data),
+            has_header=False,
+            new_columns=list(header),
+            schema_overrides=_parse_overrides(schema, header),
+        )
+        return _apply_schema(df, schema)
+
+
+class CsvStorage(Storage):
+    """单文件 CSV 后端，与原有文件格式完全兼容"""
+
+    backend = "csv"
+
+    def __init__(self, data_dir: str = DATA_DIR, files: dict = None):
+        super().__init__(data_dir)
+        # 允许为个别数据集指定文件路径（兼容旧的 csv_filename 参数）
+        self.files = {name: path for name, path in (files or {}).items() if path}
+
+    def path(self, dataset: str) -> str:
+        return self.files.get(dataset) or os.path.join(self.data_dir, DATASETS[dataset]["file"])
+
+    def exists(self, dataset: str) -> bool:
+        path = self.path(dataset)
+        return os.path.isfile(path) and os.path.getsize(path) > 0
+
+    def manifest_path(self, dataset: str) -> str:
+        return self.path(dataset) + ".manifest.json"
+
+    def data_bytes(self, dataset: str) -> int:
+        return os.path.getsize(self.path(dataset)) if self.exists(dataset) else 0
+
+    def header(self, dataset: str):
+        if not self.exists(dataset):
+            return None
+        with open(self.path(dataset), "r", encoding="utf-8", newline="") as f:
+            return next(csv.reader(f), None)
+
+    def scan(self, dataset: str) -> pl.LazyFrame:
+        schema = self.schema(dataset)
+        header = self.header(dataset)
+        if header is None:
+            return pl.LazyFrame(schema=schema)
+        lf = pl.scan_csv(self.path(dataset), schema_overrides=_parse_overrides(schema, header))
+        return _apply_schema(lf, schema)
+
+    def _stored_schema(self, dataset: str) -> pl.Schema:
+        return pl.read_csv(self.path(dataset), n_rows=1, infer_schema_length=1).schema
+
+    def _append(self, dataset: str, df: pl.DataFrame):
+        path = self.path(dataset)
+        header = self.header(dataset)
+        if header is not None:
+            df = df.select([col for col in header if col in df.columns])
+        with open(path, "a", encoding="utf-8") as f:
+            df.write_csv(f, include_header=header is None)
+
+    def _replace(self, dataset: str, df: pl.DataFrame):
+        path = self.path(dataset)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            df.write_csv(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _append_csv_bytes(self, dataset: str, header, chunks):
+        # CSV 后端直接拼接字节，不需要解析
+        path = self.path(dataset)
+        write_header = not self.exists(dataset)
+        with open(path, "ab") as out:
+            if write_header:
+                out.write((",".join(header) + "\n").encode("utf-8"))
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+
+    def _sink(self, dataset: str, lf: pl.LazyFrame, block_size: int = 8 * 1024 * 1024) -> dict:
+        # 先流式写到临时文件（sink_csv 不支持追加），再分块拷贝到数据文件末尾，内存占用有界
+        path = self.path(dataset)
+        header = self.header(dataset)
+        if header is not None:
+            lf = lf.select(header)
+        tmp_path = path + ".sink.tmp"
+        lf.sink_csv(tmp_path)
+
+        try:
+            schema = self.schema(dataset)
+            staged = pl.scan_csv(tmp_path, schema_overrides=_parse_overrides(schema, lf.collect_schema().names()))
+            stats = _frame_stats(dataset, _apply_schema(staged, schema))
+            if not stats["rows"]:
+                return stats
+            with open(tmp_path, "rb") as src, open(path, "ab") as out:
+                first_line = src.readline()
+                if header is None:
+                    out.write(first_line)
+                shutil.copyfileobj(src, out, block_size)
+                out.flush()
+                os.fsync(out.fileno())
+        finally:
+            os.remove(tmp_path)
+        return stats
+
+    def _clear(self, dataset: str):
+        path = self.path(dataset)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def _truncate(self, dataset: str, position: int):
+        with open(self.path(dataset), "r+b") as f:
+            f.truncate(position)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def last_row(self, dataset: str):
+        header = self.header(dataset)
+        if header is None:
+            return None
+        last_line = self._last_line(self.path(dataset)).decode("utf-8").strip()
+        if not last_line or last_line == ",".join(header):
+            return None
+        df = self._parse_csv_bytes(dataset, header, (last_line + "\n").encode("utf-8"))
+        return df.row(0, named=True)
+
+    def position(self, dataset: str) -> int:
+        """文件中最后一个完整行结束处的字节偏移"""
+        if not self.exists(dataset):
+            return 0
+        return self._complete_size(self.path(dataset))
+
+    @staticmethod
+    def _complete_size(path: str, block_size: int = 64 * 1024) -> int:
+        # 写入中的文件末尾可能是半行，只统计到最后一个换行符为止
+        with open(path, "rb") as f:
+            end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(end - block_size, 0)
+                f.seek(start)
+                block = f.read(end - start)
+                newline = block.rfind(b"\n")
+                if newline != -1:
+                    return start + newline + 1
+                end = start
+        return 0
+
+    @staticmethod
+    def _last_line(path: str, block_size: int = 64 * 1024) -> bytes:
+        """最后一个完整行（不含换行符），从文件末尾按块向前查找行首"""
+        end = CsvStorage._complete_size(path, block_size) - 1  # 跳过行尾换行符
+        chunks = []
+        with open(path, "rb") as f:
+            while end > 0:
+                start = max(end - block_size, 0)
+                f.seek(start)
+                block = f.read(end - start)
+                newline = block.rfind(b"\n")
+                if newline != -1:
+                    chunks.append(block[newline + 1:])
+                    break
+                chunks.append(block)
+                end = start
+        return b"".join(reversed(chunks)).rstrip(b"\r")
+
+    def scan_since(self, dataset: str, position: int = 0):
+        schema = self.schema(dataset)
+        header = self.header(dataset)
+        if header is None:
+            if position:
+                raise ValueError(f"{self.path(dataset)} 不存在，但检查点为 {position}")
+            return pl.LazyFrame(schema=schema), 0
+
+        path = self.path(dataset)
+        end = self._complete_size(path)
+        if position > end:
+            raise ValueError(f"检查点 {position} 超出 {path} 的大小 {end}，文件可能被重写")
+
+        if position == 0 and end == os.path.getsize(path):
+            # 从头读取且没有半行：直接惰性扫描整个文件
+            return self.scan(dataset), end
+
+        with open(path, "rb") as f:
+            if position > 0:
+                f.seek(position - 1)
+                if f.read(1) != b"\n":
+                    raise ValueError(f"检查点 {position} 不在 {path} 的行边界上，文件可能被重写")
+            else:
+                f.readline()  # 跳过表头
+            data = f.read(end - f.tell())
+
+        if not data:
+            return pl.LazyFrame(schema=schema), end
+        return self._parse_csv_bytes(dataset, header, data).lazy(), end
+
+    def iter_located(self, dataset: str, columns, position: int = 0, block_size: int = 64 * 1024 * 1024):
+        # location 为行首的字节偏移，row 恒为 0
+        header = self.header(dataset)
+        if header is None:
+            return
+        path = self.path(dataset)
+        end = self._complete_size(path)
+        if position > end:
+            raise ValueError(f"检查点 {position} 超出 {path} 的大小 {end}，文件可能被重写")
+
+        with open(path, "rb") as f:
+            if position > 0:
+                f.seek(position - 1)
+                if f.read(1) != b"\n":
+                    raise ValueError(f"检查点 {position} 不在 {path} 的行边界上，文件可能被重写")
+            else:
+                f.readline()  # 跳过表头
+                position = f.tell()
+
+            while position < end:
+                data = f.read(min(block_size, end - position))
+                cut = data.rfind(b"\n") + 1
+                if cut == 0:
+                    # 单行超过 block_size：读到行尾为止
+                    data += f.readline()
+                    cut = len(data)
+                data = data[:cut]
+                f.seek(position + cut)
+
+                # 每行的字节长度（按整行读入，不拆分字段）累加得到行首偏移
+                lines = pl.read_csv(io.BytesIO(data), has_header=False, separator="\x1f", quote_char=None,
+                                    new_columns=["line"], schema_overrides={"line": pl.Utf8})
+                starts = (lines["line"].str.len_bytes().cast(pl.Int64) + 1).cum_sum().shift(1, fill_value=0) + position
+                df = self._parse_csv_bytes(dataset, header, data).select(list(columns))
+                yield df.with_columns(starts.alias("location"), pl.lit(0, dtype=pl.UInt32).alias("row"))
+                position += cut
+
+    def take(self, dataset: str, locations: pl.DataFrame) -> pl.DataFrame:
+        header = self.header(dataset)
+        if header is None or len(locations) == 0:
+            return pl.DataFrame(schema=self.schema(dataset))
+        lines = []
+        with open(self.path(dataset), "rb") as f:
+            for offset in locations["location"].unique().sort().to_list():
+                f.seek(offset)
+                lines.append(f.readline())
+        return self._parse_csv_bytes(dataset, header, b"".join(lines))
+
+    def iter_batches(self, dataset: str, columns, batch_size: int = 1_000_000):
+        header = self.header(dataset)
+        if header is None:
+            return
+        schema = self.schema(dataset)
+        reader = pl.read_csv_batched(
+            self.path(dataset),
+            columns=list(columns),
+            schema_overrides=_parse_overrides(schema, header),
+            batch_size=batch_size,
+        )
+        while True:
+            batches = reader.next_batches(1)
+            if not batches:
+                break
+            yield _apply_schema(batches[0], schema)
+
+
+class ParquetStorage(Storage):
+    """
+    分区 Parquet 后端
+
+    目录结构：{data_dir}/parquet/{dataset}/month=YYYY-MM/part-000001.parquet（trades 为 day=YYYY-MM-DD）
+    每次追加写入新的 part 文件（序号全局递增），文件写完后原子改名，读者不会看到半个文件。
+    每个 part 的行数和 min/max 记录在 {dataset}/_parts.json，scan_filtered() 据此跳过无关文件。
+    """
+
+    backend = "parquet"
+
+    def __init__(self, data_dir: str = DATA_DIR, compression: str = "zstd"):
+        super().__init__(data_dir)
+        self.compression = compression
+        self.lock = threading.Lock()
+        self.next_seq = {}
+
+    def path(self, dataset: str) -> str:
+        return os.path.join(self.data_dir, "parquet", dataset)
+
+    def parts(self, dataset: str):
+        """按写入顺序返回所有 part 文件"""
+        files = glob.glob(os.path.join(self.path(dataset), "**", "part-*.parquet"), recursive=True)
+        return sorted(files, key=lambda f: os.path.basename(f))
+
+    @staticmethod
+    def _part_seq(part: str) -> int:
+        return int(os.path.basename(part)[5:-8])
+
+    def exists(self, dataset: str) -> bool:
+        return len(self.parts(dataset)) > 0
+
+    def manifest_path(self, dataset: str) -> str:
+        return os.path.join(self.path(dataset), "_manifest.json")
+
+    def data_bytes(self, dataset: str) -> int:
+        return sum(os.path.getsize(part) for part in self.parts(dataset))
+
+    def scan(self, dataset: str) -> pl.LazyFrame:
+        schema = self.schema(dataset)
+        parts = self.parts(dataset)
+        if not parts:
+            return pl.LazyFrame(schema=schema)
+        # 分区目录只用于组织文件，时间过滤依赖文件内的 min/max 统计信息
+        lf = pl.scan_parquet(parts, hive_partitioning=False)
+        return _apply_schema(lf, schema)
+
+    def _stored_schema(self, dataset: str) -> pl.Schema:
+        return pl.read_parquet_schema(self.parts(dataset)[0])
+
+    def _partition_key(self, dataset: str, frame) -> pl.Expr:
+        time_column = DATASETS[dataset]["time_column"]
+        col = pl.col(time_column)
+        if frame.collect_schema()[time_column] != pl.Datetime("us"):
+            col = pl.from_epoch(col, time_unit="s")
+        return col.dt.strftime(PARTITION_FORMATS[DATASETS[dataset]["partition"]])
+
+    def _take_seq(self, dataset: str) -> int:
+        with self.lock:
+            if dataset not in self.next_seq:
+                parts = self.parts(dataset)
+                last = self._part_seq(parts[-1]) if parts else 0
+                self.next_seq[dataset] = last + 1
+            seq = self.next_seq[dataset]
+            self.next_seq[dataset] += 1
+            return seq
+
+    def _write_part(self, dataset: str, df, partition: str = None, root: str = None):
+        """写入一个 part 文件，df 可以是 DataFrame 或 LazyFrame（流式写入）"""
+        config = DATASETS[dataset]
+        directory = root or self.path(dataset)
+        if partition is not None:
+            directory = os.path.join(directory, f"{config['partition']}={partition}")
+        os.makedirs(directory, exist_ok=True)
+        final_path = os.path.join(directory, f"part-{self._take_seq(dataset):06d}.parquet")
+        tmp_path = final_path + ".tmp"
+        options = {"compression": self.compression, "statistics": True}
+        if config.get("sort_by"):
+            df = df.sort(config["sort_by"], maintain_order=True)
+            options["row_group_size"] = SORTED_ROW_GROUP_SIZE
+        if isinstance(df, pl.LazyFrame):
+            df.sink_parquet(tmp_path, **options)
+        else:
+            df.write_parquet(tmp_path, **options)
+        os.replace(tmp_path, final_path)
+        return final_path
+
+    def _parts_file(self, dataset: str, root: str = None) -> str:
+        return os.path.join(root or self.path(dataset), PARTS_FILE)
+
+    def _read_part_stats(self, dataset: str, part: str) -> dict:
+        """单个 part 文件的行数，以及时间列和 stats_columns 的 min/max"""
+        config = DATASETS[dataset]
+        exprs = [pl.len().alias("rows")]
+        for col in [config["time_column"]] + config.get("stats_columns", []):
+            exprs += [pl.col(col).min().alias(f"min_{col}"), pl.col(col).max().alias(f"max_{col}")]
+        row = _apply_schema(pl.scan_parquet(part), self.schema(dataset)).select(exprs).collect().row(0, named=True)
+        return {key: _json_value(value) for key, value in row.items()}
+
+    def _load_part_stats(self, dataset: str, root: str = None) -> dict:
+        path = self._parts_file(dataset, root)
+        if os.path.isfile(path):
+            try:
+                with open(path, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def _save_part_stats(self, dataset: str, entries: dict, root: str = None):
+        path = self._parts_file(dataset, root)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+
+    def _index_parts(self, dataset: str, parts, root: str = None):
+        """把新写入的 part 文件的统计信息加入 _parts.json"""
+        directory = root or self.path(dataset)
+        new = {os.path.relpath(part, directory): self._read_part_stats(dataset, part) for part in parts}
+        if not new:
+            return
+        with self.lock:
+            entries = self._load_part_stats(dataset, root)
+            entries.update(new)
+            self._save_part_stats(dataset, entries, root)
+
+    def part_stats(self, dataset: str) -> dict:
+        """
+        每个 part 文件（按写入顺序）的行数和 min/max：part 路径 → dict
+
+        与磁盘上的文件对账：删掉已不存在的文件（回滚、清空），补齐缺失的文件（例如旧版本写入的数据）
+        """
+        directory = self.path(dataset)
+        parts = {os.path.relpath(part, directory): part for part in self.parts(dataset)}
+        with self.lock:
+            entries = self._load_part_stats(dataset)
+            stale = [name for name in entries if name not in parts]
+            missing = [name for name in parts if name not in entries]
+            for name in stale:
+                del entries[name]
+            for name in missing:
+                entries[name] = self._read_part_stats(dataset, parts[name])
+            if stale or missing:
+                self._save_part_stats(dataset, entries)
+        return {part: entries[name] for name, part in parts.items()}
+
+    def _stat_value(self, dataset: str, col: str, value):
+        """_parts.json 中的时间以 ISO 字符串保存，比较前转换回 datetime"""
+        if isinstance(value, str) and isinstance(self.schema(dataset)[col], pl.Datetime):
+            return datetime.fromisoformat(value)
+        return value
+
+    def scan_filtered(self, dataset: str, start=None, end=None, **filters) -> pl.LazyFrame:
+        condition = _filter_expr(dataset, start, end, filters)
+        if condition is None:
+            return self.scan(dataset)
+
+        time_column = DATASETS[dataset]["time_column"]
+        lower = _time_bound(dataset, start) if start is not None else None
+        upper = _time_bound(dataset, end) if end is not None else None
+        selected = []
+        for part, stats in self.part_stats(dataset).items():
+            if not stats["rows"]:
+                continue
+            if lower is not None and self._stat_value(dataset, time_column, stats[f"max_{time_column}"]) < lower:
+                continue
+            if upper is not None and self._stat_value(dataset, time_column, stats[f"min_{time_column}"]) >= upper:
+                continue
+            if not all(self._may_contain(dataset, stats, col, value) for col, value in filters.items()):
+                continue
+            selected.append(part)
+
+        if not selected:
+            return pl.LazyFrame(schema=self.schema(dataset))
+        # 文件内部再由 row group 的 min/max 做谓词下推
+        lf = _apply_schema(pl.scan_parquet(selected, hive_partitioning=False), self.schema(dataset))
+        return lf.filter(condition)
+
+    def _may_contain(self, dataset: str, stats: dict, col: str, value) -> bool:
+        """按 part 的 min/max 判断是否可能包含 value（或 value 中的任一值），没有统计信息的列不做判断"""
+        if f"min_{col}" not in stats:
+            return True
+        low = self._stat_value(dataset, col, stats[f"min_{col}"])
+        high = self._stat_value(dataset, col, stats[f"max_{col}"])
+        if low is None or high is None:
+            return True
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        return any(low <= v <= high for v in values)
+
+    def _append(self, dataset: str, df: pl.DataFrame, root: str = None):
+        schema = self.schema(dataset)
+        df = _apply_schema(df, schema).select([col for col in schema if col in df.columns])
+
+        if DATASETS[dataset]["partition"] is None:
+            self._index_parts(dataset, [self._write_part(dataset, df, root=root)], root=root)
+            return
+
+        df = df.with_columns(self._partition_key(dataset, df).alias("__partition"))
+        # 保持输入顺序：按分区首次出现的先后写入
+        written = []
+        for partition in df["__partition"].unique(maintain_order=True).to_list():
+            part_df = df.filter(pl.col("__partition") == partition).drop("__partition")
+            written.append(self._write_part(dataset, part_df, partition, root=root))
+        self._index_parts(dataset, written, root=root)
+
+    def _replace(self, dataset: str, df: pl.DataFrame):
+        # 先在旁边的新目录写完整数据，再通过目录改名切换
+        directory = self.path(dataset)
+        new_dir = directory + ".new"
+        old_dir = directory + ".old"
+        shutil.rmtree(new_dir, ignore_errors=True)
+        self._append(dataset, df, root=new_dir)
+        if os.path.isdir(directory):
+            shutil.rmtree(old_dir, ignore_errors=True)
+            os.replace(directory, old_dir)
+        os.replace(new_dir, directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def _sink(self, dataset: str, lf: pl.LazyFrame) -> dict:
+        schema = self.schema(dataset)
+        columns = lf.collect_schema().names()
+        lf = _apply_schema(lf, schema).select([col for col in schema if col in columns])
+
+        # 先流式写出一个临时文件，再按分区逐个流式拆分成 part 文件
+        os.makedirs(self.path(dataset), exist_ok=True)
+        staged_path = os.path.join(self.path(dataset), ".sink.tmp.parquet")
+        lf.sink_parquet(staged_path, compression=self.compression, statistics=True)
+        try:
+            staged = pl.scan_parquet(staged_path)
+            stats = _frame_stats(dataset, staged)
+            if stats["rows"] == 0:
+                return stats
+            if DATASETS[dataset]["partition"] is None:
+                self._index_parts(dataset, [self._write_part(dataset, staged)])
+                return stats
+            # 每个分区的时间范围互不重叠，按时间范围过滤可以利用临时文件的 row group 统计信息只读相关部分
+            time_column = pl.col(DATASETS[dataset]["time_column"])
+            ranges = (
+                staged.group_by(self._partition_key(dataset, staged).alias("partition"), maintain_order=True)
+                .agg(time_column.min().alias("low"), time_column.max().alias("high"))
+                .collect()
+            )
+            written = [
+                self._write_part(dataset, staged.filter(time_column.is_between(low, high)), partition)
+                for partition, low, high in ranges.iter_rows()
+            ]
+            self._index_parts(dataset, written)
+            return stats
+        finally:
+            os.remove(staged_path)
+
+    def _clear(self, dataset: str):
+        shutil.rmtree(self.path(dataset), ignore_errors=True)
+        with self.lock:
+            self.next_seq.pop(dataset, None)
+
+    def _truncate(self, dataset: str, position: int):
+        # position 为 part 序号，删除之后写入的所有 part
+        for part in self.parts(dataset):
+            if self._part_seq(part) > position:
+                os.remove(part)
+        with self.lock:
+            self.next_seq.pop(dataset, None)
+
+    def last_row(self, dataset: str):
+        # 排序写入的数据集（trades）中，最后一个 part 的末行不一定是时间上最后的一行
+        parts = self.parts(dataset)
+        if not parts:
+            return None
+        df = _apply_schema(pl.read_parquet(parts[-1]).tail(1), self.schema(dataset))
+        return df.row(0, named=True) if len(df) else None
+
+    def position(self, dataset: str) -> int:
+        """最后一个 part 文件的序号"""
+        parts = self.parts(dataset)
+        return self._part_seq(parts[-1]) if parts else 0
+
+    def scan_since(self, dataset: str, position: int = 0):
+        schema = self.schema(dataset)
+        parts = self.parts(dataset)
+        end = self._part_seq(parts[-1]) if parts else 0
+        if position > end:
+            raise ValueError(f"检查点 {position} 超出 {self.path(dataset)} 的最大 part 序号 {end}，数据集可能被重写")
+        new_parts = [part for part in parts if self._part_seq(part) > position]
+        if not new_parts:
+            return pl.LazyFrame(schema=schema), end
+        return _apply_schema(pl.scan_parquet(new_parts, hive_partitioning=False), schema), end
+
+    def iter_located(self, dataset: str, columns, position: int = 0):
+        # location 为 part 序号，row 为 part 内的行号
+        for part in self.parts(dataset):
+            seq = self._part_seq(part)
+            if seq <= position:
+                continue
+            df = _apply_schema(pl.read_parquet(part, columns=list(columns)), self.schema(dataset))
+            yield df.with_row_index("row").select(list(columns) + [pl.lit(seq, dtype=pl.Int64).alias("location"), "row"])
+
+    def take(self, dataset: str, locations: pl.DataFrame, window: int = SORTED_ROW_GROUP_SIZE) -> pl.DataFrame:
+        schema = self.schema(dataset)
+        paths = {self._part_seq(part): part for part in self.parts(dataset)}
+        frames = []
+        locations = locations.select("location", "row").unique().sort("location", "row")
+        for (seq,), group in locations.group_by("location", maintain_order=True):
+            rows = group["row"].to_list()
+            # 相距不超过 window 的行合并为一次切片读取，切片会下推到 Parquet 读取器，只解码相关的 row group
+            start = 0
+            while start < len(rows):
+                low, stop = rows[start], start + 1
+                while stop < len(rows) and rows[stop] - low < window:
+                    stop += 1
+                chunk = pl.scan_parquet(paths[seq], hive_partitioning=False).slice(low, rows[stop - 1] - low + 1).collect()
+                frames.append(chunk.select(pl.all().gather([row - low for row in rows[start:stop]])))
+                start = stop
+        if not frames:
+            return pl.DataFrame(schema=schema)
+        return _apply_schema(pl.concat(frames, how="diagonal_relaxed"), schema)
+
+    def iter_batches(self, dataset: str, columns, batch_size: int = 1_000_000):
+        schema = self.schema(dataset)
+        for part in self.parts(dataset):
+            df = _apply_schema(pl.read_parquet(part, columns=list(columns)), schema)
+            for offset in range(0, len(df), batch_size):
+                yield df.slice(offset, batch_size)
+
+
+BACKENDS = {
+    "csv": CsvStorage,
+    "parquet": ParquetStorage,
+}
+
+_storages = {}
+
+
+def get_storage(backend: str = None) -> Storage:
+    """获取存储后端实例（按后端名缓存），默认使用 POLY_STORAGE 指定的后端"""
+    backend = backend or STORAGE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的存储后端：{backend}（可选：{', '.join(BACKENDS)}）")
+    if backend not in _storages:
+        _storages[backend] = BACKENDS[backend]()
+    return _storages[backend]
+
+
+def scan_trades(market_id=None, start=None, end=None, backend: str = None, **filters) -> pl.LazyFrame:
+    """
+    按市场和时间范围 [start, end) 扫描 trades，Parquet 后端只读取可能包含结果的文件
+
+    示例：
+        scan_trades(market_id=12345, start="2025-06-01").collect()
+    """
+    if market_id is not None:
+        filters["market_id"] = market_id
+    return get_storage(backend).scan_filtered("trades", start, end, **filters)
+
+
+def decode_trades(df: pl.DataFrame, backend: str = None) -> pl.DataFrame:
+    """
+    把 trades 结果中的 maker / taker / transactionHash 编码还原为字符串，用于显示或导出
+
+    示例：
+        decode_trades(scan_trades(market_id=12345).collect().head(20))
+    """
+    return get_storage(backend).decode("trades", df)
+
+
+def wallet_code(address: str, backend: str = None):
+    """
+    钱包地址在 trades 中的编码（maker / taker 列），地址从未出现过时返回 None
+
+    示例：
+        scan_dataset("trades").filter(pl.col("maker") == wallet_code("0x...")).collect()
+    """
+    return get_storage(backend).dictionaries.lookup(DATASETS["trades"]["dictionaries"]["maker"], [address.lower()])[0]
+
+
+def scan_dataset(dataset: str, backend: str = None) -> pl.LazyFrame:
+    """
+    扫描数据集，返回带类型的 LazyFrame
+
+    示例：
+        scan_dataset("trades").filter(pl.col("market_id") == 12345).collect()
+    """
+    return get_storage(backend).scan(dataset)
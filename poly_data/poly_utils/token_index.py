@@ -0,0 +1,130 @@
+"""
+token → (market_id, side) 查找索引
+
+把 markets / missing_markets 中的 token1、token2 展开成每个 token 一行，token 按行号编码为
+UInt32 整数，以 Arrow IPC 文件保存在 {data_dir}/token_index.arrow，读取时内存映射，毫秒级加载。
+市场数据变化后（按存储位置和修改时间判断）自动重建。
+
+用法：
+    index = load_token_index()
+    lf.with_columns(index.encode(pl.col("makerAssetId")).alias("code"))
+"""
+import os
+import json
+import threading
+import polars as pl
+from .storage import get_storage
+from .utils import get_markets
+
+SIDES = pl.Enum(["token1", "token2"])
+
+INDEX_FILE = "token_index.arrow"
+META_FILE = "token_index.json"
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class TokenIndex:
+    """内存中的 token 索引，code 即行号"""
+
+    def __init__(self, table: pl.DataFrame):
+        self.table = table
+        self._lookup = None
+
+    def __len__(self):
+        return self.table.height
+
+    def encode(self, expr: pl.Expr) -> pl.Expr:
+        """把 token 字符串列映射为 UInt32 编码，不在索引中的 token 为 null"""
+        codes = pl.int_range(0, self.table.height, dtype=pl.UInt32, eager=True)
+        return expr.replace_strict(self.table["token"], codes, default=None, return_dtype=pl.UInt32)
+
+    def market_id(self, code: pl.Expr) -> pl.Expr:
+        """按编码取 market_id（整数下标访问，无需再次哈希字符串）"""
+        return pl.lit(self.table["market_id"]).gather(code)
+
+    def side(self, code: pl.Expr) -> pl.Expr:
+        """按编码取 side（token1 / token2）"""
+        return pl.lit(self.table["side"]).gather(code)
+
+    def get(self, token: str):
+        """单个 token 查询，返回 (market_id, side)，不存在时返回 None"""
+        if self._lookup is None:
+            self._lookup = {
+                token: (market_id, side)
+                for token, market_id, side in self.table.select(["token", "market_id", "side"]).iter_rows()
+            }
+        return self._lookup.get(token)
+
+
+def build_token_index(markets_df: pl.DataFrame) -> TokenIndex:
+    """从市场表（get_markets() 的结果）构建索引，同一个 token 只保留最早创建的市场"""
+    if markets_df.is_empty():
+        return TokenIndex(pl.DataFrame(schema={"token": pl.Utf8, "market_id": pl.Int64, "side": SIDES}))
+
+    table = (
+        markets_df.lazy()
+        .select([pl.col("id").alias("market_id"), "token1", "token2"])
+        .unpivot(index="market_id", on=["token1", "token2"], variable_name="side", value_name="token")
+        .drop_nulls("token")
+        .unique(subset="token", keep="first", maintain_order=True)
+        .select(["token", pl.col("market_id").cast(pl.Int64), pl.col("side").cast(SIDES)])
+        .collect()
+    )
+    return TokenIndex(table)
+
+
+def _source_stamp(storage):
+    """markets / missing_markets 的版本标记：存储位置 + 修改时间"""
+    stamp = {"backend": storage.backend}
+    for dataset in ["markets", "missing_markets"]:
+        if storage.exists(dataset):
+            stamp[dataset] = [storage.position(dataset), os.stat(storage.path(dataset)).st_mtime_ns]
+        else:
+            stamp[dataset] = None
+    return stamp
+
+
+def load_token_index(storage=None, rebuild: bool = False) -> TokenIndex:
+    """
+    加载 token 索引，索引缺失或市场数据已变化时重新构建并保存
+
+    同一进程内按版本标记缓存，重复调用几乎没有开销
+    """
+    storage = storage or get_storage()
+    index_path = os.path.join(storage.data_dir, INDEX_FILE)
+    meta_path = os.path.join(storage.data_dir, META_FILE)
+    stamp = _source_stamp(storage)
+
+    with _lock:
+        cached = _cache.get(index_path)
+        if not rebuild and cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        if not rebuild and os.path.isfile(index_path) and os.path.isfile(meta_path):
+            try:
+                with open(meta_path, "r") as f:
+                    saved_stamp = json.load(f)
+                if saved_stamp == stamp:
+                    index = TokenIndex(pl.read_ipc(index_path, memory_map=True))
+                    _cache[index_path] = (stamp, index)
+                    return index
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 读取 token 索引失败，重新构建：{e}")
+
+        print("🔨 构建 token → market 索引...")
+        index = build_token_index(get_markets())
+
+        # 先写数据再写版本标记，两步都是原子替换
+        tmp_path = index_path + ".tmp"
+        index.table.write_ipc(tmp_path)
+        os.replace(tmp_path, index_path)
+        tmp_meta = meta_path + ".tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump(stamp, f)
+        os.replace(tmp_meta, meta_path)
+        print(f"✅ token 索引已保存：{len(index):,} 个 token → {index_path}")
+
+        _cache[index_path] = (stamp, index)
+        return index
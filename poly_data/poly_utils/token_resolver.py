@@ -0,0 +1,209 @@
+"""
+缺失 token 的并发批量解析
+
+- 每个请求携带多个 clob_token_ids，多个请求通过 asyncio 并发执行
+- 所有请求共享一个令牌桶限速器；遇到 429 时整体暂停（优先使用 Retry-After）
+- 5xx / 网络错误按指数退避重试，重试策略对所有批次一致
+- 确认没有对应市场的 token 写入负缓存，在有效期内不再重复查询
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# 可通过环境变量指向本地模拟服务器（见 bench/）
+GAMMA_MARKETS_URL = os.getenv('POLY_GAMMA_URL', 'https://gamma-api.polymarket.com/markets')
+
+BATCH_SIZE = 20            # 每个请求携带的 token 数
+CONCURRENCY = 8            # 同时进行的请求数
+RATE_PER_SECOND = 5.0      # 令牌桶：平均每秒请求数
+BURST = 10                 # 令牌桶容量
+MAX_RETRIES = 5
+RATE_LIMIT_PAUSE = 10      # 429 且没有 Retry-After 时的暂停秒数
+NEGATIVE_TTL = 7 * 24 * 3600
+NEGATIVE_CACHE_FILE = 'missing_tokens_negative.json'
+
+
+class TokenBucket:
+    """asyncio 令牌桶限速器，pause() 会让所有等待者一起暂停"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class NegativeCache:
+    """确认没有市场的 token -> 最后一次查询时间，保存为 JSON"""
+
+    def __init__(self, path: str, ttl: int = NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"读取负缓存错误：{e}")
+
+    def __contains__(self, token_id):
+        checked_at = self.entries.get(token_id)
+        return checked_at is not None and time.time() - checked_at < self.ttl
+
+    def add(self, token_ids):
+        now = int(time.time())
+        for token_id in token_ids:
+            self.entries[token_id] = now
+
+    def save(self):
+        now = time.time()
+        self.entries = {t: ts for t, ts in self.entries.items() if now - ts < self.ttl}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+def parse_json_list(value):
+    """Gamma API 中 clobTokenIds / outcomes 可能是 JSON 字符串，也可能已经是列表"""
+    if isinstance(value, str):
+        return json.loads(value)
+    return value or []
+
+
+class MissingTokenResolver:
+    """批量、并发地查询 token 所属的市场"""
+
+    def __init__(self, batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY,
+                 rate: float = RATE_PER_SECOND, burst: int = BURST,
+                 max_retries: int = MAX_RETRIES, url: str = None):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.url = url or GAMMA_MARKETS_URL
+        self.requests = 0
+        self.retries = 0
+
+    async def resolve(self, token_ids):
+        """
+        返回 (markets, not_found, failed)
+        markets: 市场 id -> 市场 JSON；not_found: 确认没有市场的 token；failed: 重试耗尽仍未成功的 token
+        """
+        batches = [token_ids[i:i + self.batch_size] for i in range(0, len(token_ids), self.batch_size)]
+        markets, not_found, failed = {}, set(), set()
+        if not batches:
+            return markets, not_found, failed
+
+        self.limiter = TokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            async def run(batch):
+                async with semaphore:
+                    return batch, await self._fetch_batch(session, executor, batch)
+
+            done = 0
+            for future in asyncio.as_completed([run(batch) for batch in batches]):
+                batch, result = await future
+                done += 1
+                if result is None:
+                    failed.update(batch)
+                    print(f"[{done}/{len(batches)}] 经过 {self.max_retries} 次重试后获取 {len(batch)} 个令牌失败")
+                    continue
+
+                found = set()
+                for market in result:
+                    tokens = parse_json_list(market.get('clobTokenIds', '[]'))
+                    found.update(str(token) for token in tokens)
+                    markets.setdefault(str(market.get('id', '')), market)
+                missing = [token_id for token_id in batch if token_id not in found]
+                not_found.update(missing)
+                print(f"[{done}/{len(batches)}] {len(batch)} 个令牌 → {len(result)} 个市场，{len(missing)} 个未找到")
+
+        session.close()
+        return markets, not_found, failed
+
+    async def _fetch_batch(self, session, executor, batch):
+        loop = asyncio.get_running_loop()
+        params = {'clob_token_ids': batch, 'limit': len(batch)}
+
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                self.retries += 1
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 30))
+            await self.limiter.acquire()
+            self.requests += 1
+            try:
+                response = await loop.run_in_executor(
+                    executor, partial(session.get, self.url, params=params, timeout=30)
+                )
+            except requests.RequestException as e:
+                print(f"请求错误：{e}")
+                continue
+
+            if response.status_code == 429:
+                retry_after = response.headers.get('Retry-After', '')
+                pause = float(retry_after) if retry_after.replace('.', '', 1).isdigit() else RATE_LIMIT_PAUSE
+                print(f"达到速率限制 - 所有请求暂停 {pause:.0f} 秒...")
+                self.limiter.pause(pause)
+                continue
+            if response.status_code != 200:
+                print(f"API 错误 {response.status_code}")
+                continue
+
+            try:
+                return response.json()
+            except ValueError as e:
+                print(f"响应解析错误：{e}")
+
+        return None
+
+
+def resolve_tokens(token_ids, **kwargs):
+    """同步入口，返回值同 MissingTokenResolver.resolve；在已有事件循环中（例如 Jupyter）调用时改为在独立线程里运行"""
+    resolver = MissingTokenResolver(**kwargs)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        result = asyncio.run(resolver.resolve(token_ids))
+    else:
+        holder = {}
+        thread = threading.Thread(target=lambda: holder.update(result=asyncio.run(resolver.resolve(token_ids))))
+        thread.start()
+        thread.join()
+        result = holder['result']
+
+    print(f"共发送 {resolver.requests} 个请求（重试 {resolver.retries} 次）")
+    return result
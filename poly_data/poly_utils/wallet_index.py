@@ -0,0 +1,147 @@
+"""
+钱包地址 → trades 中成交位置的二级索引
+
+每笔 trade 的 maker 和 taker 各记录一条 (钱包编码, location, row, 角色)，钱包编码即 trades 中的
+wallet 字典编码（见 poly_utils.dictionary），索引保存在
+{data_dir}/wallet_index.{backend}.sqlite。表按钱包编码聚簇（WITHOUT ROWID），查询一个钱包只读取它自己的索引项，
+再通过 Storage.take() 按位置取回整行，耗时与该钱包的成交笔数成正比，而不是与 trades 总量成正比。
+
+process_live() 每次追加 trades 后增量更新索引；索引记录自己处理到的存储位置，
+trades 被清空或回滚到索引位置之前时自动重建。
+
+用法：
+    fills = wallet_fills("0x9d84ce0306f8551e02efef1680475fc0f1dc1344", role="maker")
+"""
+import os
+import sqlite3
+import threading
+import polars as pl
+from .storage import get_storage, DATASETS
+
+INDEX_FILE = "wallet_index.{backend}.sqlite"
+ROLES = {"maker": 0, "taker": 1}
+CACHE_KB = 256 * 1024
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+class WalletIndex:
+    """trades 的钱包索引（SQLite），所有方法线程安全"""
+
+    def __init__(self, storage=None, dataset: str = "trades", index_file: str = None):
+        self.storage = storage or get_storage()
+        self.dataset = dataset
+        self.index_file = index_file or os.path.join(self.storage.data_dir, INDEX_FILE.format(backend=self.storage.backend))
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.index_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # 批量插入分散在整个 B 树上，较大的页缓存可以显著减少随机 I/O
+        self.conn.execute(f"PRAGMA cache_size=-{CACHE_KB}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS fills (
+                wallet INTEGER NOT NULL, location INTEGER NOT NULL, row INTEGER NOT NULL, role INTEGER NOT NULL,
+                PRIMARY KEY (wallet, location, row, role)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+        """)
+        self.conn.commit()
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _reset(self):
+        self.conn.execute("DELETE FROM fills")
+        self.conn.execute("DELETE FROM meta")
+
+    def update(self, rebuild: bool = False) -> int:
+        """把索引位置之后追加的 trades 加入索引，返回新增的索引项数"""
+        with self.lock:
+            position = self.storage.position(self.dataset)
+            indexed = self._meta("position")
+            if rebuild or indexed is None or self._meta("backend") != self.storage.backend or indexed > position:
+                if indexed is not None:
+                    print("🔨 trades 已被重写，重建钱包索引...")
+                self._reset()
+                indexed = 0
+            if indexed == position:
+                return 0
+
+            added = 0
+            try:
+                for batch in self.storage.iter_located(self.dataset, ["maker", "taker"], indexed):
+                    added += self._add_batch(batch)
+                self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                      [("backend", self.storage.backend), ("position", position)])
+                # 索引项和位置在同一个事务中提交，中途失败时回到上一次的状态
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            return added
+
+    def _add_batch(self, batch: pl.DataFrame) -> int:
+        fills = pl.concat([
+            batch.select(pl.col(role).alias("wallet"), "location", "row", pl.lit(code, dtype=pl.Int64).alias("role"))
+            for role, code in ROLES.items()
+        ]).drop_nulls("wallet")
+        # 按钱包编码排序后插入，写入集中在 B 树的相邻页上
+        fills = fills.sort("wallet", "location", "row")
+        self.conn.executemany("INSERT OR IGNORE INTO fills (wallet, location, row, role) VALUES (?, ?, ?, ?)",
+                              fills.iter_rows())
+        return len(fills)
+
+    def locations(self, wallet: str, role: str = None) -> pl.DataFrame:
+        """钱包的所有成交位置 (location, row)，role 为 'maker' / 'taker' 时只返回该角色"""
+        schema = {"location": pl.Int64, "row": pl.UInt32}
+        code = self.storage.dictionaries.lookup(DATASETS[self.dataset]["dictionaries"]["maker"], [wallet.lower()])[0]
+        if code is None:
+            return pl.DataFrame(schema=schema)
+        sql = "SELECT location, row FROM fills WHERE wallet = ?"
+        params = [code]
+        if role is not None:
+            sql += " AND role = ?"
+            params.append(ROLES[role])
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return pl.DataFrame(rows, schema=schema, orient="row")
+
+    def count(self, wallet: str, role: str = None) -> int:
+        return len(self.locations(wallet, role))
+
+    def fills(self, wallet: str, role: str = None) -> pl.DataFrame:
+        """钱包的所有成交（trades 的整行，按时间排序），先增量更新索引"""
+        self.update()
+        rows = self.storage.take(self.dataset, self.locations(wallet, role))
+        return rows.sort("timestamp", maintain_order=True)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def load_wallet_index(storage=None) -> WalletIndex:
+    """获取钱包索引（按索引文件缓存，同一进程内共享一个连接）"""
+    storage = storage or get_storage()
+    index_file = os.path.join(storage.data_dir, INDEX_FILE.format(backend=storage.backend))
+    with _lock:
+        if index_file not in _indexes:
+            _indexes[index_file] = WalletIndex(storage, index_file=index_file)
+        return _indexes[index_file]
+
+
+def update_wallet_index(storage=None, rebuild: bool = False) -> int:
+    """增量更新钱包索引，返回新增的索引项数；trades 刚被重新创建时应传 rebuild=True"""
+    return load_wallet_index(storage).update(rebuild=rebuild)
+
+
+def wallet_fills(wallet: str, role: str = None, storage=None) -> pl.DataFrame:
+    """
+    钱包作为 maker / taker 的所有 trades
+
+    示例：
+        wallet_fills("0x9d84ce0306f8551e02efef1680475fc0f1dc1344", role="maker")
+    """
+    return load_wallet_index(storage).fills(wallet, role)
@@ -9,7 +9,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from datetime import datetime, timezone, timedelta
-from update_utils.update_goldsky import get_latest_cursor, DEFAULT_DAYS_LIMIT
+from update_utils.update_goldsky import backfill_range, DEFAULT_DAYS_LIMIT
 
 def test_backward_strategy():
     """测试新的回溯策略"""
@@ -30,31 +30,30 @@ def test_backward_strategy():
     print(f"  回溯起点: {start_time.strftime('%Y-%m-%d %H:%M:%S UTC')}")
     print(f"  回溯天数: {DEFAULT_DAYS_LIMIT}")
 
-    # 测试光标获取逻辑
-    print(f"\n🔍 测试光标获取逻辑:")
+    # 测试抓取范围计算逻辑（与 scrape() 增量运行使用的是同一个函数）
+    print(f"\n🔍 测试抓取范围计算逻辑:")
 
     try:
-        timestamp, last_id, sticky_timestamp = get_latest_cursor(DEFAULT_DAYS_LIMIT)
+        lower_timestamp, end_timestamp = backfill_range(DEFAULT_DAYS_LIMIT)
 
-        print(f"  ✅ 光标获取成功!")
+        print(f"  ✅ 抓取范围计算成功!")
         print(f"  📍 返回值:")
-        print(f"    - timestamp: {timestamp}")
-        print(f"    - last_id: {last_id}")
-        print(f"    - sticky_timestamp: {sticky_timestamp}")
-
-        # 验证时间戳是否合理
-        if timestamp > 0:
-            readable_time = datetime.fromtimestamp(timestamp, tz=timezone.utc)
-            print(f"  🕐 时间戳解析: {readable_time.strftime('%Y-%m-%d %H:%M:%S UTC')}")
-
-            # 检查是否在未来（不应该）
-            if timestamp > int(current_time.timestamp()):
-                print(f"  ⚠️  警告: 时间戳在未来")
-            else:
-                print(f"  ✅ 时间戳合理（在当前或过去）")
+        print(f"    - lower_timestamp: {lower_timestamp}")
+        print(f"    - end_timestamp: {end_timestamp}")
+
+        readable_time = datetime.fromtimestamp(lower_timestamp, tz=timezone.utc)
+        print(f"  🕐 抓取起点: {readable_time.strftime('%Y-%m-%d %H:%M:%S UTC')}")
+
+        # 起点不早于回溯起点，终点不在未来（允许 1 秒的右开区间）
+        if lower_timestamp < int(start_time.timestamp()):
+            print(f"  ⚠️  警告: 抓取起点早于回溯起点")
+        elif end_timestamp > int(datetime.now(tz=timezone.utc).timestamp()) + 1:
+            print(f"  ⚠️  警告: 抓取终点在未来")
+        else:
+            print(f"  ✅ 抓取范围合理")
 
     except Exception as e:
-        print(f"  ❌ 光标获取失败: {e}")
+        print(f"  ❌ 抓取范围计算失败: {e}")
         return False
 
     # 检查数据文件
@@ -78,7 +77,7 @@ def test_backward_strategy():
     print(f"\n🔍 GraphQL 查询示例:")
     print(f"  端点: https://api.goldsky.com/api/public/project_cl6mb8i9h0003e201j6li0diw/subgraphs/orderbook-subgraph/0.0.1/gn")
     print(f"  排序: timestamp (desc - 从新到旧)")
-    print(f"  过滤: timestamp >= {int(start_time.timestamp())}")
+    print(f"  过滤: timestamp >= {lower_timestamp}")
     print(f"  批次大小: 1000")
 
     print(f"\n" + "="*70)
@@ -106,12 +105,11 @@ def test_custom_days(days):
     print(f"  回溯起点: {start_time.strftime('%Y-%m-%d %H:%M:%S UTC')}")
 
     try:
-        timestamp, last_id, sticky_timestamp = get_latest_cursor(days)
+        lower_timestamp, end_timestamp = backfill_range(days)
         print(f"\n✅ 自定义天数测试成功!")
 
-        if timestamp > 0:
-            readable_time = datetime.fromtimestamp(timestamp, tz=timezone.utc)
-            print(f"  📍 光标时间: {readable_time.strftime('%Y-%m-%d %H:%M:%S UTC')}")
+        readable_time = datetime.fromtimestamp(lower_timestamp, tz=timezone.utc)
+        print(f"  📍 抓取起点: {readable_time.strftime('%Y-%m-%d %H:%M:%S UTC')}")
     except Exception as e:
         print(f"  ❌ 测试失败: {e}")
         return False
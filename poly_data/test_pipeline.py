@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+测试流水线：markets 阶段比 goldsky / process 阶段结束得晚时，缺失 token 仍然在写入 trades 前被解析
+
+用本地 mock 服务器代替 Goldsky 与 Gamma，在子进程中运行 run_pipeline()（数据目录和端点通过环境变量传入）
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench.mock_server import MockServer, generate_fixtures
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 把 update_markets 换成先等待几秒再运行的版本，让 goldsky / process 先结束
+SLOW_MARKETS_RUN = """
+import time
+from update_utils import pipeline
+update_markets = pipeline.update_markets
+
+def slow_update_markets(*args, **kwargs):
+    time.sleep(3)
+    return update_markets(*args, **kwargs)
+
+pipeline.update_markets = slow_update_markets
+pipeline.run_pipeline(days_limit=10, workers=2)
+"""
+
+CHECK = """
+import polars as pl
+from poly_utils.storage import get_storage
+storage = get_storage()
+trades = storage.scan('trades').select(pl.len(), pl.col('market_id').null_count()).collect()
+print('RESULT', trades.item(0, 0), trades.item(0, 1))
+"""
+
+
+def run(code, env):
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stdout[-2000:] + result.stderr[-2000:])
+        raise AssertionError("子进程运行失败")
+    return result.stdout
+
+
+def test_slow_markets(backend='csv'):
+    """markets 阶段最后结束：trades 中不应出现 market_id 为空的行"""
+    print(f"🧪 测试 markets 阶段慢于 goldsky 阶段 ({backend})")
+    print("=" * 40)
+
+    data_dir = tempfile.mkdtemp(prefix='poly_pipeline_')
+    events, markets = generate_fixtures(n_events=5_000, n_markets=300, days=5, seed=11)
+    server = MockServer(events, markets)
+    # 每5个市场有1个不在 /markets 列表中，只能按 token 查到：这些 token 要靠 missing_tokens 阶段解析
+    server.markets = [market for i, market in enumerate(server.markets) if i % 5]
+    server.start()
+    try:
+        env = dict(
+            os.environ,
+            POLY_DATA_DIR=data_dir,
+            POLY_STORAGE=backend,
+            POLY_GOLDSKY_URL=server.goldsky_url,
+            POLY_GAMMA_URL=server.gamma_url,
+        )
+        run(SLOW_MARKETS_RUN, env)
+        line = [l for l in run(CHECK, env).splitlines() if l.startswith('RESULT')][0]
+        rows, nulls = map(int, line.split()[1:])
+        print(f"  trades: {rows:,} 行，market_id 为空: {nulls}")
+        assert rows > 0, "没有写入任何 trades"
+        assert nulls == 0, f"{nulls} 行 trades 缺少 market_id"
+        print("  ✅ 所有 trades 都有 market_id")
+    finally:
+        server.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    for backend in ('csv', 'parquet'):
+        test_slow_markets(backend)
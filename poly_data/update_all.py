@@ -1,6 +1,7 @@
 from update_utils.update_markets import update_markets
-from update_utils.update_goldsky import update_goldsky
+from update_utils.update_goldsky import update_goldsky, DEFAULT_WORKERS
 from update_utils.process_live import process_live
+from update_utils.pipeline import run_pipeline
 
 # 默认时间范围限制（半年 = 180 天）
 DEFAULT_DAYS_LIMIT = 180
@@ -8,28 +9,45 @@ DEFAULT_DAYS_LIMIT = 180
 if __name__ == "__main__":
     # 获取命令行参数中的天数限制（可选）
     import sys
+    # --pipeline：各阶段并发运行（见 update_utils/pipeline.py）
+    pipeline = '--pipeline' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--pipeline']
+
     days_limit = DEFAULT_DAYS_LIMIT
-    if len(sys.argv) > 1:
+    if len(args) > 0:
         try:
-            days_limit = int(sys.argv[1])
+            days_limit = int(args[0])
             print(f"使用命令行参数: {days_limit} 天")
         except ValueError:
             print(f"无效的参数，使用默认值: {DEFAULT_DAYS_LIMIT} 天")
 
+    # 第二个参数：并行 worker 数（可选），同时用于 Goldsky 分片回填和市场偏移窗口
+    workers = DEFAULT_WORKERS
+    if len(args) > 1:
+        try:
+            workers = int(args[1])
+            print(f"使用 {workers} 个并行 worker 抓取市场和订单数据")
+        except ValueError:
+            print(f"无效的 worker 参数，使用默认值: {DEFAULT_WORKERS}")
+
     print("\n" + "=" * 70)
     print("🚀 Polymarket 数据收集管道")
     print("📊 新策略：从最新数据开始，向前回溯指定天数")
     print(f"⏰ 时间范围: 最近 {days_limit} 天")
     print("=" * 70 + "\n")
 
-    print("📊 步骤 1/3: 更新市场数据")
-    update_markets(days_limit=days_limit)
+    if pipeline:
+        print("📊 流水线模式: 市场、订单抓取、交易处理和缺失令牌解析并发运行")
+        run_pipeline(days_limit=days_limit, workers=workers)
+    else:
+        print("📊 步骤 1/3: 更新市场数据")
+        update_markets(days_limit=days_limit, workers=workers)
 
-    print("\n📊 步骤 2/3: 更新 Goldsky 订单数据")
-    update_goldsky(days_limit=days_limit)
+        print("\n📊 步骤 2/3: 更新 Goldsky 订单数据")
+        update_goldsky(days_limit=days_limit, workers=workers)
 
-    print("\n📊 步骤 3/3: 处理实时交易数据")
-    process_live()
+        print("\n📊 步骤 3/3: 处理实时交易数据")
+        process_live()
 
     print("\n" + "=" * 70)
     print("✅ 数据收集完成！")
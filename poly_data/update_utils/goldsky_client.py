@@ -0,0 +1,123 @@
+"""共享的 Goldsky GraphQL 客户端
+
+整个抓取过程（所有分页、所有分片）复用同一个 keep-alive、带连接池的 HTTP 会话，
+避免每页重新建立 TCP/TLS 连接，并统一重试 / 退避策略和请求统计。
+"""
+
+import time
+import threading
+from gql import Client
+from gql.transport.requests import RequestsHTTPTransport
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 需要自动重试的 HTTP 状态码（限流 + 服务端错误）
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class PooledRequestsHTTPTransport(RequestsHTTPTransport):
+    """连接池大小可配置、带指数退避重试的 RequestsHTTPTransport"""
+
+    def __init__(self, url: str, pool_size: int = 10, retries: int = 5,
+                 retry_backoff_factor: float = 0.5, **kwargs):
+        super().__init__(url=url, retries=retries, retry_backoff_factor=retry_backoff_factor,
+                         retry_status_forcelist=RETRY_STATUS_CODES, **kwargs)
+        self.pool_size = pool_size
+        self.adapter = None
+
+    def connect(self):
+        if self.session is not None:
+            return
+        self.session = Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(
+                total=self.retries,
+                backoff_factor=self.retry_backoff_factor,
+                status_forcelist=self.retry_status_forcelist,
+                allowed_methods=None,  # GraphQL 查询是只读的 POST，可以安全重试
+                respect_retry_after_header=True,
+            ),
+        )
+        for prefix in "http://", "https://":
+            self.session.mount(prefix, self.adapter)
+
+    def connection_stats(self):
+        """返回 (HTTP 请求数, 新建连接数)，数据来自 urllib3 连接池计数"""
+        if self.adapter is None:
+            return 0, 0
+        # requests 按 TLS 参数区分连接池的键，这里直接汇总所有已创建的池
+        pools = self.adapter.poolmanager.pools
+        http_requests = connections = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                http_requests += pool.num_requests
+                connections += pool.num_connections
+        return http_requests, connections
+
+
+class GoldskyClient:
+    """线程安全的 Goldsky 查询客户端，所有 worker 共享一个实例"""
+
+    def __init__(self, url: str, pool_size: int = 10, retries: int = 5,
+                 retry_backoff_factor: float = 0.5, timeout: int = 60):
+        self.transport = PooledRequestsHTTPTransport(
+            url=url, pool_size=pool_size, retries=retries,
+            retry_backoff_factor=retry_backoff_factor, timeout=timeout, verify=True,
+        )
+        self.client = Client(transport=self.transport)
+        self.session = self.client.connect_sync()
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.failures = 0
+
+    def execute(self, query):
+        """执行查询并记录耗时（包含传输层重试）"""
+        start = time.perf_counter()
+        try:
+            return self.session.execute(query)
+        except Exception:
+            with self.lock:
+                self.failures += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies.append(elapsed)
+
+    def stats(self):
+        """汇总请求数、连接复用率和延迟分布"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            failures = self.failures
+        http_requests, connections = self.transport.connection_stats()
+        stats = {
+            'queries': len(latencies),
+            'failures': failures,
+            'http_requests': http_requests,
+            'connections': connections,
+            'reused': max(http_requests - connections, 0),
+        }
+        if latencies:
+            stats.update({
+                'latency_mean': sum(latencies) / len(latencies),
+                'latency_p50': latencies[len(latencies) // 2],
+                'latency_p95': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+                'latency_max': latencies[-1],
+            })
+        return stats
+
+    def report(self):
+        stats = self.stats()
+        print(f"\n🌐 连接统计: {stats['queries']} 次查询, {stats['http_requests']} 次 HTTP 请求, "
+              f"新建连接 {stats['connections']} 个, 复用 {stats['reused']} 次, 失败 {stats['failures']} 次")
+        if stats['queries']:
+            print(f"⏱️ 请求延迟: 平均 {stats['latency_mean'] * 1000:.0f} ms, p50 {stats['latency_p50'] * 1000:.0f} ms, "
+                  f"p95 {stats['latency_p95'] * 1000:.0f} ms, 最大 {stats['latency_max'] * 1000:.0f} ms")
+        return stats
+
+    def close(self):
+        self.client.close_sync()
@@ -0,0 +1,239 @@
+"""orderFilled 流式追加写入器
+
+每抓到一页就立即落盘，并通过磁盘上的紧凑 id 索引去重，
+使增量运行的内存和 I/O 只与新数据量成正比，而不是与全部历史成正比。
+"""
+
+import io
+import os
+import shutil
+import sqlite3
+import hashlib
+import threading
+import polars as pl
+
+
+def id_digest(event_id: str) -> int:
+    """把事件 id 压缩为 64 位有符号整数（blake2b 摘要），作为索引键"""
+    digest = hashlib.blake2b(event_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class IdIndex:
+    """orderFilled 事件 id 的磁盘索引
+
+    每个 id 只存 8 字节摘要（SQLite INTEGER PRIMARY KEY），查找为 O(log n)，
+    不需要把历史 id 读入内存。新插入的键在 commit() 之前对其他进程不可见，
+    因此调用方应在数据文件落盘之后再提交索引。
+    """
+
+    def __init__(self, index_file: str):
+        self.index_file = index_file
+        self.conn = sqlite3.connect(index_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS ids (key INTEGER PRIMARY KEY)')
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM ids').fetchone()[0]
+
+    def add_new(self, event_ids):
+        """插入一批 id，返回此前不在索引中的那些 id 的位置列表"""
+        new_positions = []
+        for i, event_id in enumerate(event_ids):
+            cursor = self.conn.execute('INSERT OR IGNORE INTO ids (key) VALUES (?)', (id_digest(event_id),))
+            if cursor.rowcount == 1:
+                new_positions.append(i)
+        return new_positions
+
+    def build(self, batches):
+        """从已有数据一次性重建索引（仅在索引文件缺失时需要），batches 为包含 id 列的 DataFrame 序列"""
+        total = 0
+        for batch in batches:
+            keys = [(id_digest(event_id),) for event_id in batch['id'].to_list() if event_id is not None]
+            self.conn.executemany('INSERT OR IGNORE INTO ids (key) VALUES (?)', keys)
+            total += len(keys)
+        self.conn.commit()
+        return total
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+class OrderFilledWriter:
+    """按页流式写入 orderFilled 数据
+
+    - 每页去重后立即写入暂存文件（按 segment 区分，例如每个时间分片一个），内存中只保留页偏移
+    - close() 时按时间从旧到新把各 segment 的页倒序追加到存储层，
+      因为抓取是从新到旧进行的，倒序拼接后数据保持时间升序
+    - 数据落盘之后才提交 id 索引，崩溃时索引不会领先于数据
+    - checkpoint() 把暂存文件刷到磁盘并返回页列表；以 resume 传回该状态即可保留已暂存的页继续写入
+    - close() 之后由调用方在删除检查点后调用 discard() 清理暂存文件
+    """
+
+    def __init__(self, storage, dataset: str = 'orderFilled', index_file: str = None, resume: dict = None,
+                 reverse_pages: bool = True, listener=None):
+        self.storage = storage
+        self.dataset = dataset
+        self.index_file = index_file or os.path.join(storage.data_dir, f'{dataset}.ids.sqlite')
+        self.staging_dir = os.path.join(storage.data_dir, f'{dataset}.staging')
+        self.lock = threading.Lock()
+        # 从新到旧抓取时每个 segment 内的页需要倒序拼接；向前（升序）抓取时按写入顺序拼接
+        self.reverse_pages = reverse_pages
+        # listener(segment, new_df)：每页去重后的新行，供下游（例如流水线中的交易处理）即时消费
+        self.listener = listener
+        self.segments = {}
+        self.total_new = 0
+        self.total_duplicates = 0
+        self.closed = False
+
+        # 不恢复时，上次运行中断留下的暂存数据对应的 id 从未提交，直接丢弃即可
+        if resume is None and os.path.isdir(self.staging_dir):
+            shutil.rmtree(self.staging_dir)
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+        self.header = storage.header(dataset)
+
+        index_exists = os.path.isfile(self.index_file)
+        self.index = IdIndex(self.index_file)
+        if not index_exists and self.header is not None:
+            print(f"🔨 首次运行：从 {storage.path(dataset)} 构建 id 索引...")
+            built = self.index.build(storage.iter_batches(dataset, ['id']))
+            print(f"✅ id 索引构建完成：{built:,} 条")
+
+        if resume is not None:
+            self._restore(resume)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.staging_dir, f'segment-{segment}.csv')
+
+    def checkpoint(self):
+        """把暂存文件刷到磁盘，返回可用于恢复的状态（JSON 可序列化）
+
+        调用方需保证期间没有并发的 write_page，返回的页列表与磁盘内容一致
+        """
+        with self.lock:
+            segments = {}
+            for segment, seg in self.segments.items():
+                if not seg['file'].closed:
+                    seg['file'].flush()
+                    os.fsync(seg['file'].fileno())
+                segments[str(segment)] = [list(page) for page in seg['pages']]
+            return {
+                'header': self.header,
+                'segments': segments,
+                'total_new': self.total_new,
+                'total_duplicates': self.total_duplicates,
+            }
+
+    def _restore(self, state):
+        """恢复 checkpoint() 记录的暂存页：截掉检查点之后写入的部分，并把已暂存的 id 重新加入索引"""
+        self.header = state['header'] or self.header
+        restored = 0
+        for key, pages in state['segments'].items():
+            segment = int(key)
+            path = self._segment_path(segment)
+            end = pages[-1][1] if pages else 0
+            f = open(path, 'r+b' if os.path.isfile(path) else 'w+b')
+            if f.seek(0, os.SEEK_END) < end:
+                f.close()
+                raise ValueError(f"暂存文件 {path} 比检查点记录的短，无法恢复")
+            f.truncate(end)
+            f.seek(end)
+
+            # 索引的未提交部分在崩溃时已回滚，按页重新插入暂存数据的 id
+            with open(path, 'rb') as src:
+                for start, stop in pages:
+                    src.seek(start)
+                    ids = pl.read_csv(io.BytesIO(src.read(stop - start)), has_header=False,
+                                      new_columns=self.header, infer_schema=False)['id']
+                    self.index.add_new(ids.to_list())
+                    restored += len(ids)
+            self.segments[segment] = {'path': path, 'file': f, 'pages': [tuple(page) for page in pages]}
+
+        self.total_new = state['total_new']
+        self.total_duplicates = state['total_duplicates']
+        print(f"♻️ 恢复暂存数据：{len(self.segments)} 个 segment，{restored:,} 条记录")
+
+    def write_page(self, df, segment=0):
+        """去重并暂存一页数据（pandas DataFrame，已按 timestamp/id 升序），返回新增行数"""
+        if len(df) == 0:
+            return 0
+
+        with self.lock:
+            if self.header is None:
+                schema = self.storage.schema(self.dataset)
+                self.header = [col for col in schema if col in df.columns]
+            new_positions = self.index.add_new(df['id'].tolist())
+            self.total_duplicates += len(df) - len(new_positions)
+            if not new_positions:
+                return 0
+            if segment not in self.segments:
+                path = self._segment_path(segment)
+                self.segments[segment] = {'path': path, 'file': open(path, 'wb'), 'pages': []}
+            seg = self.segments[segment]
+
+        new_df = df.iloc[new_positions]
+        data = new_df.to_csv(index=False, header=False, columns=self.header).encode('utf-8')
+        start = seg['file'].tell()
+        seg['file'].write(data)
+        seg['pages'].append((start, start + len(data)))
+
+        with self.lock:
+            self.total_new += len(new_df)
+        if self.listener is not None:
+            self.listener(segment, new_df)
+        return len(new_df)
+
+    def _staged_pages(self):
+        """按时间升序依次产出暂存页的字节：segment 键越小时间越早，每个 segment 内的页默认是从新到旧写入的"""
+        for segment in sorted(self.segments):
+            seg = self.segments[segment]
+            seg['file'].close()
+            with open(seg['path'], 'rb') as src:
+                for start, end in (reversed(seg['pages']) if self.reverse_pages else seg['pages']):
+                    src.seek(start)
+                    yield src.read(end - start)
+
+    def _close_files(self):
+        for seg in self.segments.values():
+            if not seg['file'].closed:
+                seg['file'].close()
+
+    def close(self):
+        """把暂存页按时间升序追加到存储层并提交索引，返回新增行数
+
+        暂存文件在调用 discard() 之前一直保留，失败时可以通过检查点恢复后重试
+        """
+        try:
+            if self.total_new > 0:
+                self.storage.append_csv_bytes(self.dataset, self.header, self._staged_pages())
+            self.index.commit()
+        except BaseException:
+            self.abort()
+            raise
+
+        self._close_files()
+        self.index.close()
+        self.closed = True
+        return self.total_new
+
+    def abort(self):
+        """放弃本次运行未提交的索引（主文件保持不变），暂存文件留给检查点恢复"""
+        if self.closed:
+            return
+        self._close_files()
+        self.index.rollback()
+        self.index.close()
+        self.closed = True
+
+    def discard(self):
+        """删除暂存文件（不再恢复时调用）"""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
@@ -0,0 +1,305 @@
+"""
+流水线版 update_all：各阶段并发运行，通过有界队列衔接
+
+- markets：update_markets() 与订单抓取同时进行
+- goldsky：scrape() 每页去重后的新行立即放入页队列（有界，下游跟不上时抓取会等待）
+- process：逐页转换为 trades 并暂存为 Arrow IPC；遇到未知 token 的页先暂存原始行，
+  未知 token 放入 token 队列
+- missing_tokens：市场数据更新完成后，批量解析仍然缺失的 token
+
+所有页抓取完成后按时间顺序把暂存页追加到 trades，并推进 process_live 的检查点；
+无法保证与 orderFilled 对齐时（上次抓取中断、trades 落后等）退回到顺序执行的 process_live()。
+结束时输出每个阶段的起止时间、耗时，以及阶段之间的重叠时间。
+"""
+import os
+import sys
+import time
+import queue
+import shutil
+import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import polars as pl
+from poly_utils.storage import get_storage, conform_frame
+from poly_utils.token_index import load_token_index
+from poly_utils.wallet_index import update_wallet_index
+from poly_utils.utils import update_missing_tokens
+from update_utils import update_goldsky
+from update_utils.update_markets import update_markets
+from update_utils.process_live import get_processed_lazy, load_checkpoint, save_checkpoint, process_live
+
+PAGE_QUEUE_SIZE = 64       # goldsky → process 的页队列容量
+TOKEN_QUEUE_SIZE = 256     # process → missing_tokens 的队列容量
+TOKEN_BATCH = 500          # 每累计多少个缺失 token 解析一次
+STAGING_DIR = 'trades.pipeline'
+
+_DONE = object()
+
+
+class StageTimer:
+    """记录各阶段的起止时间，结束后汇总耗时与重叠"""
+
+    def __init__(self):
+        self.origin = time.time()
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    def begin(self, name):
+        with self.lock:
+            self.spans.setdefault(name, [time.time(), None])
+
+    def end(self, name):
+        with self.lock:
+            if name in self.spans:
+                self.spans[name][1] = time.time()
+
+    def overlap(self):
+        """返回 (每个阶段与其他阶段重叠的秒数, 至少两个阶段同时运行的秒数, 所有阶段覆盖的秒数)"""
+        spans = {name: (start, end) for name, (start, end) in self.spans.items() if end is not None}
+        points = sorted({t for span in spans.values() for t in span})
+        per_stage = {name: 0.0 for name in spans}
+        concurrent = covered = 0.0
+        for left, right in zip(points, points[1:]):
+            active = [name for name, (start, end) in spans.items() if start <= left and end >= right]
+            if active:
+                covered += right - left
+            if len(active) >= 2:
+                concurrent += right - left
+                for name in active:
+                    per_stage[name] += right - left
+        return per_stage, concurrent, covered
+
+    def report(self):
+        per_stage, concurrent, covered = self.overlap()
+        total = sum(end - start for start, end in self.spans.values() if end is not None)
+        wall = time.time() - self.origin
+
+        # 中文标题每个字占两列宽，按显示宽度对齐
+        print(f"\n{'阶段':<14}{'开始':>7}{'结束':>7}{'耗时':>7}{'重叠':>7}")
+        for name, (start, end) in self.spans.items():
+            if end is None:
+                print(f"{name:<16}{start - self.origin:>8.1f}s{'-':>9}{'-':>9}{'-':>9}")
+                continue
+            print(f"{name:<16}{start - self.origin:>8.1f}s{end - self.origin:>8.1f}s"
+                  f"{end - start:>8.1f}s{per_stage[name]:>8.1f}s")
+        print(f"⏱️ 总耗时 {wall:.1f} 秒；各阶段耗时合计 {total:.1f} 秒（顺序执行的估计）")
+        if covered:
+            print(f"🔀 至少两个阶段同时运行 {concurrent:.1f} 秒（占 {concurrent / covered:.0%}），"
+                  f"比顺序执行节省 {max(total - covered, 0):.1f} 秒")
+
+
+class TradeStager:
+    """process 阶段：把 orderFilled 页转换为 trades 并暂存，保留每个 segment 内的页顺序"""
+
+    def __init__(self, storage, token_queue):
+        self.storage = storage
+        self.token_queue = token_queue
+        self.dir = os.path.join(storage.data_dir, STAGING_DIR)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir)
+        self.index = load_token_index(storage)
+        self.index_changed = threading.Event()
+        self.pages = {}
+        self.queued_tokens = set()
+        self.rows = self.raw_pages = 0
+
+    def add(self, segment, page):
+        if self.index_changed.is_set():
+            self.index_changed.clear()
+            self.index = load_token_index(self.storage)
+
+        raw = conform_frame('orderFilled', pl.from_pandas(page.astype(str)))
+        raw = raw.with_columns(pl.from_epoch(pl.col('timestamp'), time_unit='s').alias('timestamp'))
+        nonusdc = raw.select(
+            pl.when(pl.col('makerAssetId') != '0').then(pl.col('makerAssetId'))
+            .otherwise(pl.col('takerAssetId')).alias('token')
+        )
+        unknown = nonusdc.filter(self.index.encode(pl.col('token')).is_null())['token'].unique().to_list()
+
+        pages = self.pages.setdefault(segment, [])
+        path = os.path.join(self.dir, f'{segment:06d}-{len(pages):06d}.arrow')
+        if unknown:
+            # 页内有未知 token：先保存原始行，最终追加前用更新后的索引处理
+            raw.write_ipc(path)
+            pages.append((path, 'raw'))
+            self.raw_pages += 1
+            tokens = [token for token in unknown if token not in self.queued_tokens]
+            if tokens:
+                self.queued_tokens.update(tokens)
+                self.token_queue.put(tokens)
+        else:
+            get_processed_lazy(raw.lazy(), token_index=self.index).collect().write_ipc(path)
+            pages.append((path, 'trades'))
+        self.rows += len(raw)
+
+    def staged(self):
+        """按时间升序返回所有暂存页组成的 LazyFrame（与 OrderFilledWriter 的追加顺序一致）"""
+        index = load_token_index(self.storage)
+        frames = []
+        for segment in sorted(self.pages):
+            for path, kind in reversed(self.pages[segment]):
+                lf = pl.scan_ipc(path)
+                frames.append(get_processed_lazy(lf, token_index=index) if kind == 'raw' else lf)
+        return pl.concat(frames) if frames else None
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def can_stage(storage):
+    """
+    暂存的 trades 只覆盖本次新抓取的行，只有 trades 已处理到 orderFilled 末尾时才能直接追加；
+    旧版本写入的 trades（字符串钱包列）需要由 process_live() 重新生成
+    """
+    if os.path.isfile(update_goldsky.CURSOR_FILE):
+        return False
+    if not storage.exists('trades'):
+        return not storage.exists('orderFilled')
+    if not storage.is_encoded('trades'):
+        return False
+    checkpoint = load_checkpoint(storage)
+    return checkpoint is not None and checkpoint['position'] == storage.position('orderFilled')
+
+
+def run_pipeline(days_limit: int = update_goldsky.DEFAULT_DAYS_LIMIT, workers: int = update_goldsky.DEFAULT_WORKERS):
+    """并发运行 markets / goldsky / process / missing_tokens 四个阶段"""
+    storage = get_storage()
+    timer = StageTimer()
+    errors = []
+    markets_done = threading.Event()
+    page_queue = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+    token_queue = queue.Queue(maxsize=TOKEN_QUEUE_SIZE)
+
+    staged = can_stage(storage)
+    stager = TradeStager(storage, token_queue) if staged else None
+    if not staged:
+        print("⚠️ trades 未与 orderFilled 对齐（或上次抓取未完成），抓取完成后改为运行 process_live()")
+
+    def stage(name, fn, timed=True):
+        """timed 为 False 时由 fn 自己记录起止时间"""
+        def target():
+            if timed:
+                timer.begin(name)
+            try:
+                fn()
+            except BaseException as e:
+                errors.append((name, e))
+                print(f"❌ 阶段 {name} 出错: {e}")
+            finally:
+                if timed:
+                    timer.end(name)
+        return threading.Thread(target=target, name=name, daemon=True)
+
+    def run_markets():
+        try:
+            update_markets(days_limit=days_limit, workers=workers)
+        finally:
+            markets_done.set()
+            if stager is not None:
+                stager.index_changed.set()
+
+    def run_goldsky():
+        listener = (lambda segment, page: page_queue.put((segment, page))) if staged else None
+        try:
+            update_goldsky.scrape(days_limit=days_limit, workers=workers, page_listener=listener)
+        finally:
+            page_queue.put(_DONE)
+
+    def run_process():
+        try:
+            while True:
+                item = page_queue.get()
+                if item is _DONE:
+                    timer.end('process')
+                    return
+                timer.begin('process')
+                stager.add(*item)
+        except BaseException:
+            # 继续取走剩余的页，避免抓取阶段阻塞在已满的队列上
+            _drain(page_queue)
+            raise
+        finally:
+            token_queue.put(_DONE)
+
+    def run_missing_tokens():
+        pending = set()
+        finished = False
+
+        def resolve():
+            timer.begin('missing_tokens')
+            index = load_token_index(storage)
+            update_missing_tokens([token for token in pending if index.get(token) is None])
+            pending.clear()
+            stager.index_changed.set()
+            timer.end('missing_tokens')
+
+        try:
+            while not finished:
+                # 市场数据更新完成之前只收集 token，不阻塞上游
+                try:
+                    item = token_queue.get(timeout=0.5)
+                except queue.Empty:
+                    item = None
+                if item is _DONE:
+                    finished = True
+                elif item:
+                    pending.update(item)
+                if pending and markets_done.is_set() and len(pending) >= TOKEN_BATCH:
+                    resolve()
+
+            # 上游已结束但 markets 可能仍在运行：等它完成后再解析剩余的 token，
+            # 否则这些 token 的暂存页会以空 market_id 写入 trades
+            markets_done.wait()
+            if pending:
+                resolve()
+        except BaseException:
+            if not finished:
+                _drain(token_queue)
+            raise
+
+    # process / missing_tokens 的时间按实际工作区间记录（第一页到达 / 第一次解析起），不计等待上游的时间
+    threads = [stage('markets', run_markets), stage('goldsky', run_goldsky)]
+    if staged:
+        threads += [stage('process', run_process, timed=False), stage('missing_tokens', run_missing_tokens, timed=False)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        if stager is not None:
+            stager.cleanup()
+        timer.report()
+        name, error = errors[0]
+        raise RuntimeError(f"阶段 {name} 失败") from error
+
+    if staged:
+        timer.begin('append_trades')
+        lf = stager.staged()
+        checkpoint = load_checkpoint(storage)
+        rows = checkpoint['rows'] if checkpoint else 0
+        created = not storage.exists('trades')
+        new_rows = storage.sink('trades', lf) if lf is not None else 0
+        save_checkpoint(storage, storage.position('orderFilled'), rows + new_rows)
+        update_wallet_index(storage, rebuild=created)
+        stager.cleanup()
+        timer.end('append_trades')
+        print(f"✓ 追加 {new_rows:,} 行到 {storage.path('trades')}（{stager.raw_pages} 页在追加前补全了 token）")
+    else:
+        timer.begin('process')
+        process_live()
+        timer.end('process')
+
+    timer.report()
+
+
+def _drain(q):
+    """丢弃队列中剩余的元素，让阻塞在 put() 上的上游继续运行直到结束"""
+    def consume():
+        while q.get() is not _DONE:
+            pass
+    threading.Thread(target=consume, daemon=True).start()
+
+
+if __name__ == "__main__":
+    run_pipeline()
@@ -3,185 +3,218 @@ warnings.filterwarnings('ignore')
 
 import sys
 import os
+import json
+import time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import polars as pl
-from poly_utils.utils import get_markets, update_missing_tokens
-
-import subprocess
-
-import pandas as pd
-
-def get_processed_df(df):
-    markets_df = get_markets()
-    markets_df = markets_df.rename({'id': 'market_id'})
-
-    # 1) Make markets long: (market_id, side, asset_id) where side ∈ {"token1", "token2"}
-    markets_long = (
-        markets_df
-        .select(["market_id", "token1", "token2"])
-        .melt(id_vars="market_id", value_vars=["token1", "token2"],
-            variable_name="side", value_name="asset_id")
-    )
-
-    # 2) Identify the non-USDC asset for each trade (the one that isn't 0)
-    df = df.with_columns(
-        pl.when(pl.col("makerAssetId") != "0")
-        .then(pl.col("makerAssetId"))
-        .otherwise(pl.col("takerAssetId"))
-        .alias("nonusdc_asset_id")
-    )
-
-    # 3) Join once on that non-USDC asset to recover the market + side ("token1" or "token2")
-    df = df.join(
-        markets_long,
-        left_on="nonusdc_asset_id",
-        right_on="asset_id",
-        how="left",
-    )
+from poly_utils.token_index import load_token_index, build_token_index
+from poly_utils.wallet_index import update_wallet_index
+from poly_utils.storage import get_storage, DATA_DIR
+
+# orderFilled 的处理进度（存储位置 + 已处理行数），每次运行只读取其后追加的数据
+CHECKPOINT_FILE = os.path.join(DATA_DIR, 'process_live_checkpoint.json')
+
+
+def get_processed_lazy(lf, markets_df=None, token_index=None):
+    """
+    把 orderFilled 的 LazyFrame 转换为 trades 的 LazyFrame
+
+    所有列计算都在同一个惰性查询计划里完成，配合流式引擎和 sink 使用时内存占用与数据总量无关；
+    token_index 可以传入已加载的索引，避免逐页处理时重复检查
+    """
+    # token → (market_id, side) 索引：持久化在磁盘上，token 已编码为整数
+    if token_index is None:
+        token_index = load_token_index() if markets_df is None else build_token_index(markets_df)
+
+    # 1) Identify the non-USDC asset for each trade (the one that isn't 0)
+    # 2) Encode it once, then recover the market + side ("token1" or "token2") by integer lookup
+    lf = lf.with_columns(
+        token_index.encode(
+            pl.when(pl.col("makerAssetId") != "0")
+            .then(pl.col("makerAssetId"))
+            .otherwise(pl.col("takerAssetId"))
+        ).alias("nonusdc_code")
+    ).with_columns([
+        token_index.market_id(pl.col("nonusdc_code")).alias("market_id"),
+        token_index.side(pl.col("nonusdc_code")).cast(pl.Utf8).alias("side"),
+    ])
 
-    # 4) label columns and keep market_id
-    df = df.with_columns([
+    # 3) label assets and scale amounts to USDC units
+    lf = lf.with_columns([
         pl.when(pl.col("makerAssetId") == "0").then(pl.lit("USDC")).otherwise(pl.col("side")).alias("makerAsset"),
         pl.when(pl.col("takerAssetId") == "0").then(pl.lit("USDC")).otherwise(pl.col("side")).alias("takerAsset"),
-        pl.col("market_id"),
-    ])
-
-    df = df[['timestamp', 'market_id', 'maker', 'makerAsset', 'makerAmountFilled', 'taker', 'takerAsset', 'takerAmountFilled', 'transactionHash']]
-
-    df = df.with_columns([
         (pl.col("makerAmountFilled") / 10**6).alias("makerAmountFilled"),
         (pl.col("takerAmountFilled") / 10**6).alias("takerAmountFilled"),
     ])
 
-    df = df.with_columns(
-        pl.when(pl.col("takerAsset") == "USDC")
-        .then(pl.lit("BUY"))
-        .otherwise(pl.lit("SELL"))
-        .alias("taker_direction")
-    )
-
-    df = df.with_columns([
-        pl.when(pl.col("takerAsset") == "USDC")
-        .then(pl.lit("BUY"))
-        .otherwise(pl.lit("SELL"))
-        .alias("taker_direction"),
-
-        # reverse of taker_direction
-        pl.when(pl.col("takerAsset") == "USDC")
-        .then(pl.lit("SELL"))
-        .otherwise(pl.lit("BUY"))
-        .alias("maker_direction"),
-    ])
-
-    df = df.with_columns([
+    # 4) derive all trade columns in a single projection
+    taker_pays_usdc = pl.col("takerAsset") == "USDC"
+    return lf.select([
+        "timestamp",
+        "market_id",
+        "maker",
+        "taker",
         pl.when(pl.col("makerAsset") != "USDC")
         .then(pl.col("makerAsset"))
         .otherwise(pl.col("takerAsset"))
         .alias("nonusdc_side"),
 
-        pl.when(pl.col("takerAsset") == "USDC")
+        # maker_direction is the reverse of taker_direction
+        pl.when(taker_pays_usdc).then(pl.lit("SELL")).otherwise(pl.lit("BUY")).alias("maker_direction"),
+        pl.when(taker_pays_usdc).then(pl.lit("BUY")).otherwise(pl.lit("SELL")).alias("taker_direction"),
+
+        pl.when(taker_pays_usdc)
+        .then(pl.col("takerAmountFilled") / pl.col("makerAmountFilled"))
+        .otherwise(pl.col("makerAmountFilled") / pl.col("takerAmountFilled"))
+        .cast(pl.Float64)
+        .alias("price"),
+        pl.when(taker_pays_usdc)
         .then(pl.col("takerAmountFilled"))
         .otherwise(pl.col("makerAmountFilled"))
         .alias("usd_amount"),
-        pl.when(pl.col("takerAsset") != "USDC")
+        pl.when(taker_pays_usdc.not_())
         .then(pl.col("takerAmountFilled"))
         .otherwise(pl.col("makerAmountFilled"))
         .alias("token_amount"),
-        pl.when(pl.col("takerAsset") == "USDC")
-        .then(pl.col("takerAmountFilled") / pl.col("makerAmountFilled"))
-        .otherwise(pl.col("makerAmountFilled") / pl.col("takerAmountFilled"))
-        .cast(pl.Float64)
-        .alias("price")
+
+        "transactionHash",
     ])
 
 
-    df = df[['timestamp', 'market_id', 'maker', 'taker', 'nonusdc_side', 'maker_direction', 'taker_direction', 'price', 'usd_amount', 'token_amount', 'transactionHash']]
-    return df
+def get_processed_df(df):
+    return get_processed_lazy(df.lazy()).collect(streaming=True)
+
+
+def load_checkpoint(storage):
+    """读取 orderFilled 的处理进度，不存在或与当前存储后端不匹配时返回 None"""
+    if not os.path.isfile(CHECKPOINT_FILE):
+        return None
+    try:
+        with open(CHECKPOINT_FILE, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Error reading checkpoint: {e}")
+        return None
+    if state.get('backend') != storage.backend:
+        print(f"⚠️ Checkpoint belongs to '{state.get('backend')}' storage, ignoring")
+        return None
+    return state
+
+
+def save_checkpoint(storage, position, rows):
+    """原子地写入处理进度：position 为 orderFilled 的存储位置，rows 为累计处理的行数"""
+    state = {
+        'backend': storage.backend,
+        'position': position,
+        'rows': rows,
+        'updated_at': int(time.time()),
+    }
+    tmp_file = CHECKPOINT_FILE + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, CHECKPOINT_FILE)
 
 
+def find_resume_index(df, last_processed):
+    """没有检查点时（旧版本生成的 trades），通过最后一条 trade 在 orderFilled 中定位续传位置"""
+    df = df.with_row_index()
+
+    same_timestamp = df.filter(pl.col('timestamp') == last_processed['timestamp'])
+    same_timestamp = same_timestamp.filter(
+        (pl.col("transactionHash") == last_processed['transactionHash']) & (pl.col("maker") == last_processed['maker']) & (pl.col("taker") == last_processed['taker'])
+    )
+
+    return df.filter(pl.col('index') > same_timestamp.row(0)[0]).drop('index')
+
 
 def process_live():
-    processed_file = '/Users/yangsmac/Desktop/poly_data/trades.csv'
+    storage = get_storage()
+    processed_path = storage.path('trades')
 
     print("=" * 60)
     print("🔄 Processing Live Trades")
     print("=" * 60)
 
+    checkpoint = None
     last_processed = {}
-    is_resuming = False
-
-    if os.path.exists(processed_file):
-        print(f"✓ Found existing processed file: {processed_file}")
-        try:
-            result = subprocess.run(['tail', '-n', '1', processed_file], capture_output=True, text=True)
-            last_line = result.stdout.strip()
-            splitted = last_line.split(',')
-
-            last_processed['timestamp'] = pd.to_datetime(splitted[0])
-            last_processed['transactionHash'] = splitted[-1]
-            last_processed['maker'] = splitted[2]
-            last_processed['taker'] = splitted[3]
-
-            print(f"📍 Resuming from: {last_processed['timestamp']}")
-            print(f"   Last hash: {last_processed['transactionHash'][:16]}...")
-            is_resuming = True
-        except Exception as e:
-            print(f"⚠️ Error reading processed file: {e}")
-            print("⚠ No existing processed file found - processing from beginning")
+
+    if storage.exists('trades') and not storage.is_encoded('trades'):
+        # 旧版本的 trades 以字符串存储钱包地址和交易哈希：删除后从 orderFilled 重新生成（写入时自动编码）
+        print(f"🔨 {processed_path} uses string wallet columns, rebuilding with integer-encoded columns...")
+        storage.clear('trades')
+        if os.path.isfile(CHECKPOINT_FILE):
+            os.remove(CHECKPOINT_FILE)
+
+    if storage.exists('trades'):
+        print(f"✓ Found existing processed data: {processed_path}")
+        checkpoint = load_checkpoint(storage)
+        if checkpoint is not None:
+            print(f"📍 Resuming from checkpoint: position {checkpoint['position']:,} ({checkpoint['rows']:,} rows processed)")
+        else:
+            # 旧数据没有检查点：退回到按最后一条 trade 匹配的方式，本次运行后写入检查点
+            try:
+                last_row = storage.decode('trades', pl.DataFrame([storage.last_row('trades')])).row(0, named=True)
+
+                last_processed['timestamp'] = last_row['timestamp']
+                last_processed['transactionHash'] = last_row['transactionHash']
+                last_processed['maker'] = last_row['maker']
+                last_processed['taker'] = last_row['taker']
+
+                print(f"📍 No checkpoint, resuming from: {last_processed['timestamp']}")
+                print(f"   Last hash: {last_processed['transactionHash'][:16]}...")
+            except Exception as e:
+                print(f"⚠️ Error reading processed data: {e}")
+                print("⚠ No existing processed data found - processing from beginning")
     else:
-        print("⚠ No existing processed file found - processing from beginning")
+        print("⚠ No existing processed data found - processing from beginning")
 
-    print(f"\n📂 Reading: /Users/yangsmac/Desktop/poly_data/orderFilled.csv")
+    start_position = checkpoint['position'] if checkpoint else 0
+    processed_rows = checkpoint['rows'] if checkpoint else 0
 
-    schema_overrides = {
-        "takerAssetId": pl.Utf8,
-        "makerAssetId": pl.Utf8,
-    }
+    print(f"\n📂 Reading: {storage.path('orderFilled')}")
+
+    try:
+        lf, end_position = storage.scan_since('orderFilled', start_position)
+    except ValueError as e:
+        print(f"❌ Checkpoint is no longer valid: {e}")
+        print(f"   Delete {CHECKPOINT_FILE} and {processed_path} to rebuild trades from scratch")
+        raise
 
-    df = pl.scan_csv("/Users/yangsmac/Desktop/poly_data/orderFilled.csv", schema_overrides=schema_overrides).collect(streaming=True)
-    df = df.with_columns(
+    # 只读取检查点之后新增的数据
+    lf = lf.with_columns(
         pl.from_epoch(pl.col('timestamp'), time_unit='s').alias('timestamp')
     )
 
-    print(f"✓ Loaded {len(df):,} rows")
-
-    if is_resuming:
-        # 续传模式：从上次停止的地方继续
-        df = df.with_row_index()
-
-        same_timestamp = df.filter(pl.col('timestamp') == last_processed['timestamp'])
-        same_timestamp = same_timestamp.filter(
-            (pl.col("transactionHash") == last_processed['transactionHash']) & (pl.col("maker") == last_processed['maker']) & (pl.col("taker") == last_processed['taker'])
-        )
-
-        df_process = df.filter(pl.col('index') > same_timestamp.row(0)[0])
-        df_process = df_process.drop('index')
-    else:
-        # 新模式：处理所有数据
+    if last_processed:
+        # 迁移旧数据需要行号定位，只有这一次会物化 orderFilled
+        df = lf.collect(streaming=True)
+        print(f"✓ Loaded {len(df):,} rows")
+        lf = find_resume_index(df, last_processed).lazy()
+    elif not checkpoint:
         print("⚙️ Processing all data from beginning...")
-        df_process = df
 
-    print(f"⚙️  Processing {len(df_process):,} new rows...")
+    print(f"⚙️  Streaming new rows into {processed_path}...")
 
-    new_df = get_processed_df(df_process)
+    created = not storage.exists('trades')
+    new_rows = storage.sink('trades', get_processed_lazy(lf))
+    if created and new_rows:
+        print(f"✓ Created: {processed_path} ({new_rows:,} rows)")
+    else:
+        print(f"✓ Appended {new_rows:,} rows to {processed_path}")
 
-    # No need to create processed directory anymore - files go to root directory
+    # trades 落盘后再推进检查点：中途崩溃最多重复处理，不会漏数据
+    save_checkpoint(storage, end_position, processed_rows + new_rows)
 
-    op_file = '/Users/yangsmac/Desktop/poly_data/trades.csv'
+    # 钱包索引只处理新追加的 trades；trades 是本次新建的则整体重建，避免沿用旧文件的位置
+    indexed = update_wallet_index(storage, rebuild=created)
+    print(f"✓ Wallet index: {indexed:,} new fills indexed")
 
-    if not os.path.isfile(op_file):
-        new_df.write_csv(op_file)
-        print(f"✓ Created new file: /Users/yangsmac/Desktop/poly_data/trades.csv")
-    else:
-        print(f"✓ Appending {len(new_df):,} rows to /Users/yangsmac/Desktop/poly_data/trades.csv")
-        with open(op_file, mode="a") as f:
-            new_df.write_csv(f, include_header=False)
-
-    
     print("=" * 60)
     print("✅ Processing complete!")
     print("=" * 60)
     
 if __name__ == "__main__":
-    process_live()
\ No newline at end of file
+    process_live()
@@ -1,13 +1,17 @@
 import os
 import json
 import pandas as pd
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from gql import gql
 from flatten_json import flatten
 from datetime import datetime, timedelta, timezone
-import subprocess
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from update_utils.update_markets import update_markets
+from update_utils.orderfilled_writer import OrderFilledWriter
+from poly_utils.storage import get_storage, DATA_DIR
+from update_utils.goldsky_client import GoldskyClient
 
 # Global runtime timestamp - set once when program starts
 RUNTIME_TIMESTAMP = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -15,121 +19,146 @@ RUNTIME_TIMESTAMP = datetime.now().strftime('%Y%m%d_%H%M%S')
 # 默认时间范围限制（设置为半年回溯）
 DEFAULT_DAYS_LIMIT = 180  # 半年 = 180 天
 
-# Columns to save
-COLUMNS_TO_SAVE = ['timestamp', 'maker', 'makerAssetId', 'makerAmountFilled', 'taker', 'takerAssetId', 'takerAmountFilled', 'transactionHash']
-
-# No need to create goldsky directory anymore - files go to root directory
-
-CURSOR_FILE = '/Users/yangsmac/Desktop/poly_data/cursor_state.json'
-
-def save_cursor(timestamp, last_id, sticky_timestamp=None):
-    """Save cursor state to file for efficient resume."""
-    state = {
-        'last_timestamp': timestamp,
-        'last_id': last_id,
-        'sticky_timestamp': sticky_timestamp
-    }
-    with open(CURSOR_FILE, 'w') as f:
-        json.dump(state, f)
+# 并行回填默认 worker 数（1 = 单游标顺序抓取）
+DEFAULT_WORKERS = 1
 
-def get_latest_cursor(days_limit: int = DEFAULT_DAYS_LIMIT):
-    """获取最新的光标状态以高效恢复。
-    返回 (timestamp, last_id, sticky_timestamp) 元组。
-    新策略：从最新数据开始，向前回溯指定天数
-    Args:
-        days_limit: 时间范围限制（天数），默认向前回溯 180 天（半年）
-    """
-    # 计算时间范围
-    # 使用更兼容的时区处理方式
-    current_time = datetime.now(tz=timezone.utc)
-    start_time = current_time - timedelta(days=days_limit)
-    start_timestamp = int(start_time.timestamp())
-    current_timestamp = int(current_time.timestamp())
+# 每个 worker 分配的时间分片数，分片越细负载越均衡
+SHARDS_PER_WORKER = 4
 
-    print(f"🔄 数据收集策略：从最新数据开始，向前回溯 {days_limit} 天")
-    print(f"📅 起始时间（回溯起点）: {start_time.strftime('%Y-%m-%d %H:%M:%S UTC')} (timestamp: {start_timestamp})")
-    print(f"📅 当前时间: {current_time.strftime('%Y-%m-%d %H:%M:%S UTC')} (timestamp: {current_timestamp})")
+# 自适应页大小：子图单次查询最多返回 1000 条；延迟超过目标时缩小页面
+PAGE_SIZE_MIN = 100
+PAGE_SIZE_MAX = 1000
+TARGET_LATENCY = 2.0
 
-    # Fallback: read from CSV file
-    cache_file = '/Users/yangsmac/Desktop/poly_data/orderFilled.csv'
+# 可通过环境变量指向本地模拟服务器（见 bench/）
+QUERY_URL = os.getenv("POLY_GOLDSKY_URL", "https://api.goldsky.com/api/public/project_cl6mb8i9h0003e201j6li0diw/subgraphs/orderbook-subgraph/0.0.1/gn")
 
-    # 检查是否已有数据文件
-    if os.path.isfile(cache_file):
-        try:
-            # 获取文件中的最新时间戳
-            result = subprocess.run(['tail', '-n', '1', cache_file], capture_output=True, text=True, check=True)
-            last_line = result.stdout.strip()
-            if last_line:
-                # Get header to find column indices
-                header_result = subprocess.run(['head', '-n', '1', cache_file], capture_output=True, text=True, check=True)
-                headers = header_result.stdout.strip().split(',')
-
-                if 'timestamp' in headers:
-                    timestamp_index = headers.index('timestamp')
-                    values = last_line.split(',')
-                    if len(values) > timestamp_index:
-                        file_last_timestamp = int(values[timestamp_index])
-
-                        # 如果文件中的最新数据晚于我们的回溯起点，从最新开始
-                        if file_last_timestamp > start_timestamp:
-                            readable_time = datetime.fromtimestamp(file_last_timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
-                            print(f"✅ 发现较新数据：文件最新 timestamp {file_last_timestamp} ({readable_time})")
-                            print(f"🔄 从最新数据开始回溯...")
-                            # 从文件中的最新时间戳开始（减去1秒确保不重复）
-                            return file_last_timestamp - 1, None, None
-                        else:
-                            print(f"⚠️ 文件数据较旧：最新 timestamp {file_last_timestamp} 早于回溯起点 {start_timestamp}")
-                            print(f"🔄 重新从回溯起点开始...")
-        except Exception as e:
-            print(f"⚠️ 读取文件失败: {e}")
-
-    # 如果没有现有数据或需要重新开始，从当前时间开始回溯
-    print(f"🚀 初始运行：从当前时间开始回溯 {days_limit} 天")
-    print(f"⏰ 起始点: {current_time.strftime('%Y-%m-%d %H:%M:%S UTC')} (timestamp: {current_timestamp})")
-    return current_timestamp, None, None
+# Columns to save
+COLUMNS_TO_SAVE = ['timestamp', 'maker', 'makerAssetId', 'makerAmountFilled', 'taker', 'takerAssetId', 'takerAmountFilled', 'transactionHash']
 
-def scrape(at_once=1000, days_limit: int = DEFAULT_DAYS_LIMIT):
-    """从最新数据开始抓取订单成交事件，向前回溯指定天数"""
-    QUERY_URL = "https://api.goldsky.com/api/public/project_cl6mb8i9h0003e201j6li0diw/subgraphs/orderbook-subgraph/0.0.1/gn"
-    print(f"GraphQL 端点: {QUERY_URL}")
-    print(f"运行时间戳: {RUNTIME_TIMESTAMP}")
+# No need to create goldsky directory anymore - files go to root directory
 
-    # 计算回溯时间范围
-    current_time = datetime.now(tz=timezone.utc)
-    start_time = current_time - timedelta(days=days_limit)
-    start_timestamp = int(start_time.timestamp())
+CURSOR_FILE = os.path.join(DATA_DIR, 'cursor_state.json')
 
-    print(f"\n🔄 从最新数据开始，向前回溯 {days_limit} 天")
-    print(f"📅 回溯起点: {start_time.strftime('%Y-%m-%d %H:%M:%S UTC')} (timestamp: {start_timestamp})")
+# tail 模式默认轮询间隔（秒），以及追赶时每抓取多少页提交一次
+TAIL_INTERVAL = 5
+TAIL_FLUSH_PAGES = 50
 
-    # Get starting cursor from latest file (includes sticky state for perfect resume)
-    last_timestamp, last_id, sticky_timestamp = get_latest_cursor(days_limit)
-    count = 0
-    total_records = 0
+# 检查点频率：每隔多少秒或多少页（先到为准）把游标和暂存页状态写入 CURSOR_FILE
+CHECKPOINT_INTERVAL = 30
+CHECKPOINT_PAGES = 50
 
-    print(f"\n🚀 开始抓取 orderFilledEvents")
-    print(f"📂 输出文件: /Users/yangsmac/Desktop/poly_data/orderFilled.csv")
-    print(f"📋 保存列: {COLUMNS_TO_SAVE}")
+def save_cursor(state, path=None):
+    """原子地保存抓取检查点（写临时文件、fsync 后替换）"""
+    path = path or CURSOR_FILE
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def load_cursor(storage, path=None):
+    """读取上次中断的抓取检查点，不存在或与当前存储不匹配时返回 None"""
+    path = path or CURSOR_FILE
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 读取检查点失败，重新开始: {e}")
+        return None
+    if state.get('backend') != storage.backend or 'shards' not in state:
+        print(f"⚠️ 检查点与当前存储后端不匹配，重新开始")
+        return None
+    return state
+
+class ScrapeCheckpoint:
+    """抓取进度检查点：各分片的 (timestamp, id) 游标 + 已暂存的页
+
+    游标和页列表在同一把锁下更新，定期原子地写入 CURSOR_FILE。
+    重启后从最后一个检查点继续：暂存文件截断到检查点记录的页，各分片从对应游标继续抓取，
+    因此既不会重复抓取已持久化的页，也不会写入重复的行。
+    """
 
-    # 存储所有数据，最后统一排序
-    all_data = []
+    def __init__(self, writer, state, path=None, interval=None, pages=None):
+        self.writer = writer
+        self.state = state
+        self.path = path or CURSOR_FILE
+        self.interval = interval or CHECKPOINT_INTERVAL
+        self.pages = pages or CHECKPOINT_PAGES
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.saved_at = time.time()
+        self.closed = False
+
+    def on_page(self, shard, df):
+        """写入一页并推进分片游标（df 按 timestamp/id 升序，第一行即游标位置）"""
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("抓取已中止")
+            new_rows = self.writer.write_page(df, segment=shard['start'])
+            shard['last_timestamp'] = int(df.iloc[0]['timestamp'])
+            shard['last_id'] = df.iloc[0]['id']
+            shard['fetched'] += len(df)
+            shard['pages'] += 1
+            self.pending += 1
+            if self.pending >= self.pages or time.time() - self.saved_at >= self.interval:
+                self._save()
+            return new_rows
+
+    def finish_shard(self, shard):
+        with self.lock:
+            shard['done'] = True
+            self._save()
+
+    def save(self, phase='fetching', **extra):
+        with self.lock:
+            self._save(phase, **extra)
+
+    def _save(self, phase='fetching', **extra):
+        self.state.update(extra, phase=phase, writer=self.writer.checkpoint(), saved_at=int(time.time()))
+        save_cursor(self.state, self.path)
+        self.pending = 0
+        self.saved_at = time.time()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+
+def get_stored_last_timestamp(storage=None):
+    """从 manifest 读取 orderFilled 已存储的最新 timestamp
+
+    数据不存在或无法解析时返回 None。
+    """
+    storage = storage or get_storage()
+    try:
+        max_time = storage.manifest('orderFilled')['max_time']
+        if max_time is not None:
+            return int(max_time)
+    except Exception as e:
+        print(f"⚠️ 读取文件失败: {e}")
+    return None
 
-    while True:
-        # Build the where clause based on cursor state
-        if sticky_timestamp is not None:
-            # We're in sticky mode: stay at this timestamp and paginate by id
-            where_clause = f'timestamp: "{sticky_timestamp}", id_lt: "{last_id}"'
-        else:
-            # 回溯模式：从当前时间戳向前查找到指定时间范围
-            if last_timestamp is None:
-                # 第一次：从当前时间开始
-                where_clause = f'timestamp_lte: "{int(current_time.timestamp())}"'
-            else:
-                # 继续向前回溯
-                where_clause = f'timestamp_lt: "{last_timestamp}", timestamp_gte: "{start_timestamp}"'
+def backfill_range(days_limit: int = DEFAULT_DAYS_LIMIT, storage=None, now=None):
+    """本次增量运行的抓取范围 [lower_timestamp, end_timestamp)
 
-        q_string = f'''query MyQuery {{
-                        orderFilledEvents(orderBy: timestamp, orderDirection: desc
+    只抓取不早于已存储最新时间戳的数据（同一秒内的重复记录由 id 索引去重）；
+    没有数据或已有数据早于回溯起点时，从 now 向前回溯 days_limit 天。
+    """
+    current_time = now or datetime.now(tz=timezone.utc)
+    start_timestamp = int((current_time - timedelta(days=days_limit)).timestamp())
+    lower_timestamp = start_timestamp
+    stored_last_timestamp = get_stored_last_timestamp(storage)
+    if stored_last_timestamp is not None and stored_last_timestamp > start_timestamp:
+        lower_timestamp = stored_last_timestamp
+    return lower_timestamp, int(current_time.timestamp()) + 1
+
+def build_query(where_clause, at_once, direction='desc'):
+    """构造 orderFilledEvents 查询（按 timestamp 排序，同一 timestamp 内子图按 id 同向排序）"""
+    return gql(f'''query MyQuery {{
+                        orderFilledEvents(orderBy: timestamp, orderDirection: {direction}
                                              first: {at_once}
                                              where: {{{where_clause}}}) {{
                             fee
@@ -144,155 +173,398 @@ def scrape(at_once=1000, days_limit: int = DEFAULT_DAYS_LIMIT):
                             timestamp
                             transactionHash
                         }}
-                    }}'''
+                    }}''')
+
+def keyset_where(shard_start, last_timestamp, last_id=None):
+    """(timestamp, id) 复合游标：只取严格排在上一页最后一行之后的记录
+
+    上一页最后一行为 (T, ID) 时，下一页为 timestamp < T，或 timestamp = T 且 id < ID，
+    不会重复抓取任何一行；分片下界放进每个 or 分支中
+    """
+    if last_id is None:
+        return f'timestamp_lt: "{last_timestamp}", timestamp_gte: "{shard_start}"'
+    return (f'or: [{{timestamp_lt: "{last_timestamp}", timestamp_gte: "{shard_start}"}}, '
+            f'{{timestamp: "{last_timestamp}", id_lt: "{last_id}"}}]')
+
+def forward_where(last_timestamp, last_id=None):
+    """向前（升序）抓取的复合游标：timestamp > T，或 timestamp = T 且 id > ID"""
+    if last_id is None:
+        return f'timestamp_gt: "{last_timestamp}"'
+    return f'or: [{{timestamp_gt: "{last_timestamp}"}}, {{timestamp: "{last_timestamp}", id_gt: "{last_id}"}}]'
+
+class AdaptivePageSize:
+    """根据响应延迟和数据密度调整每页记录数（加性增、乘性减）
+
+    - 整页返回且延迟低于目标：数据密集且服务端轻松，放大页面以减少往返
+    - 延迟超过目标的 1.5 倍或请求失败：页面减半，避免超时和重试整页
+    - 不满一页说明该区间数据稀疏，页大小不是瓶颈，保持不变
+    """
+
+    def __init__(self, initial=PAGE_SIZE_MAX, minimum=PAGE_SIZE_MIN, maximum=PAGE_SIZE_MAX,
+                 target_latency=TARGET_LATENCY):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.size = min(max(initial, minimum), self.maximum)
+        self.target_latency = target_latency
+
+    def update(self, latency, rows):
+        if latency > self.target_latency * 1.5:
+            self.size = max(self.minimum, self.size // 2)
+        elif rows >= self.size and latency < self.target_latency:
+            self.size = min(self.maximum, self.size + max(self.size // 4, self.minimum))
+
+    def failed(self):
+        self.size = max(self.minimum, self.size // 2)
 
-        query = gql(q_string)
-        transport = RequestsHTTPTransport(url=QUERY_URL, verify=True, retries=3)
-        client = Client(transport=transport)
+def split_shards(start_timestamp, end_timestamp, num_shards):
+    """把 [start_timestamp, end_timestamp) 切分为 num_shards 个连续的时间分片
+
+    返回按时间从新到旧排列的 (shard_start, shard_end) 列表，分片之间首尾相接、互不重叠。
+    """
+    num_shards = max(1, min(num_shards, end_timestamp - start_timestamp))
+    step = (end_timestamp - start_timestamp) / num_shards
+    bounds = [start_timestamp + int(round(step * i)) for i in range(num_shards)] + [end_timestamp]
+    shards = [(bounds[i], bounds[i + 1]) for i in range(num_shards)]
+    return shards[::-1]
+
+def scrape_shard(client, shard_start, shard_end, on_page, at_once=PAGE_SIZE_MAX, label='', cursor=None, stop=None):
+    """在单个时间分片 [shard_start, shard_end) 内从新到旧分页抓取
+
+    使用 (timestamp, id) 复合游标翻页，每一行只抓取一次；页大小由 AdaptivePageSize 动态调整。
+    每个分片维护自己的游标状态，可在独立的 worker 中运行；
+    client 为所有分片共享的 GoldskyClient（连接池 + 重试）。
+    每获取一页（按 timestamp/id 升序的 DataFrame）就调用一次 on_page(df)，不在内存中累积。
+    cursor 为 (last_timestamp, last_id)，用于从检查点继续；默认从分片上界开始。
+    stop 为 threading.Event：被设置时（其他分片出错、抓取中止）在下一次请求前抛出 RuntimeError，
+    分片保持未完成状态，下次运行从检查点继续。
+    返回 (抓取记录数, 批次数)。
+    """
+    last_timestamp, last_id = cursor or (shard_end, None)
+    page_size = AdaptivePageSize(initial=at_once)
+    count = 0
+    fetched = 0
+
+    while True:
+        if stop is not None and stop.is_set():
+            raise RuntimeError(f"{label}抓取已中止")
+        size = page_size.size
+        query = build_query(keyset_where(shard_start, last_timestamp, last_id), size)
 
         try:
-            print(f"⏳ 获取批次 {count + 1}...")
+            print(f"{label}⏳ 获取批次 {count + 1}（{size} 条/页）...")
+            request_start = time.perf_counter()
             res = client.execute(query)
+            latency = time.perf_counter() - request_start
         except Exception as e:
-            print(f"❌ 查询错误: {e}")
-            print("🔄 5 秒后重试...")
-            time.sleep(5)
+            page_size.failed()
+            print(f"{label}❌ 查询错误: {e}")
+            print(f"{label}🔄 5 秒后重试（页大小调整为 {page_size.size}）...")
+            if stop is not None:
+                stop.wait(5)
+            else:
+                time.sleep(5)
             continue
 
-        if not res['orderFilledEvents'] or len(res['orderFilledEvents']) == 0:
-            if sticky_timestamp is not None:
-                # Exhausted events at sticky timestamp, advance to next timestamp
-                last_timestamp = sticky_timestamp
-                sticky_timestamp = None
-                last_id = None
-                continue
-            print(f"✅ 没有更多数据，停止抓取")
+        events = res['orderFilledEvents']
+        page_size.update(latency, len(events))
+        if not events:
+            print(f"{label}✅ 没有更多数据，分片完成")
             break
 
-        df = pd.DataFrame([flatten(x) for x in res['orderFilledEvents']]).reset_index(drop=True)
+        count += 1
+        # 响应为 (timestamp, id) 降序，最后一行就是下一页的游标
+        last_timestamp = int(events[-1]['timestamp'])
+        last_id = events[-1]['id']
+
+        # 反转为 (timestamp, id) 升序
+        df = pd.DataFrame([flatten(x) for x in reversed(events)])
 
-        # 检查是否到达回溯时间范围
-        batch_first_timestamp = int(df.iloc[-1]['timestamp'])  # 注意：desc 排序，最后一行是最早的
+        readable_time = datetime.fromtimestamp(last_timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+        print(f"{label}批次 {count}: 最早时间戳 {last_timestamp} ({readable_time}), 记录数: {len(df)}, 耗时 {latency:.2f} 秒")
 
-        if batch_first_timestamp < start_timestamp:
-            # 数据已经早于回溯范围，停止
-            print(f"🛑 已到达回溯时间范围边界 (timestamp: {batch_first_timestamp} < {start_timestamp})")
-            # 只保留在时间范围内的数据
-            df = df[df['timestamp'].astype(int) >= start_timestamp]
-            if len(df) > 0:
-                all_data.append(df)
-                total_records += len(df)
-                print(f"📝 添加最后一批数据：{len(df)} 条记录")
+        on_page(df)
+        fetched += len(df)
+
+        # 复合游标下不满一页即说明分片内已没有更早的数据，无需再发一次空查询
+        if len(events) < size:
+            print(f"{label}✅ 批次不满({len(events)}/{size})，分片完成")
             break
 
-        # Sort by timestamp and id for consistent ordering
-        df = df.sort_values(['timestamp', 'id'], ascending=True).reset_index(drop=True)
+    return fetched, count
 
-        batch_last_timestamp = int(df.iloc[-1]['timestamp'])
-        batch_last_id = df.iloc[-1]['id']
-        batch_first_timestamp = int(df.iloc[0]['timestamp'])
+def scrape(at_once=PAGE_SIZE_MAX, days_limit: int = DEFAULT_DAYS_LIMIT, workers: int = DEFAULT_WORKERS,
+           page_listener=None):
+    """从最新数据开始抓取订单成交事件，向前回溯指定天数
 
-        readable_time = datetime.fromtimestamp(batch_first_timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+    Args:
+        at_once: 初始每页记录数，之后按响应延迟和数据密度自动调整
+        days_limit: 回溯天数
+        workers: 并行 worker 数量；大于 1 时启用时间分片并行回填模式
+        page_listener: 可选回调 (segment, new_df)，每页去重后的新行写入暂存后立即调用
+    """
+    print(f"GraphQL 端点: {QUERY_URL}")
+    print(f"运行时间戳: {RUNTIME_TIMESTAMP}")
 
-        # Determine if we need sticky cursor for next iteration
-        if len(df) >= at_once:
-            # Batch is full - check if all events are at the same timestamp
-            if batch_first_timestamp == batch_last_timestamp:
-                # All events at same timestamp, need to continue paginating at this timestamp
-                sticky_timestamp = batch_first_timestamp
-                last_id = batch_last_id
-                print(f"批次 {count + 1}: 时间戳 {batch_first_timestamp} ({readable_time}), 记录数: {len(df)} [STICKY - 同时间戳继续]")
-            else:
-                # Mixed timestamps - we need to continue from the earliest timestamp in this batch
-                sticky_timestamp = batch_first_timestamp
-                last_id = batch_last_id
-                print(f"批次 {count + 1}: 时间范围 {batch_first_timestamp}-{batch_last_timestamp} ({readable_time}), 记录数: {len(df)} [STICKY - 确保完整性]")
-        else:
-            # Batch not full - we have all events, can advance normally
-            if sticky_timestamp is not None:
-                # We were in sticky mode, now exhausted - advance past this timestamp
-                last_timestamp = sticky_timestamp
-                sticky_timestamp = None
-                last_id = None
-                print(f"批次 {count + 1}: 时间戳 {batch_first_timestamp} ({readable_time}), 记录数: {len(df)} [STICKY 完成]")
-            else:
-                # Normal backward traversal
-                last_timestamp = batch_first_timestamp
-                print(f"批次 {count + 1}: 最早时间戳 {batch_first_timestamp} ({readable_time}), 记录数: {len(df)}")
+    # 计算回溯时间范围
+    current_time = datetime.now(tz=timezone.utc)
+    start_time = current_time - timedelta(days=days_limit)
+    start_timestamp = int(start_time.timestamp())
 
-        count += 1
-        all_data.append(df)
-
-        # Fixed stop logic: only stop when we've truly reached the end
-        # Check if we should stop based on time boundary
-        if batch_first_timestamp < start_timestamp:
-            # We've gone past the time range - this is already handled above
-            # but keeping as safety check
-            print("🛑 已到达时间范围边界，停止抓取")
-            break
-        elif len(df) < at_once and sticky_timestamp is None:
-            # Batch not full AND not in sticky mode
-            # This could mean we're at the end OR just reached a sparse period
-            # We need to check if we've truly exhausted all data
-            print(f"⚠️ 批次不满({len(df)}/{at_once})，检查是否到达边界...")
-            # Continue to next iteration to see if we get more data
-            # If next iteration returns empty, then we know we're at the end
-
-    # 合并所有数据并排序
-    if all_data:
-        print(f"\n📊 合并数据...")
-        combined_df = pd.concat(all_data, ignore_index=True)
-        # Remove duplicates (by id to be safe)
-        combined_df = combined_df.drop_duplicates(subset=['id'])
-        # 最终按时间戳升序排序
-        combined_df = combined_df.sort_values('timestamp', ascending=True).reset_index(drop=True)
-
-        output_file = '/Users/yangsmac/Desktop/poly_data/orderFilled.csv'
-
-        # 保存数据
-        if os.path.isfile(output_file):
-            # 如果文件存在，先读取现有数据，去重后合并
-            existing_df = pd.read_csv(output_file)
-            if len(existing_df) > 0:
-                # 合并并去重
-                final_df = pd.concat([existing_df, combined_df]).drop_duplicates(subset=['id'])
-                final_df = final_df.sort_values('timestamp', ascending=True).reset_index(drop=True)
-            else:
-                final_df = combined_df
+    print(f"\n🔄 从最新数据开始，向前回溯 {days_limit} 天")
+    print(f"📅 回溯起点: {start_time.strftime('%Y-%m-%d %H:%M:%S UTC')} (timestamp: {start_timestamp})")
 
-            final_df.to_csv(output_file, index=None)
-            total_records = len(final_df)
-            print(f"✅ 更新文件：{output_file}")
-        else:
-            combined_df.to_csv(output_file, index=None)
-            total_records = len(combined_df)
-            print(f"✅ 创建文件：{output_file}")
+    storage = get_storage()
+    output_path = storage.path('orderFilled')
+
+    print(f"\n🚀 开始抓取 orderFilledEvents")
+    print(f"📂 输出位置: {output_path} ({storage.backend})")
+    print(f"📋 保存列: {COLUMNS_TO_SAVE}")
 
-        print(f"📈 总记录数：{total_records:,}")
+    state = load_cursor(storage)
+    if state is not None:
+        # 从上次中断处继续：沿用当时的时间范围和分片划分
+        lower_timestamp, end_timestamp = state['lower_timestamp'], state['end_timestamp']
+        done = sum(shard['done'] for shard in state['shards'])
+        print(f"♻️ 从检查点恢复（{datetime.fromtimestamp(state['saved_at'], tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}）："
+              f"{len(state['shards'])} 个分片中 {done} 个已完成")
+        writer = OrderFilledWriter(storage, resume=state['writer'], listener=page_listener)
+        if state['phase'] == 'appending':
+            # 上次在追加到主文件时中断：撤销可能不完整的追加，之后重新追加全部暂存页
+            print(f"🔙 撤销上次未完成的追加")
+            storage.rollback('orderFilled', state['position'], state['manifest'])
     else:
-        print("⚠️ 没有获取到任何数据")
+        # 增量运行：只抓取不早于已存储最新时间戳的数据
+        lower_timestamp, end_timestamp = backfill_range(days_limit, storage, now=current_time)
+        if lower_timestamp > start_timestamp:
+            readable_time = datetime.fromtimestamp(lower_timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+            print(f"✅ 已有数据至 {readable_time}，仅抓取更新的数据")
+
+        # 并行回填模式：把 [lower_timestamp, now] 切成时间分片，每个分片独立分页
+        # 分片数多于 worker 数，避免交易密集时段拖慢单个 worker
+        if workers > 1:
+            shards = split_shards(lower_timestamp, end_timestamp, workers * SHARDS_PER_WORKER)
+        else:
+            shards = [(lower_timestamp, end_timestamp)]
+        state = {
+            'backend': storage.backend,
+            'lower_timestamp': lower_timestamp,
+            'end_timestamp': end_timestamp,
+            'shards': [
+                {'start': shard_start, 'end': shard_end, 'last_timestamp': shard_end, 'last_id': None,
+                 'done': False, 'fetched': 0, 'pages': 0}
+                for shard_start, shard_end in shards
+            ],
+        }
+        # 每页去重后直接落盘，不在内存中累积
+        writer = OrderFilledWriter(storage, listener=page_listener)
+
+    # 游标和暂存页定期写入检查点，中断后可从最后一个持久化的页继续
+    checkpoint = ScrapeCheckpoint(writer, state)
+    checkpoint.save()
+    # 所有分页和分片共享一个连接池，连接数与 worker 数一致
+    client = GoldskyClient(QUERY_URL, pool_size=max(workers, 1))
+    run_start = time.time()
+
+    stop = threading.Event()  # 并行回填中止时通知仍在运行的分片
+
+    def run_shard(i, shard):
+        label = f"[分片 {i + 1}/{len(state['shards'])}] " if len(state['shards']) > 1 else ''
+        result = scrape_shard(client, shard['start'], shard['end'], partial(checkpoint.on_page, shard),
+                              at_once, label, cursor=(shard['last_timestamp'], shard['last_id']), stop=stop)
+        checkpoint.finish_shard(shard)
+        return result
 
-    # Clear cursor file on successful completion
+    try:
+        pending = [(i, shard) for i, shard in enumerate(state['shards']) if not shard['done']]
+        fetched = 0
+        pages = 0
+        if workers > 1 and len(pending) > 1:
+            print(f"⚡ 并行回填模式：{len(pending)} 个时间分片，{workers} 个 worker")
+            executor = ThreadPoolExecutor(max_workers=workers)
+            futures = []
+            try:
+                # 以分片起点作为写入 segment，收尾时按时间顺序拼接
+                futures = [executor.submit(run_shard, i, shard) for i, shard in pending]
+                for future in as_completed(futures):
+                    shard_fetched, shard_pages = future.result()
+                    fetched += shard_fetched
+                    pages += shard_pages
+            finally:
+                # 中断时取消尚未开始的分片、不等待仍在运行的分片，已写入的进度保存在检查点中
+                # （逐个 cancel 而不是 shutdown(cancel_futures=True)，后者需要 Python 3.9）
+                # 仍在运行的分片在下一次请求前退出（客户端随后被关闭，不能让它们无限重试）
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
+        else:
+            for i, shard in pending:
+                shard_fetched, shard_pages = run_shard(i, shard)
+                fetched += shard_fetched
+                pages += shard_pages
+
+        elapsed = time.time() - run_start
+        print(f"\n⏱️ 抓取耗时 {elapsed:.1f} 秒，{pages} 个批次，{fetched:,} 条记录 ({fetched / max(elapsed, 1e-9):,.0f} 条/秒)")
+        if fetched:
+            print(f"📨 每万条记录请求数: {client.stats()['queries'] / fetched * 10000:.1f}")
+        print(f"🔁 重复记录（已存在）: {writer.total_duplicates:,}")
+
+        # 按时间顺序把暂存页追加到主文件；先记录追加前的位置，追加中断时可以撤销
+        print(f"\n📊 写入数据...")
+        existed = storage.exists('orderFilled')
+        checkpoint.save(
+            'appending',
+            position=storage.position('orderFilled') if existed else None,
+            manifest=storage.manifest('orderFilled') if existed else None,
+        )
+        total_records = writer.close()
+    except BaseException:
+        if state.get('phase') == 'fetching':
+            try:
+                checkpoint.save()
+            except Exception as e:
+                print(f"⚠️ 保存检查点失败: {e}")
+        checkpoint.close()
+        writer.abort()
+        print(f"💾 进度已保存到检查点 {CURSOR_FILE}，重新运行即可继续")
+        raise
+    finally:
+        client.report()
+        client.close()
+
+    # 追加和索引都已提交：先删除检查点，再清理暂存文件
     if os.path.isfile(CURSOR_FILE):
         os.remove(CURSOR_FILE)
+    writer.discard()
+
+    if total_records > 0:
+        print(f"✅ 追加到：{output_path}")
+    else:
+        print("⚠️ 没有获取到任何新数据")
 
     print(f"\n🎉 抓取完成！")
     print(f"📊 总新记录数: {total_records}")
-    print(f"📁 输出文件: /Users/yangsmac/Desktop/poly_data/orderFilled.csv")
+    print(f"📁 输出位置: {output_path}")
+    return total_records
 
-def update_goldsky(days_limit: int = DEFAULT_DAYS_LIMIT):
+def update_goldsky(days_limit: int = DEFAULT_DAYS_LIMIT, workers: int = DEFAULT_WORKERS):
     """运行订单成交事件抓取 - 从最新数据开始，向前回溯指定天数
 
     Args:
         days_limit: 回溯天数，默认 180 天（半年）
+        workers: 并行回填 worker 数，默认 1（顺序抓取）
     """
     print(f"\n{'='*60}")
     print(f"🚀 开始抓取 orderFilledEvents")
     print(f"⏰ 运行时间: {RUNTIME_TIMESTAMP}")
     print(f"📅 回溯范围: 最近 {days_limit} 天")
+    print(f"⚡ 并行 worker: {workers}")
     print(f"{'='*60}")
     try:
-        scrape(days_limit=days_limit)
+        scrape(days_limit=days_limit, workers=workers)
         print(f"\n✅ orderFilledEvents 抓取完成")
     except Exception as e:
-        print(f"\n❌ orderFilledEvents 抓取错误: {str(e)}")
\ No newline at end of file
+        print(f"\n❌ orderFilledEvents 抓取错误: {str(e)}")
+
+
+def poll_forward(client, storage, cursor, page_size, flush_pages=None):
+    """从 cursor=(timestamp, id) 向前按升序抓取到最新，返回 (新增行数, 新游标)
+
+    每 flush_pages 页提交一次（追加到存储层并提交 id 索引），
+    已提交的数据即是下一次的起点，中断后从 manifest 继续即可，不需要额外的检查点
+    """
+    flush_pages = flush_pages or TAIL_FLUSH_PAGES
+    last_timestamp, last_id = cursor
+    total_new = 0
+
+    while True:
+        writer = OrderFilledWriter(storage, reverse_pages=False)
+        try:
+            pages = 0
+            exhausted = False
+            while pages < flush_pages:
+                size = page_size.size
+                query = build_query(forward_where(last_timestamp, last_id), size, direction='asc')
+                try:
+                    request_start = time.perf_counter()
+                    res = client.execute(query)
+                    latency = time.perf_counter() - request_start
+                except Exception as e:
+                    page_size.failed()
+                    print(f"❌ 查询错误: {e}，5 秒后重试（页大小调整为 {page_size.size}）")
+                    time.sleep(5)
+                    continue
+
+                events = res['orderFilledEvents']
+                page_size.update(latency, len(events))
+                if events:
+                    # 升序响应，最后一行即新的游标
+                    last_timestamp = int(events[-1]['timestamp'])
+                    last_id = events[-1]['id']
+                    writer.write_page(pd.DataFrame([flatten(x) for x in events]))
+                    pages += 1
+                if len(events) < size:
+                    exhausted = True
+                    break
+            total_new += writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            writer.discard()
+
+        if exhausted:
+            return total_new, (last_timestamp, last_id)
+
+def tail(interval: float = TAIL_INTERVAL, at_once=PAGE_SIZE_MAX, days_limit: int = DEFAULT_DAYS_LIMIT,
+         workers: int = DEFAULT_WORKERS, max_polls: int = None):
+    """向前追踪模式：长期运行，每隔 interval 秒查询比已存储最新记录更新的 orderFilledEvents
+
+    按 (timestamp, id) 升序从已存储的最后一行继续抓取，新数据直接追加，使 orderFilled 只落后链上几秒。
+    数据为空或上次回填中断（存在 CURSOR_FILE）时，先运行一次 scrape() 回填 / 恢复。
+
+    Args:
+        interval: 两次轮询之间的间隔（秒）
+        at_once: 初始每页记录数
+        days_limit: 需要先回填时的回溯天数
+        workers: 需要先回填时的并行 worker 数
+        max_polls: 轮询次数上限，None 表示一直运行直到中断
+    """
+    storage = get_storage()
+    if os.path.isfile(CURSOR_FILE) or not storage.exists('orderFilled'):
+        print(f"🔄 先回填 / 恢复历史数据...")
+        scrape(at_once=at_once, days_limit=days_limit, workers=workers)
+
+    manifest = storage.manifest('orderFilled')
+    if manifest['max_time'] is None:
+        print("⚠️ 没有已存储的数据，无法确定起点")
+        return
+    cursor = (int(manifest['max_time']), manifest['last_id'])
+
+    print(f"\n👀 tail 模式：GraphQL 端点 {QUERY_URL}，每 {interval} 秒轮询一次（Ctrl+C 停止）")
+    print(f"📍 起点: {datetime.fromtimestamp(cursor[0], tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')} / {cursor[1]}")
+
+    client = GoldskyClient(QUERY_URL, pool_size=1)
+    page_size = AdaptivePageSize(initial=at_once)
+    polls = 0
+    total_new = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            poll_start = time.time()
+            new_rows, cursor = poll_forward(client, storage, cursor, page_size)
+            polls += 1
+            total_new += new_rows
+            lag = time.time() - cursor[0]
+            if new_rows:
+                print(f"📥 [{datetime.now().strftime('%H:%M:%S')}] 新增 {new_rows:,} 条，最新 timestamp {cursor[0]}（落后 {lag:.0f} 秒）")
+            if max_polls is not None and polls >= max_polls:
+                break
+            time.sleep(max(0.0, interval - (time.time() - poll_start)))
+    except KeyboardInterrupt:
+        print("\n⏹️ 停止 tail 模式")
+    finally:
+        stats = client.report()
+        client.close()
+
+    print(f"📊 {polls} 次轮询，共新增 {total_new:,} 条记录，{stats['queries']} 次查询")
+    return total_new
@@ -1,34 +1,157 @@
 import requests
-import csv
 import json
 import os
+import re
+import sys
+import time
 from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta, timezone
 
-def count_csv_lines(csv_filename: str) -> int:
-    """计算 CSV 中数据行的数量（不包括标题）"""
-    if not os.path.exists(csv_filename):
-        return 0
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from poly_utils.storage import CsvStorage, get_storage, rows_to_frame
+from poly_utils.token_resolver import GAMMA_MARKETS_URL
+from poly_utils.utils import market_to_row
+
+# 默认同时在途的偏移窗口数（1 = 串行抓取）
+DEFAULT_WORKERS = 1
+
+# 默认重新抓取最近多少天内创建的已有市场（刷新 volume / closedTime）
+DEFAULT_REFRESH_DAYS = 7
+
+
+def make_session(pool_size: int):
+    """创建连接池大小与并发数匹配的 keep-alive 会话"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def fetch_page(session, base_url: str, offset: int, limit: int):
+    """获取一个偏移窗口的市场列表，遇到错误时重试直到成功"""
+    params = {
+        'order': 'createdAt',
+        'ascending': 'false',  # 改为降序，获取最新市场
+        'limit': limit,
+        'offset': offset
+        # 移除不被支持的 createdAt_min 参数，改用本地过滤
+    }
+
+    while True:
+        try:
+            response = session.get(base_url, params=params, timeout=30)
+
+            # 处理不同的 HTTP 状态码
+            if response.status_code == 500:
+                print(f"服务器错误 (500) - 5 秒后重试...")
+                time.sleep(5)
+                continue
+            elif response.status_code == 429:
+                print(f"达到速率限制 (429) - 等待 10 秒...")
+                time.sleep(10)
+                continue
+            elif response.status_code != 200:
+                print(f"API 错误 {response.status_code}：{response.text}")
+                print("3 秒后重试...")
+                time.sleep(3)
+                continue
+
+            return response.json()
+
+        except requests.exceptions.RequestException as e:
+            print(f"Network error: {e}")
+            print(f"Retrying in 5 seconds...")
+            time.sleep(5)
+        except ValueError as e:
+            print(f"Unexpected error: {e}")
+            print(f"Retrying in 3 seconds...")
+            time.sleep(3)
+
+
+def parse_created_timestamp(created_at, default: int):
+    """解析 createdAt（毫秒/秒时间戳或 ISO 字符串）为 Unix 秒，无法解析时返回 default"""
+    # 尝试解析时间戳（可能是毫秒）
+    if isinstance(created_at, str) and created_at.isdigit():
+        created_timestamp = int(created_at)
+        # 如果大于10^12，认为是毫秒时间戳
+        if created_timestamp > 10**12:
+            created_timestamp = created_timestamp // 1000
+        return created_timestamp
+    if isinstance(created_at, (int, float)):
+        return int(created_at)
+
+    # 尝试解析ISO格式时间字符串，匹配 YYYY-MM-DDTHH:MM:SS 格式
+    match = re.search(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})', str(created_at))
+    if not match:
+        # 无法解析，跳过这个检查
+        return default
+    # 处理 Z 后缀
+    time_str = match.group(1).replace('T', ' ')
+    if 'Z' in created_at:
+        time_str += ' UTC'
+    else:
+        time_str += ' +00:00'
+    dt = datetime.fromisoformat(time_str.replace(' UTC', '+00:00'))
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def created_in_range(market: Dict, start_timestamp: int) -> bool:
+    """市场创建时间是否不早于 start_timestamp；没有或无法解析创建时间时视为在范围内"""
+    created_at = market.get('createdAt', '')
+    if created_at:
+        try:
+            return parse_created_timestamp(created_at, start_timestamp + 1) >= start_timestamp
+        except Exception as e:
+            print(f"解析时间错误 {market.get('id', 'unknown')}: {e}")
+            # 如果解析失败，假设在时间范围内
+    return True
+
+
+def sync_state_path(storage) -> str:
+    """记录上次完整同步覆盖到的最早创建时间，与 markets 数据放在一起"""
+    return storage.path('markets').rstrip(os.sep) + '.sync.json'
+
+
+def load_covered_from(storage):
+    """上次同步已完整覆盖的起始时间戳，不存在时返回 None"""
+    path = sync_state_path(storage)
+    if not os.path.isfile(path) or not storage.exists('markets'):
+        return None
     try:
-        with open(csv_filename, 'r', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            next(reader, None)  # 跳过标题
-            return sum(1 for row in reader if row)  # 计算非空行数
-    except Exception as e:
-        print(f"读取 CSV 错误：{e}")
-        return 0
-
-def update_markets(csv_filename: str = "/Users/yangsmac/Desktop/poly_data/markets.csv", batch_size: int = 500, days_limit: int = 180):
+        with open(path, 'r') as f:
+            return json.load(f).get('covered_from')
+    except (OSError, ValueError) as e:
+        print(f"读取同步状态失败：{e}")
+        return None
+
+
+def save_covered_from(storage, covered_from: int):
+    path = sync_state_path(storage)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'covered_from': covered_from}, f)
+    os.replace(tmp_path, path)
+
+
+def update_markets(csv_filename: str = None, batch_size: int = 500, days_limit: int = 180,
+                   workers: int = DEFAULT_WORKERS, refresh_days: int = DEFAULT_REFRESH_DAYS):
     """
-    按创建日期获取市场并保存到 CSV。
-    根据现有 CSV 行自动从正确的偏移恢复。
+    按创建日期获取市场并按 id 插入或更新到 markets 数据集。
+    只抓取比已存储的最新市场更新的市场（createdAt 降序翻页，到达截止时间即停止），
+    已存在的市场如果字段有变化（例如 volume、closedTime）则原地更新。
     默认获取最近 180 天的市场数据（与订单数据保持一致）。
 
     Args:
-        csv_filename: 要保存的 CSV 文件名
+        csv_filename: 指定时直接写入该 CSV 文件，否则通过存储层写入
         batch_size: 每次请求获取的市场数量
         days_limit: 时间范围限制（天数），默认 180 天
+        workers: 同时在途的偏移窗口数，大于 1 时并发抓取
+        refresh_days: 额外重新抓取最近多少天内创建的已有市场，用于刷新其 volume / closedTime，
+            默认 7 天；0 表示只抓取新市场
     """
     # 计算起始时间戳（半年=180天前）
     # 使用更兼容的时区处理方式
@@ -39,256 +162,115 @@ def update_markets(csv_filename: str = "/Users/yangsmac/Desktop/poly_data/market
     print(f"时间范围限制: 最近 {days_limit} 天")
     print(f"起始时间: {start_time_str} (timestamp: {start_timestamp})")
 
-    base_url = "https://gamma-api.polymarket.com/markets"
-
-    # 所需列的 CSV 标题
-    headers = [
-        'createdAt', 'id', 'question', 'answer1', 'answer2', 'neg_risk',
-        'market_slug', 'token1', 'token2', 'condition_id', 'volume', 'ticker', 'closedTime'
-    ]
+    base_url = GAMMA_MARKETS_URL
 
-    # 根据现有记录动态设置偏移
-    current_offset = count_csv_lines(csv_filename)
-    file_exists = os.path.exists(csv_filename) and current_offset > 0
+    storage = CsvStorage(files={'markets': csv_filename}) if csv_filename else get_storage()
+    output_path = storage.path('markets')
 
-    # 在使用时间过滤(createdAt_min)时，直接使用已有的 offset 可能会跳过过滤结果。
-    # 如果现有 CSV 包含比当前 start_timestamp 更早的记录（即我们缩小了时间窗口），
-    # 则更安全的做法是重建（覆盖）CSV 并从偏移 0 开始抓取与过滤条件一致的数据。
-    mode = 'w'
-    if file_exists:
-        try:
-            # 尝试读取 CSV 的第一条数据行（假定文件按 createdAt 升序存放，第一条为最早）
-            with open(csv_filename, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                header = next(reader, None)
-                first_row = next(reader, None)
-
-            if first_row and len(first_row) > 0:
-                existing_created = str(first_row[0])
-                existing_ts = None
-                # 解析已有记录的 createdAt（支持数字时间戳或 ISO 格式）
-                if existing_created.isdigit():
-                    existing_ts = int(existing_created)
-                    if existing_ts > 10**12:
-                        existing_ts = existing_ts // 1000
-                else:
-                    try:
-                        existing_dt = datetime.fromisoformat(existing_created.replace('Z', '+00:00'))
-                        existing_ts = int(existing_dt.replace(tzinfo=timezone.utc).timestamp())
-                    except Exception:
-                        existing_ts = None
-
-                if existing_ts is None:
-                    print(f"无法解析现有 CSV 的创建时间 ({existing_created})，将重建 CSV 文件")
-                    current_offset = 0
-                    mode = 'w'
-                else:
-                    # 如果已有最早记录早于当前起始时间，则现有 offset 与过滤后的 API 结果不匹配
-                    if existing_ts < start_timestamp:
-                        print(f"现有 CSV 包含早于起始时间的记录 ({existing_created})，将重建 CSV 以匹配新的时间范围")
-                        current_offset = 0
-                        mode = 'w'
-                    else:
-                        print(f"找到 {current_offset} 个现有记录。从偏移 {current_offset} 恢复")
-                        mode = 'a'
-            else:
-                print(f"无法读取现有 CSV 的第一条记录，重新创建文件：{csv_filename}")
-                current_offset = 0
-                mode = 'w'
-        except Exception as e:
-            print(f"读取现有 CSV 失败：{e}，将重建 CSV 文件")
-            current_offset = 0
-            mode = 'w'
+    # 截止时间来自 manifest 中已存储的最新 createdAt，无需扫描文件
+    manifest = storage.manifest('markets')
+    covered_from = load_covered_from(storage)
+    cutoff = start_timestamp
+    if manifest['rows'] > 0:
+        newest_ts = parse_created_timestamp(manifest['max_time'], None)
+        if newest_ts is None:
+            print(f"无法解析现有记录的创建时间 ({manifest['max_time']})，重新抓取整个时间范围")
+        elif covered_from is None or covered_from > start_timestamp:
+            # 之前的同步没有完整覆盖当前时间范围（首次使用增量同步或扩大了 days_limit），补齐整个时间范围
+            print(f"找到 {manifest['rows']} 个现有记录，但尚未覆盖当前时间范围，重新抓取整个时间范围")
+        else:
+            # 截止时间包含等于最新 createdAt 的市场，同一秒创建的市场由 upsert 去重
+            cutoff = max(start_timestamp, newest_ts - refresh_days * 86400)
+            print(f"找到 {manifest['rows']} 个现有记录，最新创建于 {manifest['max_time']}。"
+                  f"只抓取 {datetime.fromtimestamp(cutoff, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')} 之后创建的市场")
 
     total_fetched = 0
-    
-    with open(csv_filename, mode, newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
+    current_offset = 0
+    # 新抓取的市场全部缓存在内存中（增量运行通常很少），结束时一次性 upsert
+    pending_rows = []
 
-        # 仅在新文件时写入标题
-        if mode == 'w':
-            writer.writerow(headers)
+    # 同时保持 workers 个偏移窗口在途，结果按偏移顺序处理，输出顺序与串行抓取一致
+    session = make_session(workers)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    in_flight = {}
+    next_window = current_offset
+    window_step = batch_size
 
-        count = 0
+    def submit_window():
+        nonlocal next_window
+        in_flight[next_window] = executor.submit(fetch_page, session, base_url, next_window, batch_size)
+        next_window += window_step
 
+    for _ in range(workers):
+        submit_window()
+
+    count = 0
+
+    try:
         while True:
             print(f"第{count + 1}批次：在偏移 {current_offset} 处获取批次...")
-
             count += 1
 
-            try:
-                params = {
-                    'order': 'createdAt',
-                    'ascending': 'false',  # 改为降序，获取最新市场
-                    'limit': batch_size,
-                    'offset': current_offset
-                    # 移除不被支持的 createdAt_min 参数，改用本地过滤
-                }
-
-                response = requests.get(base_url, params=params, timeout=30)
-
-                # 处理不同的 HTTP 状态码
-                if response.status_code == 500:
-                    print(f"服务器错误 (500) - 5 秒后重试...")
-                    import time
-                    time.sleep(5)
-                    continue
-                elif response.status_code == 429:
-                    print(f"达到速率限制 (429) - 等待 10 秒...")
-                    import time
-                    time.sleep(10)
-                    continue
-                elif response.status_code != 200:
-                    print(f"API 错误 {response.status_code}：{response.text}")
-                    print("3 秒后重试...")
-                    import time
-                    time.sleep(3)
-                    continue
+            markets = in_flight.pop(current_offset).result()
 
-                markets = response.json()
-
-                if not markets:
-                    print(f"在偏移 {current_offset} 处未找到更多市场。完成！")
-                    break
-                
-                batch_count = 0
-                
-                for market in markets:
-                    try:
-                        # 检查市场创建时间是否在半年内
-                        created_at = market.get('createdAt', '')
-                        if created_at:
-                            try:
-                                # 尝试解析时间戳（可能是毫秒）
-                                if isinstance(created_at, str) and created_at.isdigit():
-                                    created_timestamp = int(created_at)
-                                    # 如果大于10^12，认为是毫秒时间戳
-                                    if created_timestamp > 10**12:
-                                        created_timestamp = created_timestamp // 1000
-                                elif isinstance(created_at, (int, float)):
-                                    created_timestamp = int(created_at)
-                                else:
-                                    # 尝试解析ISO格式时间字符串
-                                    import re
-                                    # 匹配 YYYY-MM-DDTHH:MM:SS 格式
-                                    match = re.search(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})', str(created_at))
-                                    if match:
-                                        # 处理 Z 后缀
-                                        time_str = match.group(1).replace('T', ' ')
-                                        if 'Z' in created_at:
-                                            time_str += ' UTC'
-                                        else:
-                                            time_str += ' +00:00'
-                                        dt = datetime.fromisoformat(time_str.replace(' UTC', '+00:00'))
-                                        created_timestamp = int(dt.replace(tzinfo=timezone.utc).timestamp())
-                                    else:
-                                        # 无法解析，跳过这个检查
-                                        created_timestamp = start_timestamp + 1
-
-                                # 如果早于起始时间，跳过
-                                if created_timestamp < start_timestamp:
-                                    # print(f"跳过旧市场 {market.get('id', 'unknown')}: {created_at}")
-                                    continue
-                            except Exception as e:
-                                print(f"解析时间错误 {market.get('id', 'unknown')}: {e}")
-                                # 如果解析失败，假设在时间范围内
-                                pass
-
-                        # Parse outcomes for answer1 and answer2
-                        outcomes_str = market.get('outcomes', '[]')
-                        if isinstance(outcomes_str, str):
-                            outcomes = json.loads(outcomes_str)
-                        else:
-                            outcomes = outcomes_str
-                        
-                        answer1 = outcomes[0] if len(outcomes) > 0 else ''
-                        answer2 = outcomes[1] if len(outcomes) > 1 else ''
-                        
-                        # Parse clobTokenIds for token1 and token2
-                        clob_tokens_str = market.get('clobTokenIds', '[]')
-                        if isinstance(clob_tokens_str, str):
-                            clob_tokens = json.loads(clob_tokens_str)
-                        else:
-                            clob_tokens = clob_tokens_str
-                        
-                        token1 = clob_tokens[0] if len(clob_tokens) > 0 else ''
-                        token2 = clob_tokens[1] if len(clob_tokens) > 1 else ''
-                        
-                        # Check for negative risk indicators
-                        neg_risk = market.get('negRiskAugmented', False) or market.get('negRiskOther', False)
-                        
-                        # Create row with required columns
-                        question_text = market.get('question', '') or market.get('title', '')
-                        
-                        # Get ticker from events if available
-                        ticker = ''
-                        if market.get('events') and len(market.get('events', [])) > 0:
-                            ticker = market['events'][0].get('ticker', '')
-                        
-                        row = [
-                            market.get('createdAt', ''),
-                            market.get('id', ''),
-                            question_text,
-                            answer1,
-                            answer2,
-                            neg_risk,
-                            market.get('slug', ''),
-                            token1,
-                            token2,
-                            market.get('conditionId', ''),
-                            market.get('volume', ''),
-                            ticker,
-                            market.get('closedTime', '')
-                        ]
-                        
-                        writer.writerow(row)
-                        batch_count += 1
-                        
-                    except (ValueError, KeyError, json.JSONDecodeError) as e:
-                        print(f"Error processing market {market.get('id', 'unknown')}: {e}")
+            if not markets:
+                print(f"在偏移 {current_offset} 处未找到更多市场。完成！")
+                break
+
+            batch_count = 0
+
+            for market in markets:
+                try:
+                    if not created_in_range(market, cutoff):
                         continue
-                
-                total_fetched += batch_count
-                current_offset += batch_count  # Increment by actual records processed
-
-                print(f"Processed {batch_count} markets. Total new: {total_fetched}. Next offset: {current_offset}")
-
-                # Check if we should stop
-                # If we got fewer markets than expected from API, might be near the end
-                # But we need to check if any valid markets were processed
-                if len(markets) < batch_size:
-                    # API returned less than batch_size - might be at the end
-                    if batch_count == 0:
-                        # No valid markets processed in this batch - truly at the end
-                        print(f"API returned {len(markets)} markets, none valid (all before time range). Reached end.")
-                        break
-                    else:
-                        # Some valid markets processed - continue to next batch
-                        # This batch might have mixed old/new markets
-                        print(f"API returned {len(markets)} markets, processed {batch_count}. Continuing...")
+                    batch_count += 1
+                    row = market_to_row(market)
+                    if row is None:
+                        print(f"市场 {market.get('id', 'unknown')} 的令牌数据无效")
                         continue
-                elif batch_count == 0:
-                    # Got full batch_size but none were valid (all before time range)
-                    # This means we've gone past the time range
-                    print(f"Received {len(markets)} markets but none within time range. Stopping.")
-                    break
-                
-            except requests.exceptions.RequestException as e:
-                print(f"Network error: {e}")
-                print(f"Retrying in 5 seconds...")
-                import time
-                time.sleep(5)
-                continue
-            except Exception as e:
-                print(f"Unexpected error: {e}")
-                print(f"Retrying in 3 seconds...")
-                import time
-                time.sleep(3)
-                continue
-    
-    print(f"\nCompleted! Fetched {total_fetched} new markets.")
-    print(f"Data saved to: {csv_filename}")
-    print(f"Total records: {current_offset}")
+                    pending_rows.append(row)
+
+                except (ValueError, KeyError, json.JSONDecodeError) as e:
+                    print(f"Error processing market {market.get('id', 'unknown')}: {e}")
+                    continue
+
+            total_fetched += batch_count
+            current_offset += len(markets)
+
+            print(f"Processed {batch_count} markets. Total fetched: {total_fetched}. Next offset: {current_offset}")
+
+            # 按 createdAt 降序返回：整页都早于截止时间说明之后的页也都更早，提前停止
+            if batch_count == 0:
+                print(f"Received {len(markets)} markets but none newer than cutoff. Stopping.")
+                break
+            # 返回不足一页：可能已到末尾，也可能是 API 限制了单页数量。
+            # 按实际页大小重新对齐偏移窗口（丢弃在途请求），到末尾时下一页为空即可停止
+            if len(markets) < window_step:
+                print(f"API returned {len(markets)} markets, processed {batch_count}. Continuing...")
+                for future in in_flight.values():
+                    future.cancel()
+                in_flight.clear()
+                window_step = len(markets)
+                next_window = current_offset
+                for _ in range(workers):
+                    submit_window()
+            else:
+                submit_window()
+    finally:
+        for future in in_flight.values():
+            future.cancel()
+        executor.shutdown(wait=False)
+        session.close()
+
+    inserted = updated = 0
+    if pending_rows:
+        inserted, updated = storage.upsert('markets', rows_to_frame('markets', pending_rows))
+    if storage.exists('markets'):
+        save_covered_from(storage, min(cutoff, covered_from or cutoff))
+
+    print(f"\nCompleted! Fetched {total_fetched} markets: {inserted} new, {updated} updated.")
+    print(f"Data saved to: {output_path}")
+    print(f"Total records: {storage.count_rows('markets')}")
 
 # if __name__ == "__main__":
 #     update_markets(batch_size=500)
\ No newline at end of file